@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for `target_redshift.s3._EncodeBinaryReadable`.
+
+Streams a synthetic CSV of `--size` bytes through the encoder the same way `boto3`'s multipart upload does (ie,
+`read(part_size)` until exhausted), and reports wall clock time, throughput and peak memory allocated while
+reading. The pre-streaming implementation is kept here as `_LegacyEncodeBinaryReadable` for comparison.
+
+    python benchmarks/bench_encode_binary_readable.py --size 1073741824
+    python benchmarks/bench_encode_binary_readable.py --size 104857600 --legacy
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from target_redshift.s3 import _EncodeBinaryReadable
+
+DEFAULT_SIZE = 1024 * 1024 * 1024  # 1GB
+DEFAULT_PART_SIZE = 8 * 1024 * 1024  # boto3's default `multipart_chunksize`
+ROW = '123456,"some quoted, text",2019-01-01 00:00:00.000000+00:00,3.14159,true,NULL\n'
+
+
+class _SyntheticCSV:
+    """
+    Mimics `target_postgres.postgres.TransformStream`: each `read()` returns a single CSV row.
+    """
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, *args, **kwargs):
+        if self.remaining <= 0:
+            return ''
+        self.remaining -= len(ROW)
+        return ROW
+
+
+class _LegacyEncodeBinaryReadable:
+    def __init__(self, readable_obj):
+        self.input = readable_obj
+
+    def readable(self):
+        return True
+
+    def read(self, *args, **kwargs):
+        if len(args) > 0:
+            max_bytes = args[0]
+        else:
+            max_bytes = None
+        output = b''
+        while (max_bytes is not None and len(output) < max_bytes) or True:
+            line = self.input.read()
+            if line == '':
+                return output
+            output += line.encode('utf-8')
+        return output
+
+
+def run(encoder_class, size, part_size):
+    readable = encoder_class(_SyntheticCSV(size))
+
+    tracemalloc.start()
+    start = time.monotonic()
+    total = 0
+    while True:
+        part = readable.read(part_size)
+        if not part:
+            break
+        total += len(part)
+    duration = time.monotonic() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'encoder': encoder_class.__name__,
+            'bytes': total,
+            'seconds': round(duration, 3),
+            'mb_per_second': round(total / 1024 / 1024 / duration, 2) if duration else None,
+            'peak_traced_mb': round(peak / 1024 / 1024, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=DEFAULT_SIZE, help='Bytes of synthetic CSV to encode')
+    parser.add_argument('--part-size', type=int, default=DEFAULT_PART_SIZE, help='Bytes requested per `read`')
+    parser.add_argument('--legacy', action='store_true',
+                        help='Also run the previous implementation. It is quadratic, keep `--size` small.')
+    args = parser.parse_args()
+
+    encoders = [_EncodeBinaryReadable]
+    if args.legacy:
+        encoders.append(_LegacyEncodeBinaryReadable)
+
+    for encoder_class in encoders:
+        print(json.dumps(run(encoder_class, args.size, args.part_size)))
+
+
+if __name__ == '__main__':
+    main()
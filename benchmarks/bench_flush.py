@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+"""
+End to end benchmark of the flush path: denesting, CSV serialization, staging to S3, COPY and merge.
+
+Generates a Singer stream of `--rows` records spread across `--streams` streams, each record having `--width`
+top level properties, `--nesting` levels of nested objects and `--array-length` items in a child array (ie, a
+subtable). The stream is written to a temporary file first, so generating it is not measured, and is then fed to
+`target_redshift.main(config, input_stream=...)`.
+
+No Redshift cluster or AWS account is required:
+- S3 is stood in for in-process by `moto`.
+- Redshift is stood in for by Postgres (15 or newer, for `MERGE`). Postgres cannot `COPY` from S3, so the
+  target's `_copy_from_s3` is shimmed to download the staged files from the stand-in and `COPY ... FROM STDIN`
+  them instead (converting Parquet to CSV first). Tables are created without Redshift's distribution styles, sort
+  keys and column encodings.
+
+    docker-compose up -d postgres
+    python benchmarks/bench_flush.py --rows 100000 --width 50 --nesting 2 --output results.jsonl
+    python benchmarks/bench_flush.py --rows 100000 --config '{"staging_compression": "gzip"}'
+
+Reports, as a single JSON object (appended as a line to `--output` when given):
+- `rows_per_second` and `bytes_per_second` of the input stream, over the wall clock time of `main`.
+- `peak_rss_mb` of the process, which includes the S3 stand-in.
+- `stages`: seconds spent in each stage, excluding time spent in nested stages. Stages are summed across
+  threads, so with `max_pending_batches` or `max_parallel_streams` they may add up to more than `seconds`.
+  - `prepare`: `write_batch`, less the stages below (denesting, diffing schemas, committing).
+  - `schema`: creating and altering tables.
+  - `stage`: serializing CSV or Parquet and uploading it to S3. CSV is streamed into the upload, so they are not
+    split.
+  - `download`: the shim fetching (and converting) staged files from the stand-in. Has no counterpart on Redshift.
+  - `copy`: `COPY ... FROM STDIN`.
+  - `insert`: loading small batches with `INSERT ... VALUES` (see `insert_batch_max_rows`).
+  - `merge`: merging temp tables into their tables.
+"""
+
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+import gzip
+import io
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from unittest import mock
+
+import boto3
+import psycopg2
+from psycopg2 import sql
+from target_postgres.postgres import RESERVED_NULL_DEFAULT
+
+## moto 5 replaced its per service mocks (eg, `mock_s3`) with `mock_aws`, but needs a newer `botocore` than the
+##  `boto3<1.10` this target installs, with which only earlier releases resolve
+try:
+    from moto import mock_aws
+except ImportError:
+    from moto import mock_s3 as mock_aws
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+import target_redshift
+from target_redshift.redshift import RedshiftTarget, STAGING_FORMAT_PARQUET
+from target_redshift.s3 import COMPRESSION_GZIP, COMPRESSION_ZSTD
+
+BUCKET = 'target-redshift-benchmark'
+NESTED_PROPERTY_COUNT = 4
+PROPERTY_TYPES = ['string', 'integer', 'number', 'boolean', 'date-time']
+
+
+class _Timings:
+    """
+    Accumulates the time spent in named stages. Time spent in a stage nested inside another is only counted
+    towards the inner stage.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self._nested = 0.0
+
+    @contextmanager
+    def timed(self, name):
+        start = time.monotonic()
+        nested_before = self._nested
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.seconds[name] += elapsed - (self._nested - nested_before)
+            self._nested = nested_before + elapsed
+
+
+class _PostgresShimTarget(RedshiftTarget):
+    """
+    `RedshiftTarget` which loads staged files into Postgres, and times each stage of the flush path.
+    """
+
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.timings = _Timings()
+        _PostgresShimTarget.instances.append(self)
+        RedshiftTarget.__init__(self, *args, **kwargs)
+
+    def write_batch(self, stream_buffer):
+        with self.timings.timed('prepare'):
+            return RedshiftTarget.write_batch(self, stream_buffer)
+
+    def upsert_table_helper(self, *args, **kwargs):
+        with self.timings.timed('schema'):
+            return RedshiftTarget.upsert_table_helper(self, *args, **kwargs)
+
+    def _merge_temp_table(self, *args, **kwargs):
+        with self.timings.timed('merge'):
+            return RedshiftTarget._merge_temp_table(self, *args, **kwargs)
+
+    def _copy_csv_rows(self, *args, **kwargs):
+        with self.timings.timed('stage'):
+            return RedshiftTarget._copy_csv_rows(self, *args, **kwargs)
+
+    def _copy_parquet_rows(self, *args, **kwargs):
+        with self.timings.timed('stage'):
+            return RedshiftTarget._copy_parquet_rows(self, *args, **kwargs)
+
+    def _insert_rows(self, *args, **kwargs):
+        with self.timings.timed('insert'):
+            return RedshiftTarget._insert_rows(self, *args, **kwargs)
+
+    def _get_table_attributes_sql(self, attributes):
+        ## Postgres has no distribution styles, sort keys or column encodings
+        return sql.SQL('')
+
+    def _get_column_encoding(self, sql_type):
+        return None
+
+    def _get_object(self, bucket, key):
+        return self.s3.client.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    def _copy_from_s3(self, cur, table_name, columns, bucket, key, copy_options):
+        self._copied_keys.extend(self.s3.staged_keys(key))
+
+        with self.timings.timed('download'):
+            if key.endswith('.manifest'):
+                manifest = json.loads(self._get_object(bucket, key).decode('utf-8'))
+                url_prefix = 's3://{}/'.format(bucket)
+                bodies = [self._decompress(self._get_object(bucket, entry['url'][len(url_prefix):]))
+                          for entry in manifest['entries']]
+            else:
+                bodies = [self._get_object(bucket, key)]
+
+            null = RESERVED_NULL_DEFAULT
+            if self.staging_format == STAGING_FORMAT_PARQUET:
+                bodies = [_parquet_to_csv(body) for body in bodies]
+                null = ''
+
+        copy_sql = sql.SQL('COPY {}.{} ({}) FROM STDIN WITH (FORMAT CSV, NULL {})').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(map(sql.Identifier, columns)),
+            sql.Literal(null))
+
+        with self.timings.timed('copy'):
+            for body in bodies:
+                cur.copy_expert(copy_sql, io.BytesIO(body))
+
+    def _decompress(self, body):
+        if self.staging_compression == COMPRESSION_GZIP:
+            return gzip.decompress(body)
+        if self.staging_compression == COMPRESSION_ZSTD:
+            return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return body
+
+
+def _parquet_to_csv(body):
+    ## Quoted empty strings remain distinct from (unquoted) NULLs
+    output = io.BytesIO()
+    pyarrow.csv.write_csv(pyarrow.parquet.read_table(io.BytesIO(body)),
+                          output,
+                          pyarrow.csv.WriteOptions(include_header=False))
+    return output.getvalue()
+
+
+def _property_schema(index):
+    property_type = PROPERTY_TYPES[index % len(PROPERTY_TYPES)]
+    if property_type == 'date-time':
+        return {'type': ['null', 'string'], 'format': 'date-time'}
+    return {'type': ['null', property_type]}
+
+
+def _property_value(rand, index, string_length):
+    property_type = PROPERTY_TYPES[index % len(PROPERTY_TYPES)]
+    if property_type == 'string':
+        return ''.join(rand.choice('abcdefghijklmnopqrstuvwxyz ,"') for _ in range(string_length))
+    if property_type == 'integer':
+        return rand.randint(-2 ** 31, 2 ** 31)
+    if property_type == 'number':
+        return rand.random() * 1000
+    if property_type == 'boolean':
+        return rand.random() < 0.5
+    return '2019-{:02d}-{:02d}T{:02d}:00:00.000000+00:00'.format(rand.randint(1, 12),
+                                                                 rand.randint(1, 28),
+                                                                 rand.randint(0, 23))
+
+
+def _object_schema(property_count):
+    return {'type': ['null', 'object'],
+            'properties': {'p{}'.format(i): _property_schema(i) for i in range(property_count)}}
+
+
+def _object_value(rand, property_count, string_length):
+    return {'p{}'.format(i): _property_value(rand, i, string_length) for i in range(property_count)}
+
+
+def _stream_schema(args):
+    schema = _object_schema(args.width)
+    schema['properties']['id'] = {'type': 'integer'}
+
+    properties = schema['properties']
+    for _ in range(args.nesting):
+        properties['nested'] = _object_schema(NESTED_PROPERTY_COUNT)
+        properties = properties['nested']['properties']
+
+    if args.array_length:
+        schema['properties']['children'] = {'type': ['null', 'array'],
+                                         'items': _object_schema(NESTED_PROPERTY_COUNT)}
+
+    return schema
+
+
+def _record(rand, args, index):
+    record = _object_value(rand, args.width, args.string_length)
+
+    ## Some records update rows from earlier in the stream, so merges have work to do
+    record['id'] = rand.randint(0, index) if rand.random() < args.duplicate_ratio else index
+
+    value = record
+    for _ in range(args.nesting):
+        value['nested'] = _object_value(rand, NESTED_PROPERTY_COUNT, args.string_length)
+        value = value['nested']
+
+    if args.array_length:
+        record['children'] = [_object_value(rand, NESTED_PROPERTY_COUNT, args.string_length)
+                           for _ in range(args.array_length)]
+
+    return record
+
+
+def write_stream(path, args):
+    """
+    Write the synthetic Singer stream described by `args` to `path`.
+    :return: number of RECORD messages written
+    """
+    rand = random.Random(args.seed)
+    streams = ['stream_{}'.format(i) for i in range(args.streams)]
+    schema = _stream_schema(args)
+
+    with open(path, 'w') as output:
+        for stream in streams:
+            output.write(json.dumps({'type': 'SCHEMA',
+                                     'stream': stream,
+                                     'schema': schema,
+                                     'key_properties': ['id'] if args.key_properties else []}) + '\n')
+
+        for index in range(args.rows):
+            ## An explicit `sequence`, as `_sdc_sequence` otherwise has a resolution of a second, so updates to the
+            ##  same row within a batch would tie
+            output.write(json.dumps({'type': 'RECORD',
+                                     'stream': streams[index % len(streams)],
+                                     'sequence': index,
+                                     'record': _record(rand, args, index // len(streams))}) + '\n')
+
+            if index % args.state_interval == 0:
+                output.write(json.dumps({'type': 'STATE', 'value': {'index': index}}) + '\n')
+
+    return args.rows
+
+
+def _reset_schema(config):
+    with psycopg2.connect(host=config['redshift_host'],
+                          port=config['redshift_port'],
+                          dbname=config['redshift_database'],
+                          user=config['redshift_username'],
+                          password=config['redshift_password']) as connection:
+        with connection.cursor() as cur:
+            cur.execute(sql.SQL('DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema};').format(
+                schema=sql.Identifier(config['redshift_schema'])))
+
+
+def run(args):
+    config = {'redshift_host': args.host,
+              'redshift_port': args.port,
+              'redshift_database': args.database,
+              'redshift_username': args.user,
+              'redshift_password': args.password,
+              'redshift_schema': args.schema,
+              'disable_collection': True,
+              'target_s3': {'aws_access_key_id': 'benchmark',
+                            'aws_secret_access_key': 'benchmark',
+                            'bucket': BUCKET,
+                            'key_prefix': 'benchmark/'}}
+    overrides = json.loads(args.config) if args.config else {}
+    config.update({k: v for k, v in overrides.items() if k != 'target_s3'})
+    config['target_s3'].update(overrides.get('target_s3', {}))
+
+    _reset_schema(config)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stream.jsonl')
+        rows = write_stream(path, args)
+        size = os.path.getsize(path)
+
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        with mock_aws(), mock.patch.object(target_redshift, 'RedshiftTarget', _PostgresShimTarget):
+            boto3.client('s3').create_bucket(Bucket=BUCKET)
+
+            with open(path) as input_stream:
+                start = time.monotonic()
+                target_redshift.main(config, input_stream=input_stream)
+                duration = time.monotonic() - start
+
+            staged_objects_remaining = boto3.client('s3').list_objects_v2(Bucket=BUCKET).get('KeyCount', 0)
+
+    stages = defaultdict(float)
+    for target in _PostgresShimTarget.instances:
+        for stage, seconds in target.timings.seconds.items():
+            stages[stage] += seconds
+
+    return {'benchmark': 'flush',
+            'parameters': {k: v for k, v in vars(args).items() if k not in ('password', 'output')},
+            'rows': rows,
+            'bytes': size,
+            'seconds': round(duration, 3),
+            'rows_per_second': round(rows / duration, 1),
+            'bytes_per_second': round(size / duration, 1),
+            ## `ru_maxrss` is in kilobytes on Linux
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'staged_objects_remaining': staged_objects_remaining,
+            'stages': {stage: round(seconds, 3) for stage, seconds in sorted(stages.items())}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='RECORD messages to generate')
+    parser.add_argument('--streams', type=int, default=1, help='Streams to spread records across')
+    parser.add_argument('--width', type=int, default=20, help='Top level properties per record')
+    parser.add_argument('--nesting', type=int, default=1, help='Levels of nested objects per record')
+    parser.add_argument('--array-length', type=int, default=0, help='Items in each record\'s child array')
+    parser.add_argument('--string-length', type=int, default=20, help='Length of generated strings')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1,
+                        help='Fraction of records which update an earlier record')
+    parser.add_argument('--no-key-properties', dest='key_properties', action='store_false',
+                        help='Generate streams without key properties (ie, append only)')
+    parser.add_argument('--state-interval', type=int, default=10000, help='RECORD messages between STATE messages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--config', help='JSON object of target config to override, eg \'{"max_batch_rows": 50000}\'')
+    parser.add_argument('--host', default=os.environ.get('POSTGRES_HOST', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('POSTGRES_PORT', 5432)))
+    parser.add_argument('--database', default=os.environ.get('POSTGRES_DATABASE', 'postgres'))
+    parser.add_argument('--user', default=os.environ.get('POSTGRES_USERNAME', 'postgres'))
+    parser.add_argument('--password', default=os.environ.get('POSTGRES_PASSWORD', 'postgres'))
+    parser.add_argument('--schema', default='target_redshift_benchmark',
+                        help='Schema to load into. It is dropped and recreated before each run.')
+    parser.add_argument('--output', help='File to append the JSON result to')
+    args = parser.parse_args()
+
+    result = run(args)
+
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, 'a') as output:
+            output.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Benchmark of the read path, comparing decoding and validating lines in-process with doing so on a `LinePreparer`
+pool of `prepare_processes` worker processes.
+
+Generates the same synthetic Singer stream as `bench_flush.py` (see its options), writes it to a temporary file,
+and then feeds it through `target_redshift.target_tools.stream_to_target` once per `--processes` value (`0` being
+in-process), as `main` would read it from stdin. Batches are handed to a target which discards them, so that only
+reading, decoding, validating and buffering are measured.
+
+    python benchmarks/bench_prepare.py --rows 200000 --width 50 --processes 0 2 4
+    python benchmarks/bench_prepare.py --rows 200000 --config '{"json_decoder": "json"}'
+
+Reports one JSON object per `--processes` value (appended as lines to `--output` when given), with the
+`lines_per_second` of the run, and its `speedup` over the in-process run. The pool only pays for the cost of
+sending lines to, and decoded lines back from, its workers when there are spare cores for them to run on, so
+`cpu_count` is reported too.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from bench_flush import write_stream
+from target_redshift.target_tools import read_lines, stream_to_target
+
+
+class _DiscardingTarget:
+    def __init__(self):
+        self.rows = 0
+
+    def write_batch(self, stream_buffer):
+        self.rows += stream_buffer.count
+
+    def activate_version(self, stream_buffer, version):
+        pass
+
+
+def run(path, processes, overrides):
+    config = {'disable_collection': True,
+              'state_support': False}
+    config.update(overrides)
+    if processes:
+        config['prepare_processes'] = processes
+
+    target = _DiscardingTarget()
+    with open(path, 'rb') as input_stream:
+        start = time.monotonic()
+        stream_to_target(read_lines(input_stream), target, config=config)
+        duration = time.monotonic() - start
+
+    return target.rows, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='RECORD messages to generate')
+    parser.add_argument('--streams', type=int, default=1, help='Streams to spread records across')
+    parser.add_argument('--width', type=int, default=20, help='Top level properties per record')
+    parser.add_argument('--nesting', type=int, default=1, help='Levels of nested objects per record')
+    parser.add_argument('--array-length', type=int, default=0, help='Items in each record\'s child array')
+    parser.add_argument('--string-length', type=int, default=20, help='Length of generated strings')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1,
+                        help='Fraction of records which update an earlier record')
+    parser.add_argument('--no-key-properties', dest='key_properties', action='store_false',
+                        help='Generate streams without key properties (ie, append only)')
+    parser.add_argument('--state-interval', type=int, default=10000, help='RECORD messages between STATE messages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 2],
+                        help='`prepare_processes` to run with, `0` decoding and validating in-process')
+    parser.add_argument('--config', help='JSON object of target config to override, eg \'{"json_decoder": "json"}\'')
+    parser.add_argument('--output', help='File to append the JSON results to')
+    args = parser.parse_args()
+
+    overrides = json.loads(args.config) if args.config else {}
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stream.jsonl')
+        write_stream(path, args)
+        size = os.path.getsize(path)
+        with open(path, 'rb') as input_stream:
+            lines = sum(1 for _ in input_stream)
+
+        baseline = None
+        for processes in args.processes:
+            rows, duration = run(path, processes, overrides)
+            if processes == 0:
+                baseline = duration
+
+            results.append({'benchmark': 'prepare',
+                            'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+                            'prepare_processes': processes,
+                            'cpu_count': multiprocessing.cpu_count(),
+                            'rows': rows,
+                            'bytes': size,
+                            'seconds': round(duration, 3),
+                            'lines_per_second': round(lines / duration, 1),
+                            'speedup': round(baseline / duration, 2) if baseline else None})
+
+    for result in results:
+        print(json.dumps(result))
+        if args.output:
+            with open(args.output, 'a') as output:
+                output.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
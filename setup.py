@@ -27,6 +27,21 @@ setup(
         "pytest-runner"
     ],
     extras_require={
+        "benchmarks": [
+            "moto>=1.3.14"
+        ],
+        "orjson": [
+            "orjson>=3.0.0"
+        ],
+        "parquet": [
+            "pyarrow>=0.17.0"
+        ],
+        "simdjson": [
+            "pysimdjson>=3.0.0"
+        ],
+        "zstd": [
+            "zstandard>=0.13.0"
+        ],
         "tests": [
             "chance==0.110",
             "Faker==4.0.3",
@@ -35,6 +50,7 @@ setup(
     entry_points='''
       [console_scripts]
       target-redshift=target_redshift:cli
+      target-redshift-drop-placeholder-columns=target_redshift:drop_placeholder_columns_cli
     ''',
     packages=find_packages()
 )
@@ -1,11 +1,22 @@
+from contextlib import closing, ExitStack
+
 import psycopg2
 import singer
 from singer import utils
-from target_postgres import target_tools
 from target_postgres.postgres import MillisLoggingConnection
 
+from target_redshift import target_tools
+from target_redshift.credentials import DEFAULT_ROLE_DURATION_SECONDS
+from target_redshift.metrics import (
+    DEFAULT_PREFIX,
+    Metrics,
+    PrometheusTextfileMetricsSink,
+    SingerMetricsSink,
+    StatsdMetricsSink
+)
 from target_redshift.redshift import RedshiftTarget
-from target_redshift.s3 import S3
+from target_redshift.s3 import S3, StagedObjectCleaner
+from target_redshift.schema_cache import SchemaCache
 
 LOGGER = singer.get_logger()
 
@@ -18,38 +29,125 @@ REQUIRED_CONFIG_KEYS = [
 ]
 
 
+def _connect(config):
+    return psycopg2.connect(
+        connection_factory=MillisLoggingConnection,
+        host=config.get('redshift_host'),
+        port=config.get('redshift_port', 5439),
+        dbname=config.get('redshift_database'),
+        user=config.get('redshift_username'),
+        password=config.get('redshift_password')
+    )
+
+
+def _metrics(config):
+    sinks = [SingerMetricsSink()]
+    prefix = config.get('metrics_prefix', DEFAULT_PREFIX)
+
+    if config.get('metrics_statsd_host'):
+        sinks.append(StatsdMetricsSink(config['metrics_statsd_host'],
+                                       port=config.get('metrics_statsd_port', 8125),
+                                       prefix=prefix))
+
+    if config.get('metrics_prometheus_textfile'):
+        sinks.append(PrometheusTextfileMetricsSink(config['metrics_prometheus_textfile'], prefix=prefix))
+
+    return Metrics(sinks)
+
+
+def _redshift_target(config, connection, s3, schema_cache, metrics, cleaner):
+    return RedshiftTarget(
+        connection,
+        s3,
+        schema_cache=schema_cache,
+        metrics=metrics,
+        cleaner=cleaner,
+        redshift_schema=config.get('redshift_schema', 'public'),
+        logging_level=config.get('logging_level'),
+        default_column_length=config.get('default_column_length', 1000),
+        persist_empty_tables=config.get('persist_empty_tables'),
+        staging_file_count=config.get('staging_file_count', 1),
+        staging_compression=config.get('staging_compression'),
+        staging_format=config.get('staging_format', 'csv'),
+        insert_batch_max_rows=config.get('insert_batch_max_rows', 0),
+        insert_batch_max_bytes=config.get('insert_batch_max_bytes', 1048576),
+        native_merge=config.get('native_merge', False),
+        varchar_sizing=config.get('varchar_sizing', 'observed'),
+        table_options=config.get('table_options', {}),
+        compression_encodings=config.get('compression_encodings', True),
+        rebuild_table_column_threshold=config.get('rebuild_table_column_threshold')
+    )
+
+
+def _s3(config):
+    s3_config = config.get('target_s3')
+    return S3(s3_config.get('aws_access_key_id'),
+              s3_config.get('aws_secret_access_key'),
+              s3_config.get('bucket'),
+              s3_config.get('key_prefix'),
+              aws_session_token=s3_config.get('aws_session_token'),
+              multipart_threshold=s3_config.get('multipart_threshold'),
+              multipart_chunksize=s3_config.get('multipart_chunksize'),
+              max_concurrency=s3_config.get('max_concurrency'),
+              use_threads=s3_config.get('use_threads'),
+              assume_role_arn=s3_config.get('assume_role_arn'),
+              assume_role_duration_seconds=s3_config.get('assume_role_duration_seconds',
+                                                         DEFAULT_ROLE_DURATION_SECONDS),
+              iam_role=s3_config.get('iam_role'))
+
+
 def main(config, input_stream=None):
-    with psycopg2.connect(
-            connection_factory=MillisLoggingConnection,
-            host=config.get('redshift_host'),
-            port=config.get('redshift_port', 5439),
-            dbname=config.get('redshift_database'),
-            user=config.get('redshift_username'),
-            password=config.get('redshift_password')
-    ) as connection:
+    with _connect(config) as connection, ExitStack() as exit_stack:
         s3_config = config.get('target_s3')
-        s3 = S3(s3_config.get('aws_access_key_id'),
-                s3_config.get('aws_secret_access_key'),
-                s3_config.get('bucket'),
-                s3_config.get('key_prefix'),
-                aws_session_token=s3_config.get('aws_session_token'))
-
-        redshift_target = RedshiftTarget(
-            connection,
-            s3,
-            redshift_schema=config.get('redshift_schema', 'public'),
-            logging_level=config.get('logging_level'),
-            default_column_length=config.get('default_column_length', 1000),
-            persist_empty_tables=config.get('persist_empty_tables')
-        )
+        s3 = _s3(config)
+
+        cleaner = None
+        if s3_config.get('cleanup_staged_files', True):
+            cleaner = StagedObjectCleaner(s3)
+            ## Deleting what is already scheduled is quick, and leaves nothing behind on a successful run
+            exit_stack.callback(cleaner.close)
+
+            if s3_config.get('sweep_staged_files_older_than') is not None:
+                cleaner.sweep(s3_config['sweep_staged_files_older_than'])
+
+        schema_cache = SchemaCache()
+        metrics = _metrics(config)
+        redshift_target = _redshift_target(config, connection, s3, schema_cache, metrics, cleaner)
+
+        ## Each additional target gets its own connection so that distinct streams can be loaded concurrently
+        additional_targets = []
+        for _ in range(config.get('max_parallel_streams', 1) - 1):
+            additional_connection = exit_stack.enter_context(closing(_connect(config)))
+            additional_targets.append(_redshift_target(config, additional_connection, s3, schema_cache, metrics,
+                                                       cleaner))
 
         if input_stream:
-            target_tools.stream_to_target(input_stream, redshift_target, config=config)
+            target_tools.stream_to_target(input_stream,
+                                          redshift_target,
+                                          config=config,
+                                          additional_targets=additional_targets)
         else:
-            target_tools.main(redshift_target)
+            target_tools.main(redshift_target, config, additional_targets=additional_targets)
+
+
+def drop_placeholder_columns(config):
+    """
+    Drop the placeholder column from every table in `redshift_schema` created by earlier versions of the target.
+    """
+    with _connect(config) as connection:
+        redshift_target = _redshift_target(config, connection, _s3(config), SchemaCache(), _metrics(config), None)
+        table_names = redshift_target.drop_placeholder_columns()
+
+    LOGGER.info('Dropped placeholder columns from {} tables'.format(len(table_names)))
 
 
 def cli():
     args = utils.parse_args(REQUIRED_CONFIG_KEYS)
 
     main(args.config)
+
+
+def drop_placeholder_columns_cli():
+    args = utils.parse_args(REQUIRED_CONFIG_KEYS)
+
+    drop_placeholder_columns(args.config)
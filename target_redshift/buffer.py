@@ -0,0 +1,149 @@
+from copy import deepcopy
+import gzip
+import pickle
+import tempfile
+
+import singer
+from target_postgres.singer_stream import BufferedSingerStream, get_line_size, SINGER_PK
+
+from target_redshift.validators import CompiledSchema
+
+LOGGER = singer.get_logger()
+
+SPILL_COMPRESSION_LEVEL = 1
+
+
+class BufferBudget:
+    """
+    Memory budget shared by every `SpillingSingerStream` of a run. Once the records held in memory across all
+    streams exceed `max_size` bytes (measured as their JSON lines, like `max_batch_size`), the stream holding the
+    most is spilled to disk, until the total is back under budget.
+
+    Records are added and batches flushed on the thread reading the tap's output, so the budget is not thread
+    safe.
+    """
+
+    def __init__(self, max_size, directory=None):
+        self.max_size = max_size
+        self.directory = directory
+        self.size = 0
+        self._sizes = {}
+
+    def add(self, stream_buffer, size):
+        self._sizes[stream_buffer] = self._sizes.get(stream_buffer, 0) + size
+        self.size += size
+
+        while self.size > self.max_size and self._sizes:
+            largest = max(self._sizes, key=self._sizes.get)
+            largest.spill()
+
+    def release(self, stream_buffer):
+        self.size -= self._sizes.pop(stream_buffer, 0)
+
+
+class CompiledSingerStream(BufferedSingerStream):
+    """
+    `BufferedSingerStream` which also takes its schema as a `CompiledSchema`, sharing the validator and simplified
+    schema built for it, rather than building its own for every stream and every SCHEMA message.
+    """
+
+    def update_schema(self, schema, key_properties):
+        if not isinstance(schema, CompiledSchema):
+            return BufferedSingerStream.update_schema(self, schema, key_properties)
+
+        self.key_properties = deepcopy(key_properties)
+        self.validator = schema.validator
+
+        self.use_uuid_pk = len(self.key_properties) == 0
+        if self.use_uuid_pk:
+            self.key_properties = [SINGER_PK]
+
+        self.schema = schema.get_stream_schema(self.use_uuid_pk)
+
+
+class SpillingSingerStream(CompiledSingerStream):
+    """
+    `BufferedSingerStream` which, when asked to by its `BufferBudget`, moves its buffered records to a compressed
+    temporary file. Batch size limits (`max_rows`, `max_buffer_size`) still count spilled records, so batches are
+    the same as without spilling; only the records waiting to be flushed leave memory.
+    """
+
+    def __init__(self, *args, budget, **kwargs):
+        self.budget = budget
+        self.spilled_count = 0
+        self._spill_file = None
+        self._spill_writer = None
+        self._peeked = None
+        BufferedSingerStream.__init__(self, *args, **kwargs)
+
+    def add_record_message(self, record_message):
+        count = self.count
+        BufferedSingerStream.add_record_message(self, record_message)
+
+        if self.count > count:
+            self._peeked = None
+            self.budget.add(self, get_line_size(record_message))
+
+    def spill(self):
+        """
+        Move the records held in memory to this stream's spill file.
+        :return: None
+        """
+        ## `BufferedSingerStream.peek_buffer` returns the buffer itself, which is emptied in place
+        records = BufferedSingerStream.peek_buffer(self)
+
+        if records:
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile(prefix='target-redshift-', dir=self.budget.directory)
+            if self._spill_writer is None:
+                self._spill_file.seek(0, 2)
+                self._spill_writer = gzip.GzipFile(fileobj=self._spill_file,
+                                                   mode='wb',
+                                                   compresslevel=SPILL_COMPRESSION_LEVEL)
+
+            LOGGER.debug('Spilling {} records for stream `{}` to disk'.format(len(records), self.stream))
+            pickle.dump(records, self._spill_writer, protocol=pickle.HIGHEST_PROTOCOL)
+            self.spilled_count += len(records)
+            del records[:]
+
+        self.budget.release(self)
+
+    def _read_spilled(self):
+        if self._spill_writer is not None:
+            ## Each writer adds a gzip member, which are read back as one stream
+            self._spill_writer.close()
+            self._spill_writer = None
+
+        self._spill_file.seek(0)
+        with gzip.GzipFile(fileobj=self._spill_file, mode='rb') as reader:
+            while True:
+                try:
+                    yield from pickle.load(reader)
+                except EOFError:
+                    return
+
+    def peek_buffer(self):
+        if not self.spilled_count:
+            return BufferedSingerStream.peek_buffer(self)
+
+        if self._peeked is None:
+            self._peeked = list(self._read_spilled()) + BufferedSingerStream.peek_buffer(self)
+
+        return self._peeked
+
+    def flush_buffer(self):
+        _buffer = self.peek_buffer()
+        BufferedSingerStream.flush_buffer(self)
+
+        if self._spill_file is not None:
+            if self._spill_writer is not None:
+                self._spill_writer.close()
+                self._spill_writer = None
+            self._spill_file.close()
+            self._spill_file = None
+
+        self.spilled_count = 0
+        self._peeked = None
+        self.budget.release(self)
+
+        return _buffer
@@ -0,0 +1,71 @@
+import boto3
+import botocore.session
+from botocore.credentials import RefreshableCredentials
+
+DEFAULT_ROLE_SESSION_NAME = 'target-redshift'
+DEFAULT_ROLE_DURATION_SECONDS = 3600
+
+
+def _assume_role_refresher(sts_client, role_arn, session_name, duration_seconds):
+    def refresh():
+        response = sts_client.assume_role(RoleArn=role_arn,
+                                          RoleSessionName=session_name,
+                                          DurationSeconds=duration_seconds)
+        credentials = response['Credentials']
+
+        return {'access_key': credentials['AccessKeyId'],
+                'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'],
+                'expiry_time': credentials['Expiration'].isoformat()}
+
+    return refresh
+
+
+def assume_role_session(session,
+                        role_arn,
+                        session_name=DEFAULT_ROLE_SESSION_NAME,
+                        duration_seconds=DEFAULT_ROLE_DURATION_SECONDS,
+                        sts_client=None):
+    """
+    Build a session whose credentials are those of `role_arn`, assumed using `session`'s credentials.
+
+    The assumed credentials are cached, and botocore refreshes them shortly before they expire, so the returned
+    session can be used for longer than `duration_seconds`.
+
+    :param session: boto3.Session
+    :param role_arn: string
+    :param session_name: string
+    :param duration_seconds: integer
+    :param sts_client: [optional] STS client to assume the role with. Defaults to one from `session`.
+    :return: boto3.Session
+    """
+    refresh = _assume_role_refresher(sts_client or session.client('sts'), role_arn, session_name, duration_seconds)
+
+    credentials = RefreshableCredentials.create_from_metadata(metadata=refresh(),
+                                                              refresh_using=refresh,
+                                                              method='sts-assume-role')
+
+    botocore_session = botocore.session.get_session()
+    ## botocore has no public way to give a session refreshable credentials which it did not resolve itself
+    botocore_session._credentials = credentials
+
+    return boto3.Session(botocore_session=botocore_session, region_name=session.region_name)
+
+
+def frozen_credentials(session):
+    """
+    The current credentials of `session`, refreshing them first if they are close to expiring.
+    :param session: boto3.Session
+    :return: {'aws_access_key_id': string, 'aws_secret_access_key': string, 'aws_session_token': string or None}
+    """
+    credentials = session.get_credentials()
+    if credentials is None:
+        return {'aws_access_key_id': None,
+                'aws_secret_access_key': None,
+                'aws_session_token': None}
+
+    frozen = credentials.get_frozen_credentials()
+
+    return {'aws_access_key_id': frozen.access_key,
+            'aws_secret_access_key': frozen.secret_key,
+            'aws_session_token': frozen.token}
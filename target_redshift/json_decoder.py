@@ -0,0 +1,105 @@
+import decimal
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+DECODER_JSON = 'json'
+DECODER_ORJSON = 'orjson'
+DECODER_SIMDJSON = 'simdjson'
+## In order of preference, when no decoder is configured
+DECODERS = (DECODER_ORJSON, DECODER_SIMDJSON, DECODER_JSON)
+
+
+## orjson decodes integers beyond 64 bits to floats
+MAX_EXACT_FLOAT = 2 ** 63
+
+
+class _Redecode(Exception):
+    pass
+
+
+def loads_json(line):
+    return json.loads(line, parse_float=decimal.Decimal)
+
+
+def _to_decimal(value):
+    ## Not finite (ie, overflowed), or possibly an integer beyond 64 bits
+    if not math.isfinite(value) or abs(value) >= MAX_EXACT_FLOAT:
+        raise _Redecode()
+
+    ## The shortest repr which round trips, ie the number as written for anything `double precision` can hold
+    return decimal.Decimal(repr(value))
+
+
+def _replace_floats(value):
+    """
+    Replace, in place, the floats nested in `value` with `Decimal`s, as `loads_json` returns numbers.
+    :param value: decoded JSON
+    :return: value
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    elif type(value) is float:
+        return _to_decimal(value)
+    else:
+        return value
+
+    for key, item in items:
+        item_type = type(item)
+        if item_type is float:
+            value[key] = _to_decimal(item)
+        elif item_type is dict or item_type is list:
+            _replace_floats(item)
+
+    return value
+
+
+def _fast_decoder(loads):
+    def decode(line):
+        try:
+            return _replace_floats(loads(line))
+        except (ValueError, _Redecode):
+            ## Anything the faster decoder rejects (eg, integers beyond 64 bits, `NaN`, or invalid JSON) is decoded
+            ## again, so that it is accepted, or rejected, exactly as `loads_json` would
+            return loads_json(line)
+
+    return decode
+
+
+def get_decoder(name=None):
+    """
+    :param name: one of `DECODERS`, or None for the first of them which is installed
+    :return: function(line) -> decoded JSON, where `line` is a string or UTF-8 bytes. Numbers which are not integers
+             are `Decimal`s, and invalid JSON raises `json.decoder.JSONDecodeError`, as with `loads_json`.
+    """
+    if name is None:
+        name = next(decoder for decoder, module in ((DECODER_ORJSON, orjson),
+                                                    (DECODER_SIMDJSON, simdjson),
+                                                    (DECODER_JSON, json))
+                    if module is not None)
+
+    if name == DECODER_JSON:
+        return loads_json
+    elif name == DECODER_ORJSON:
+        if orjson is None:
+            raise ImportError('`orjson` is required for the `orjson` decoder. '
+                              'Install with `pip install target-redshift[orjson]`.')
+        return _fast_decoder(orjson.loads)
+    elif name == DECODER_SIMDJSON:
+        if simdjson is None:
+            raise ImportError('`pysimdjson` is required for the `simdjson` decoder. '
+                              'Install with `pip install target-redshift[simdjson]`.')
+        return _fast_decoder(simdjson.loads)
+
+    raise ValueError('Unsupported JSON decoder `{}`. Expected one of: {}'.format(name, DECODERS))
@@ -0,0 +1,179 @@
+from contextlib import contextmanager
+import os
+import socket
+import threading
+import time
+
+import singer
+from singer import metrics
+
+LOGGER = singer.get_logger()
+
+DEFAULT_PREFIX = 'target_redshift'
+
+TIMER = 'timer'
+COUNTER = 'counter'
+GAUGE = 'gauge'
+
+JOB_DURATION = metrics.Metric.job_duration
+RECORD_COUNT = metrics.Metric.record_count
+BYTES_STAGED = 'bytes_staged'
+UPLOAD_THROUGHPUT = 'upload_bytes_per_second'
+CATALOG_QUERY_COUNT = 'catalog_query_count'
+
+
+def _tag_value(value):
+    if isinstance(value, (list, tuple)):
+        return '.'.join(map(str, value))
+    return str(value)
+
+
+def _escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class SingerMetricsSink:
+    """
+    Logs points as Singer `METRIC` lines.
+    """
+
+    def emit(self, point):
+        metrics.log(LOGGER, point)
+
+
+class StatsdMetricsSink:
+    """
+    Sends points to a StatsD server over UDP, with tags in the DogStatsD `|#tag:value` format. Timers are sent in
+    milliseconds.
+    """
+
+    _TYPES = {TIMER: 'ms',
+              COUNTER: 'c',
+              GAUGE: 'g'}
+
+    def __init__(self, host, port=8125, prefix=DEFAULT_PREFIX):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def format(self, point):
+        value = point.value * 1000 if point.metric_type == TIMER else point.value
+        tags = ','.join('{}:{}'.format(k, _tag_value(v)) for k, v in sorted(point.tags.items()))
+
+        return '{}.{}:{}|{}{}'.format(self.prefix,
+                                      point.metric,
+                                      round(value, 3),
+                                      self._TYPES[point.metric_type],
+                                      '|#' + tags if tags else '')
+
+    def emit(self, point):
+        try:
+            self._socket.sendto(self.format(point).encode('utf-8'), self.address)
+        except OSError as ex:
+            LOGGER.debug('Failed to send metric to StatsD: {}'.format(ex))
+
+
+class PrometheusTextfileMetricsSink:
+    """
+    Aggregates points and writes them to `path` in the Prometheus text exposition format, for collection by the
+    node exporter's textfile collector. Counters and timers accumulate over the life of the process (timers as
+    `_seconds_sum` and `_seconds_count`); gauges keep their latest value.
+
+    The file is replaced atomically each time a point is emitted.
+    """
+
+    def __init__(self, path, prefix=DEFAULT_PREFIX):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def _add(self, name, labels, value, accumulate=True):
+        key = (name, labels)
+        self._samples[key] = self._samples.get(key, 0) + value if accumulate else value
+
+    def emit(self, point):
+        labels = tuple(sorted((k, _tag_value(v)) for k, v in point.tags.items()))
+        name = '{}_{}'.format(self.prefix, point.metric)
+
+        with self._lock:
+            if point.metric_type == TIMER:
+                self._add(name + '_seconds_sum', labels, point.value)
+                self._add(name + '_seconds_count', labels, 1)
+            elif point.metric_type == COUNTER:
+                self._add(name + '_total', labels, point.value)
+            else:
+                self._add(name, labels, point.value, accumulate=False)
+
+            self._write()
+
+    def _write(self):
+        lines = []
+        for (name, labels), value in sorted(self._samples.items()):
+            label_pairs = ','.join('{}="{}"'.format(k, _escape_label_value(v)) for k, v in labels)
+            lines.append('{}{} {}\n'.format(name, '{' + label_pairs + '}' if label_pairs else '', value))
+
+        temp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temp_path, 'w') as out:
+            out.writelines(lines)
+        os.replace(temp_path, self.path)
+
+
+class Metrics:
+    """
+    Emits Singer metric points to each of `sinks`. Defaults to only logging them as Singer `METRIC` lines.
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = sinks if sinks is not None else [SingerMetricsSink()]
+
+    def emit(self, metric_type, metric, value, tags):
+        point = metrics.Point(metric_type, metric, value, tags)
+        for sink in self.sinks:
+            sink.emit(point)
+
+    def job_duration(self, job_type, seconds, tags):
+        self.emit(TIMER, JOB_DURATION, seconds, dict(tags, job_type=job_type))
+
+    @contextmanager
+    def job_timer(self, job_type, tags):
+        """
+        Emit the duration of the wrapped block as a `job_duration` timer, tagged with its `status` as
+        `singer.metrics.Timer` does.
+        """
+        start = time.monotonic()
+        status = metrics.Status.succeeded
+        try:
+            yield
+        except Exception:
+            status = metrics.Status.failed
+            raise
+        finally:
+            self.job_duration(job_type, time.monotonic() - start, dict(tags, status=status))
+
+    def count(self, metric, value, tags):
+        self.emit(COUNTER, metric, value, tags)
+
+    def gauge(self, metric, value, tags):
+        self.emit(GAUGE, metric, value, tags)
+
+
+class MeteredReadable:
+    """
+    Wraps a readable whose `read()` returns `str` chunks, such as a `TransformStream` of CSV rows, recording the
+    time spent producing chunks and the number of UTF-8 bytes produced.
+    """
+
+    def __init__(self, readable):
+        self.readable = readable
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def read(self, *args, **kwargs):
+        start = time.monotonic()
+        chunk = self.readable.read(*args, **kwargs)
+        self.seconds += time.monotonic() - start
+
+        self.bytes += len(chunk) if chunk.isascii() else len(chunk.encode('utf-8'))
+
+        return chunk
@@ -0,0 +1,89 @@
+import tempfile
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_ROW_GROUP_SIZE = 100000
+EXTENSION = '.parquet'
+
+
+def _arrow_type(sql_type):
+    """
+    Map a column type, as produced by `RedshiftTarget.json_schema_to_sql_type`, to an Arrow type, along with a
+    function to convert non null values to something Arrow accepts for it.
+    :param sql_type: string
+    :return: (pyarrow.DataType, callable or None)
+    """
+    sql_type = sql_type.lower()
+
+    if sql_type == 'bigint':
+        return pyarrow.int64(), None
+    if sql_type == 'double precision':
+        ## Singer parses JSON numbers as `Decimal`s
+        return pyarrow.float64(), float
+    if sql_type == 'boolean':
+        return pyarrow.bool_(), None
+    if sql_type == 'timestamp with time zone':
+        return pyarrow.timestamp('us', tz='UTC'), None
+
+    return pyarrow.string(), None
+
+
+def write_parquet_files(rows, columns, sql_types, file_count=1, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Write `rows` to `file_count` Parquet files, each holding a contiguous slice of `rows`, in row groups of at most
+    `row_group_size` rows.
+
+    Files are written to local temporary files; closing a file deletes it.
+
+    :param rows: [{column: value, ...}, ...], where missing values are `None`
+    :param columns: [string, ...]
+    :param sql_types: [string, ...], the column type of each of `columns`
+    :param file_count: integer
+    :param row_group_size: integer
+    :return: [binary file object, ...]
+    """
+    if pyarrow is None:
+        raise ImportError('`pyarrow` is required for `parquet` staging. '
+                          'Install with `pip install target-redshift[parquet]`.')
+
+    arrow_types = [_arrow_type(sql_type) for sql_type in sql_types]
+    schema = pyarrow.schema([pyarrow.field(column, arrow_type, nullable=True)
+                             for column, (arrow_type, _) in zip(columns, arrow_types)])
+
+    rows_per_file = max(-(-len(rows) // max(file_count, 1)), 1)
+
+    files = []
+    try:
+        ## Redshift requires at least one file in a manifest, even when there is nothing to load
+        for file_start in range(0, max(len(rows), 1), rows_per_file):
+            parquet_file = tempfile.TemporaryFile()
+            files.append(parquet_file)
+            file_end = min(file_start + rows_per_file, len(rows))
+
+            writer = pyarrow.parquet.ParquetWriter(parquet_file, schema)
+            try:
+                for group_start in range(file_start, file_end, row_group_size):
+                    group = rows[group_start:min(group_start + row_group_size, file_end)]
+
+                    arrays = []
+                    for column, (arrow_type, convert) in zip(columns, arrow_types):
+                        values = [row[column] for row in group]
+                        if convert:
+                            values = [None if value is None else convert(value) for value in values]
+                        arrays.append(pyarrow.array(values, type=arrow_type))
+
+                    writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            finally:
+                writer.close()
+
+            parquet_file.seek(0)
+    except Exception:
+        for parquet_file in files:
+            parquet_file.close()
+        raise
+
+    return files
@@ -0,0 +1,99 @@
+import queue
+import threading
+
+import singer
+
+LOGGER = singer.get_logger()
+
+
+class BufferedBatch:
+    """
+    Point in time copy of a `BufferedSingerStream`'s buffer. Exposes the subset of the stream buffer's interface
+    used by `write_batch`, so that the batch can be written after the stream buffer has been flushed and has
+    started accumulating the next batch.
+    """
+
+    def __init__(self, stream_buffer):
+        self.stream = stream_buffer.stream
+        ## `BufferedSingerStream.update_schema` replaces, rather than mutates, `schema` and `key_properties`
+        self.schema = stream_buffer.schema
+        self.key_properties = stream_buffer.key_properties
+        self.max_version = stream_buffer.max_version
+        self.count = stream_buffer.count
+        self.__records = stream_buffer.get_batch()
+
+    def get_batch(self):
+        return self.__records
+
+
+class FlushPipeline:
+    """
+    Writes batches to a target on a background thread so that reading, validating and buffering records from the
+    tap carries on while previous batches are being staged, copied and merged.
+
+    Batches are written strictly in submission order by a single worker, which owns the target's connection while
+    it is running, so ordering within (and across) streams is preserved. At most `max_pending_batches` batches wait
+    in the queue; `submit` blocks beyond that to bound memory use.
+
+    An exception raised while writing stops all further writes and is re-raised on the submitting thread at the
+    next `submit` or `join`.
+    """
+
+    def __init__(self, target, max_pending_batches=1):
+        self.target = target
+        self._queue = queue.Queue(maxsize=max(max_pending_batches, 1))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='target-redshift-flush-pipeline', daemon=True)
+        self._thread.start()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, batch, on_commit=None):
+        """
+        Queue `batch` to be written. `on_commit` is called, on the worker thread, once the batch has been
+        committed to the target.
+        :param batch: BufferedBatch
+        :param on_commit: callable, or None
+        :return: None
+        """
+        self._raise_error()
+        self._queue.put((batch, on_commit))
+
+    def join(self):
+        """
+        Block until every submitted batch has been written.
+        :return: None
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Write all pending batches and stop the worker thread.
+        :return: None
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                if self._error is not None:
+                    continue
+
+                batch, on_commit = item
+                self.target.write_batch(batch)
+
+                if on_commit:
+                    on_commit()
+            except Exception as ex:
+                LOGGER.exception('Exception in flush pipeline')
+                self._error = ex
+            finally:
+                self._queue.task_done()
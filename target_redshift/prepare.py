@@ -0,0 +1,138 @@
+from collections import deque, namedtuple
+from copy import deepcopy
+import itertools
+import multiprocessing
+
+from jsonschema.exceptions import ValidationError
+
+from target_redshift.json_decoder import get_decoder
+from target_redshift.validators import schema_fingerprint, ValidatorCache
+
+DEFAULT_CHUNK_SIZE = 1000
+
+## Validators built by a worker process, by the schema they validate. Schemas rarely change within a run.
+_worker_validators = ValidatorCache()
+
+## `validated` is False when the line could not be validated in a worker, ie it is not a RECORD, its stream's
+## SCHEMA was unknown to the worker, or it was prepared against a schema which has since changed. `line_data` is
+## None when the line could not be decoded, so that the error is raised, and logged, as it would be in-process.
+PreparedLine = namedtuple('PreparedLine', ['line_data', 'validated', 'validation_error'])
+
+
+def _prepare_chunk(schemas, lines, json_decoder=None):
+    """
+    Decode `lines`, validating RECORD messages against their stream's schema as `BufferedSingerStream` would.
+    Runs in a worker process.
+    :param schemas: {stream: schema}, as of the first of `lines`
+    :param lines: [string or UTF-8 bytes, ...]
+    :param json_decoder: [optional] see `get_decoder`
+    :return: [PreparedLine, ...]
+    """
+    schemas = dict(schemas)
+    decode = get_decoder(json_decoder)
+
+    prepared = []
+    for line in lines:
+        try:
+            line_data = decode(line)
+        except ValueError:
+            ## Invalid JSON, or invalid UTF-8
+            prepared.append(PreparedLine(None, False, None))
+            continue
+
+        if not isinstance(line_data, dict):
+            prepared.append(PreparedLine(line_data, False, None))
+            continue
+
+        message_type = line_data.get('type')
+        stream = line_data.get('stream')
+
+        if message_type == 'SCHEMA' and 'schema' in line_data:
+            schemas[stream] = line_data['schema']
+        elif message_type == 'RECORD' and stream in schemas and 'record' in line_data:
+            try:
+                _worker_validators.get(schemas[stream]).validator.validate(line_data['record'])
+                error = None
+            except ValidationError as validation_error:
+                error = validation_error
+            prepared.append(PreparedLine(line_data, True, error))
+            continue
+
+        prepared.append(PreparedLine(line_data, False, None))
+
+    return prepared
+
+
+class LinePreparer:
+    """
+    Decodes Singer lines, and validates RECORD messages, on a pool of worker processes, so that the process
+    reading the tap's output only has to buffer the records.
+
+    Lines are sent to workers in chunks of `chunk_size`, at most two chunks per process at a time, and are
+    yielded back in the order they were read, so records (and STATE messages) keep their order.
+
+    Each chunk is validated against the schemas known when it was sent. A chunk sent before a SCHEMA message in
+    an earlier chunk had been read back is yielded as not validated, to be validated in-process instead, unless the
+    SCHEMA message repeated its stream's schema.
+
+    Workers are spawned, rather than forked, as the target runs threads (eg, `FlushPipeline`) which must not be
+    copied mid-operation.
+    """
+
+    def __init__(self, processes, chunk_size=DEFAULT_CHUNK_SIZE, json_decoder=None):
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.json_decoder = json_decoder
+        self._pool = multiprocessing.get_context('spawn').Pool(processes)
+        self._schemas = {}
+        self._schema_fingerprints = {}
+        self._schema_generation = 0
+
+    def prepare(self, lines):
+        """
+        :param lines: iterator of strings, or UTF-8 bytes
+        :return: iterator of (line, PreparedLine)
+        """
+        lines = iter(lines)
+        pending = deque()
+
+        def submit():
+            chunk = list(itertools.islice(lines, self.chunk_size))
+            if not chunk:
+                return False
+
+            result = self._pool.apply_async(_prepare_chunk, (self._schemas, chunk, self.json_decoder))
+            pending.append((chunk, self._schema_generation, result))
+            return True
+
+        while len(pending) < 2 * self.processes and submit():
+            pass
+
+        while pending:
+            chunk, schema_generation, result = pending.popleft()
+            stale = schema_generation != self._schema_generation
+
+            for line, prepared_line in zip(chunk, result.get()):
+                if stale and prepared_line.validated:
+                    prepared_line = PreparedLine(prepared_line.line_data, False, None)
+
+                line_data = prepared_line.line_data
+                if isinstance(line_data, dict) and line_data.get('type') == 'SCHEMA' and 'schema' in line_data:
+                    stream = line_data.get('stream')
+                    fingerprint = schema_fingerprint(line_data['schema'])
+
+                    ## SCHEMA messages repeating the stream's schema leave the chunks already sent valid
+                    if self._schema_fingerprints.get(stream) != fingerprint:
+                        ## Chunks already sent hold on to the previous schemas
+                        self._schemas = dict(self._schemas)
+                        self._schemas[stream] = deepcopy(line_data['schema'])
+                        self._schema_fingerprints[stream] = fingerprint
+                        self._schema_generation += 1
+
+                yield line, prepared_line
+
+            submit()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
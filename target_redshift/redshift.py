@@ -1,14 +1,88 @@
 from copy import deepcopy
+import csv
+from datetime import datetime, timedelta, timezone
+import io
+import itertools
+import json
+import logging
+import operator
 import re
+import time
+import uuid
+
+import arrow
 
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from target_postgres import json_schema
-from target_postgres.postgres import PostgresError, PostgresTarget, RESERVED_NULL_DEFAULT
+from target_postgres.postgres import PostgresError, PostgresTarget, RESERVED_NULL_DEFAULT, TransformStream
 from target_postgres.singer_stream import (
-    SINGER_LEVEL
+    SINGER_LEVEL,
+    SINGER_PK,
+    SINGER_RECEIVED_AT,
+    SINGER_SEQUENCE,
+    SINGER_SOURCE_PK_PREFIX,
+    SINGER_VALUE
 )
 from target_postgres.sql_base import SEPARATOR
 
+from target_redshift import parquet
+from target_redshift.metrics import (
+    BYTES_STAGED,
+    CATALOG_QUERY_COUNT,
+    MeteredReadable,
+    Metrics,
+    RECORD_COUNT,
+    UPLOAD_THROUGHPUT
+)
+from target_redshift.pipeline import BufferedBatch
+from target_redshift.s3 import COMPRESSION_GZIP, COMPRESSION_ZSTD
+from target_redshift.schema_cache import SchemaCache, SchemaCacheTransaction
+
+_COPY_COMPRESSION_OPTIONS = {COMPRESSION_GZIP: 'GZIP',
+                             COMPRESSION_ZSTD: 'ZSTD'}
+STAGING_FILE_COUNT_AUTO = 'auto'
+
+STAGING_FORMAT_CSV = 'csv'
+STAGING_FORMAT_PARQUET = 'parquet'
+STAGING_FORMATS = (STAGING_FORMAT_CSV, STAGING_FORMAT_PARQUET)
+
+DEFAULT_INSERT_BATCH_MAX_BYTES = 1024 * 1024  # 1MB
+
+MAX_COPY_COLUMN_LISTS = 1000
+MAX_SERIALIZATION_PLANS = 1000
+
+## Rows per chunk of staged CSV. Chunks are what `S3.persist_parts` shards across files, so this is kept small
+## enough for batches to be spread across every file.
+CSV_CHUNK_ROWS = 256
+
+VARCHAR_SIZING_OBSERVED = 'observed'
+VARCHAR_SIZING_FIXED = 'fixed'
+VARCHAR_SIZINGS = (VARCHAR_SIZING_OBSERVED, VARCHAR_SIZING_FIXED)
+MIN_OBSERVED_VARCHAR_LENGTH = 32
+
+DISTSTYLE_AUTO = 'auto'
+DISTSTYLE_EVEN = 'even'
+DISTSTYLE_ALL = 'all'
+DISTSTYLE_KEY = 'key'
+DISTSTYLES = (DISTSTYLE_AUTO, DISTSTYLE_EVEN, DISTSTYLE_ALL, DISTSTYLE_KEY)
+TABLE_OPTIONS = ('diststyle', 'distkey', 'sortkey')
+
+## Default sort key columns, in order of preference
+_SORTKEY_COLUMNS = (SINGER_RECEIVED_AT, SINGER_SEQUENCE)
+
+## Marks the string columns of a streamed table schema with their `(table_path, column_path)`, so that `add_column`
+## can size them from the lengths observed in the batch
+_OBSERVED_PATH = '_target_redshift_observed_path'
+
+MERGE_STRATEGY_APPEND = 'append'
+MERGE_STRATEGY_MERGE = 'merge'
+MERGE_STRATEGY_DELETE_INSERT = 'delete_insert'
+
+## Key properties of streams without `key_properties`, and of their subtables. Every record is given a fresh uuid
+## as its key, so these tables never have existing rows to update.
+_APPEND_ONLY_KEY_PROPERTIES = ([SINGER_PK], [SINGER_SOURCE_PK_PREFIX + SINGER_PK])
+
 
 class RedshiftError(PostgresError):
     """
@@ -16,23 +90,182 @@ class RedshiftError(PostgresError):
     """
 
 
+def _csv_rows(records, csv_headers):
+    """
+    :param records: [{...}, ...], every record having all of `csv_headers`
+    :param csv_headers: [string, ...]
+    :return: TransformStream, each `read()` returning up to `CSV_CHUNK_ROWS` rows
+    """
+    rows_iter = iter(records)
+    get_values = operator.itemgetter(*csv_headers)
+    if len(csv_headers) == 1:
+        get_values = lambda record: (record[csv_headers[0]],)
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def transform():
+        rows = list(itertools.islice(rows_iter, CSV_CHUNK_ROWS))
+        if not rows:
+            return ''
+
+        writer.writerows(map(get_values, rows))
+        chunk = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return chunk
+
+    return TransformStream(transform)
+
+
+## RFC 3339 date-times, as emitted by most taps. Anything else is left to `arrow`.
+_RFC3339_DATETIME = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(?:(Z)|([+-])(\d{2}):?(\d{2}))?$')
+
+
+def _parse_datetime(value):
+    """
+    Parse `value` as `arrow.get` would, skipping `arrow`'s pattern matching for RFC 3339 date-times.
+    :param value: string
+    :return: datetime, with a timezone
+    """
+    match = _RFC3339_DATETIME.match(value)
+    if match:
+        year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+
+        tz = timezone.utc
+        if sign:
+            offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+            tz = timezone(-offset if sign == '-' else offset)
+
+        try:
+            return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                            int(fraction.ljust(6, '0')) if fraction else 0,
+                            tz)
+        except ValueError:
+            pass
+
+    return arrow.get(value).datetime
+
+
+def _format_datetime(value):
+    """
+    :param value: datetime, with a timezone
+    :return: string, formatted as `YYYY-MM-DD HH:mm:ss.SSSSZZ`
+    """
+    offset_minutes = int(value.utcoffset().total_seconds() // 60)
+    offset_hours, offset_minutes = divmod(abs(offset_minutes), 60)
+
+    return '{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}.{:04d}{}{:02d}:{:02d}'.format(
+        value.year, value.month, value.day, value.hour, value.minute, value.second, value.microsecond // 100,
+        '-' if value.utcoffset() < timedelta(0) else '+', offset_hours, offset_minutes)
+
+
+def _dedupe_records(records, key_columns):
+    """
+    Keep only the record with the greatest `_sdc_sequence` for each distinct value of `key_columns`, mirroring the
+    `ROW_NUMBER()` deduplication performed when merging a staged batch.
+    :param records: [{...}, ...]
+    :param key_columns: [string, ...]
+    :return: [{...}, ...]
+    """
+    latest = {}
+    for record in records:
+        key = tuple(record[column] for column in key_columns)
+        existing = latest.get(key)
+        if existing is None or existing[SINGER_SEQUENCE] <= record[SINGER_SEQUENCE]:
+            latest[key] = record
+
+    return list(latest.values())
+
+
 def _make_schema_nullable(schema):
-    # Redshift does not allow for creation of columns which are non null without a default
-    nullable_schema = deepcopy(schema)
-    nullable_properties = nullable_schema['properties']
+    """
+    Redshift does not allow for creation of columns which are non null without a default.
+
+    Only the properties which are not already nullable are copied; everything else is shared with `schema`, so
+    neither `schema` nor the returned schema should be mutated.
+    """
+    nullable_properties = {}
+
+    for field, field_schema in schema['properties'].items():
+        nullable_field_schema = json_schema.make_nullable(field_schema)
 
-    for field in nullable_properties:
-        nullable_properties[field] = json_schema.make_nullable(nullable_properties[field])
+        if 'anyOf' in nullable_field_schema:
+            nullable_any_of = [json_schema.make_nullable(sub_schema)
+                               for sub_schema in nullable_field_schema['anyOf']]
 
-        if 'anyOf' in nullable_properties[field]:
-            nullable_properties[field]['anyOf'] = [
-                json_schema.make_nullable(sub_schema)
-                for sub_schema in nullable_properties[field]['anyOf']
-            ]
+            if any(a is not b for a, b in zip(nullable_any_of, nullable_field_schema['anyOf'])):
+                nullable_field_schema = dict(nullable_field_schema)
+                nullable_field_schema['anyOf'] = nullable_any_of
+
+        nullable_properties[field] = nullable_field_schema
+
+    nullable_schema = dict(schema)
+    nullable_schema['properties'] = nullable_properties
 
     return nullable_schema
 
 
+def _utf8_length(value):
+    return len(value) if value.isascii() else len(value.encode('utf-8'))
+
+
+def _observe_length(lengths, key, length):
+    if length > lengths.get(key, 0):
+        lengths[key] = length
+
+
+def _observe_string_lengths(value, table_path, column_path, lengths, source_key_lengths=None):
+    """
+    Record the longest UTF-8 encoded string found at each column of `value`, following how `denest` flattens
+    objects into columns and arrays into subtables.
+    :param value: a record, or any value within it
+    :param table_path: (string, ...), path of the (sub)table `value` is loaded into, excluding the root table
+    :param column_path: (string, ...), path of the column `value` is loaded into
+    :param lengths: {(table_path, column_path): integer}, updated in place
+    :param source_key_lengths: [optional] {column_name: integer}, lengths of the record's string key properties,
+                               which `denest` copies into every subtable as `_sdc_source_key_` columns
+    :return: None
+    """
+    if isinstance(value, str):
+        _observe_length(lengths, (table_path, column_path), _utf8_length(value))
+    elif isinstance(value, dict):
+        for prop, prop_value in value.items():
+            _observe_string_lengths(prop_value, table_path, column_path + (prop,), lengths, source_key_lengths)
+    elif isinstance(value, list):
+        subtable_path = table_path + column_path
+        if value and source_key_lengths:
+            for column_name, length in source_key_lengths.items():
+                _observe_length(lengths, (subtable_path, (column_name,)), length)
+
+        for item in value:
+            if isinstance(item, dict):
+                _observe_string_lengths(item, subtable_path, (), lengths, source_key_lengths)
+            else:
+                _observe_string_lengths(item, subtable_path, (SINGER_VALUE,), lengths, source_key_lengths)
+
+
+def _observed_varchar_length(max_length, limit):
+    """
+    Column length to fit values of up to `max_length` bytes. Lengths are rounded up to a power of two so that
+    columns are widened rarely as longer values arrive.
+    """
+    length = MIN_OBSERVED_VARCHAR_LENGTH
+    while length < max_length:
+        length *= 2
+
+    return min(length, limit)
+
+
+def _is_varchar_type(sql_type):
+    return sql_type.lower().startswith(('varchar', 'character varying'))
+
+
+def _is_varchar_schema(schema):
+    return json_schema.STRING in json_schema.get_type(schema) and not json_schema.is_datetime(schema)
+
+
 class RedshiftTarget(PostgresTarget):
     """
     Placeholder for specific Redshift implementation of a Singer Target.
@@ -50,61 +283,764 @@ class RedshiftTarget(PostgresTarget):
         logging_level=None,
         default_column_length=DEFAULT_COLUMN_LENGTH,
         persist_empty_tables=False,
+        staging_file_count=1,
+        staging_compression=None,
+        staging_format=STAGING_FORMAT_CSV,
+        insert_batch_max_rows=0,
+        insert_batch_max_bytes=DEFAULT_INSERT_BATCH_MAX_BYTES,
+        native_merge=False,
+        varchar_sizing=VARCHAR_SIZING_OBSERVED,
+        table_options=None,
+        compression_encodings=True,
+        rebuild_table_column_threshold=None,
+        schema_cache=None,
+        metrics=None,
+        cleaner=None,
         **kwargs):
 
         self.LOGGER.info(
             'RedshiftTarget created with established connection: `{}`, schema: `{}`'.format(connection.dsn,
                                                                                             redshift_schema))
 
+        if staging_compression is not None and staging_compression not in _COPY_COMPRESSION_OPTIONS:
+            raise RedshiftError('`staging_compression` must be one of {}. Got: `{}`'.format(
+                list(_COPY_COMPRESSION_OPTIONS.keys()),
+                staging_compression))
+
+        if staging_file_count != STAGING_FILE_COUNT_AUTO \
+                and (not isinstance(staging_file_count, int) or staging_file_count < 1):
+            raise RedshiftError('`staging_file_count` must be a positive integer or `"{}"`. Got: `{}`'.format(
+                STAGING_FILE_COUNT_AUTO,
+                staging_file_count))
+
+        if staging_format not in STAGING_FORMATS:
+            raise RedshiftError('`staging_format` must be one of {}. Got: `{}`'.format(
+                list(STAGING_FORMATS),
+                staging_format))
+
+        if rebuild_table_column_threshold is not None \
+                and (not isinstance(rebuild_table_column_threshold, int) or rebuild_table_column_threshold < 1):
+            raise RedshiftError('`rebuild_table_column_threshold` must be a positive integer. Got: `{}`'.format(
+                rebuild_table_column_threshold))
+
+        if varchar_sizing not in VARCHAR_SIZINGS:
+            raise RedshiftError('`varchar_sizing` must be one of {}. Got: `{}`'.format(
+                list(VARCHAR_SIZINGS),
+                varchar_sizing))
+
+        for stream, options in (table_options or {}).items():
+            unknown_options = set(options) - set(TABLE_OPTIONS)
+            if unknown_options:
+                raise RedshiftError('`table_options` for `{}` must only include {}. Got: `{}`'.format(
+                    stream,
+                    list(TABLE_OPTIONS),
+                    sorted(unknown_options)))
+            if options.get('diststyle') is not None and options['diststyle'] not in DISTSTYLES:
+                raise RedshiftError('`diststyle` for `{}` must be one of {}. Got: `{}`'.format(
+                    stream,
+                    list(DISTSTYLES),
+                    options['diststyle']))
+
+        if staging_format == STAGING_FORMAT_PARQUET:
+            if staging_compression is not None:
+                raise RedshiftError('`staging_compression` only applies to `csv` staging. '
+                                    'Parquet files are always compressed with Snappy.')
+            if parquet.pyarrow is None:
+                raise RedshiftError('`pyarrow` is required for `parquet` staging. '
+                                    'Install with `pip install target-redshift[parquet]`.')
+
         self.s3 = s3
         self.default_column_length = default_column_length
+        self.staging_file_count = staging_file_count
+        self.staging_compression = staging_compression
+        self.staging_format = staging_format
+        self.insert_batch_max_rows = insert_batch_max_rows
+        self.insert_batch_max_bytes = insert_batch_max_bytes
+        self.native_merge = native_merge
+        self.varchar_sizing = varchar_sizing
+        self.table_options = table_options or {}
+        self.compression_encodings = compression_encodings
+        self.rebuild_table_column_threshold = rebuild_table_column_threshold
+        ## Targets writing to the same schema concurrently must share their cache
+        self.schema_cache = SchemaCacheTransaction(schema_cache or SchemaCache())
+        self.metrics = metrics or Metrics()
+        ## Staged objects are only deleted when given a `StagedObjectCleaner`
+        self.cleaner = cleaner
+        self._catalog_query_count = 0
+        self._copied_keys = []
+        self._stream_buffer = None
+        self._observed_string_lengths = None
+        ## Schema changes are planned for the whole of `upsert_table_helper`, then applied together:
+        ## - tables added in the current batch, which are only created once all of their columns are known
+        ## - columns added to existing tables
+        ## - tables whose metadata (comment) has changed
+        self._planning_schema = False
+        self._pending_tables = {}
+        self._pending_columns = {}
+        self._unwritten_metadata = set()
+        self._nullable_stream_schemas = {}
+        self._slice_count = None
+        self._copy_column_lists = {}
+        self._serialization_plans = {}
         PostgresTarget.__init__(self, connection, postgres_schema=redshift_schema, logging_level=logging_level,
                                 persist_empty_tables=persist_empty_tables, add_upsert_indexes=False)
 
+    def _log_schema(self, message, schema):
+        ## Formatting schemas with thousands of properties is expensive, even when the message is discarded
+        if self.LOGGER.isEnabledFor(logging.DEBUG):
+            self.LOGGER.debug('{}: {}'.format(message, schema))
+
+    def _get_nullable_stream_schema(self, stream_buffer):
+        """
+        `_make_schema_nullable` for the stream's schema, memoized on the identity of the schema. A stream buffer's
+        `schema` is replaced, never mutated, when a new SCHEMA message arrives, so this only needs recomputing then.
+        :param stream_buffer: SingerStreamBuffer
+        :return: JSONSchema
+        """
+        schema = stream_buffer.schema
+        cached = self._nullable_stream_schemas.get(stream_buffer.stream)
+
+        if cached and (cached[0] is schema or cached[1] is schema):
+            return cached[1]
+
+        nullable_schema = _make_schema_nullable(schema)
+        self._nullable_stream_schemas[stream_buffer.stream] = (schema, nullable_schema)
+
+        return nullable_schema
+
     def write_batch(self, stream_buffer):
+        ## `get_batch` stamps records (eg, `_sdc_batched_at`) each time it is called, so it is called only once: the
+        ##  string lengths observed for sizing and widening columns are those of the records written
+        if not isinstance(stream_buffer, BufferedBatch):
+            stream_buffer = BufferedBatch(stream_buffer)
+
         # WARNING: Using mutability here as there's no simple way to copy the necessary data over
-        self.LOGGER.info('write_batch: Schema before nullability: {}'.format(stream_buffer.schema))
+        self._log_schema('write_batch: Schema before nullability', stream_buffer.schema)
         nullable_stream_buffer = stream_buffer
-        nullable_stream_buffer.schema = _make_schema_nullable(stream_buffer.schema)
+        nullable_stream_buffer.schema = self._get_nullable_stream_schema(stream_buffer)
+
+        self._log_schema('write_batch: Schema after nullability', stream_buffer.schema)
+
+        self._stream_buffer = stream_buffer
+        self._observed_string_lengths = None
+
+        try:
+            self._widen_varchar_columns(stream_buffer)
+            written_batches_details = PostgresTarget.write_batch(self, nullable_stream_buffer)
+        except Exception:
+            ## Anything written through to the cache during the rolled back transaction is no longer true
+            self.schema_cache.rollback()
+            raise
+        else:
+            self.schema_cache.commit()
+            return written_batches_details
+        finally:
+            self.LOGGER.debug('Schema cache: {} hits, {} misses'.format(self.schema_cache.hits,
+                                                                          self.schema_cache.misses))
+            self.metrics.count(CATALOG_QUERY_COUNT,
+                               self._catalog_query_count,
+                               dict(self.metrics_tags(), stream=stream_buffer.stream, path=(stream_buffer.stream,)))
+            self._catalog_query_count = 0
+            self._stream_buffer = None
+            self._observed_string_lengths = None
+            self._planning_schema = False
+            self._pending_tables = {}
+            self._pending_columns = {}
+            self._unwritten_metadata = set()
+
+            ## The batch's transaction has committed or rolled back, so its staged objects are no longer needed
+            if self.cleaner:
+                self.cleaner.delete(self._copied_keys)
+            self._copied_keys = []
+
+    def activate_version(self, stream_buffer, version):
+        try:
+            return PostgresTarget.activate_version(self, stream_buffer, version)
+        finally:
+            ## Activating a version renames and drops tables
+            self.schema_cache.clear()
+            self.schema_cache.commit()
+
+    def setup_table_mapping_cache(self, cur):
+        table_mappings = self.schema_cache.get_table_mappings()
+
+        if table_mappings is None:
+            self._catalog_query_count += 1
+            PostgresTarget.setup_table_mapping_cache(self, cur)
+            self.schema_cache.set_table_mappings(self.table_mapping_cache)
+        else:
+            self.table_mapping_cache = table_mappings
+
+    def add_table_mapping(self, cur, from_path, metadata):
+        table_name = PostgresTarget.add_table_mapping(self, cur, from_path, metadata)
+        self.schema_cache.add_table_mapping(from_path, table_name)
+
+        return table_name
+
+    def get_table_schema(self, cur, name):
+        hit, table_schema = self.schema_cache.get_table_schema(name)
+        if hit:
+            return table_schema
+
+        if name in self._pending_tables:
+            return self._get_pending_table_schema(cur, name)
+
+        if name in self._pending_columns:
+            self._add_pending_columns(cur, name)
 
-        self.LOGGER.info('write_batch: Schema after nullability: {}'.format(stream_buffer.schema))
+        self._catalog_query_count += 1
+        table_schema = PostgresTarget.get_table_schema(self, cur, name)
+        self.schema_cache.set_table_schema(name, table_schema)
 
-        return PostgresTarget.write_batch(self, nullable_stream_buffer)
+        return table_schema
+
+    def _get_table_metadata(self, cur, table_name):
+        ## `target_postgres` edits the metadata it is given in place, so is given a copy of the cached metadata
+        return deepcopy(self._get_cached_table_metadata(cur, table_name))
+
+    def _get_cached_table_metadata(self, cur, table_name):
+        """
+        :param cur: Cursor
+        :param table_name: string
+        :return: the table's metadata, shared with the schema cache, so not to be mutated
+        """
+        hit, metadata = self.schema_cache.get_metadata(table_name)
+        if hit:
+            return metadata
+
+        self._catalog_query_count += 1
+        metadata = PostgresTarget._get_table_metadata(self, cur, table_name)
+        self.schema_cache.set_metadata(table_name, metadata)
+
+        return metadata
+
+    def _set_table_metadata(self, cur, table_name, metadata):
+        ## Metadata changes repeatedly while planning schema changes (eg, once per column mapping), so it is only
+        ## set as the table's comment once, at the end
+        if self._planning_schema:
+            self._unwritten_metadata.add(table_name)
+        else:
+            PostgresTarget._set_table_metadata(self, cur, table_name, metadata)
+
+        self.schema_cache.set_metadata(table_name, metadata)
+        self.schema_cache.invalidate_table_schema(table_name)
+
+    def add_key_properties(self, cur, table_name, key_properties):
+        ## The metadata is only copied when the key properties are first added to it, rather than for every batch
+        if key_properties and 'key_properties' not in self._get_cached_table_metadata(cur, table_name):
+            PostgresTarget.add_key_properties(self, cur, table_name, key_properties)
+
+    def is_table_empty(self, cur, table_name):
+        if table_name in self._pending_tables:
+            return True
+
+        if self.schema_cache.is_non_empty(table_name):
+            return False
+
+        self._catalog_query_count += 1
+        table_empty = PostgresTarget.is_table_empty(self, cur, table_name)
+        if not table_empty:
+            self.schema_cache.set_non_empty(table_name)
+
+        return table_empty
 
     def upsert_table_helper(self, connection, table_schema, metadata, log_schema_changes=True):
-        self.LOGGER.info('upsert_table_helper: Schema before nullability: {}'.format(table_schema))
+        self._log_schema('upsert_table_helper: Schema before nullability', table_schema)
 
-        nullable_table_schema = deepcopy(table_schema)
-        nullable_table_schema['schema'] = _make_schema_nullable(nullable_table_schema['schema'])
-        self.LOGGER.info('upsert_table_helper: Schema after nullability: {}'.format(nullable_table_schema))
-        return PostgresTarget.upsert_table_helper(self,
-                                                  connection,
-                                                  nullable_table_schema,
-                                                  metadata,
-                                                  log_schema_changes=log_schema_changes)
+        nullable_table_schema = dict(table_schema)
+        nullable_table_schema['schema'] = _make_schema_nullable(table_schema['schema'])
+        if self.varchar_sizing == VARCHAR_SIZING_OBSERVED:
+            nullable_table_schema['schema'] = self._mark_observed_paths(table_schema['path'],
+                                                                        nullable_table_schema['schema'])
+        self._log_schema('upsert_table_helper: Schema after nullability', nullable_table_schema)
 
-    def add_table(self, cur, path, name, metadata):
-        self._validate_identifier(name)
+        self._planning_schema = True
+        remote_schema = PostgresTarget.upsert_table_helper(self,
+                                                           connection,
+                                                           nullable_table_schema,
+                                                           metadata,
+                                                           log_schema_changes=log_schema_changes)
+
+        for table_name in list(self._pending_columns.keys()):
+            self._add_pending_columns(connection, table_name)
+        for table_name in list(self._pending_tables.keys()):
+            self._create_pending_table(connection, table_name)
+
+        self._planning_schema = False
+        for table_name in sorted(self._unwritten_metadata):
+            self._set_table_metadata(connection, table_name, self._get_cached_table_metadata(connection, table_name))
+        self._unwritten_metadata = set()
+
+        return remote_schema
+
+    def _mark_observed_paths(self, table_path, schema):
+        """
+        Mark each string column of a streamed table schema with where its values are found in the batch's records.
+        :param table_path: (string, ...), including the root table name
+        :param schema: JSON Schema of denested properties, which is not mutated
+        :return: JSON Schema
+        """
+        properties = dict(schema['properties'])
+
+        for column_path, column_schema in properties.items():
+            any_of = column_schema.get('anyOf', [])
+            if any(_is_varchar_schema(sub_schema) for sub_schema in any_of):
+                marked_any_of = []
+                for sub_schema in any_of:
+                    if _is_varchar_schema(sub_schema):
+                        sub_schema = dict(sub_schema)
+                        sub_schema[_OBSERVED_PATH] = (tuple(table_path[1:]), column_path)
+                    marked_any_of.append(sub_schema)
 
-        create_table_sql = sql.SQL('CREATE TABLE {}.{} ({} {})').format(
+                properties[column_path] = dict(column_schema, anyOf=marked_any_of)
+
+        return dict(schema, properties=properties)
+
+    def _get_observed_string_lengths(self):
+        """
+        The longest string observed at each column of the batch being written. Only computed once a new string
+        column needs sizing.
+        :return: {(table_path, column_path): integer}
+        """
+        if self._observed_string_lengths is None:
+            lengths = {}
+            if self._stream_buffer is not None:
+                ## `write_batch` only writes `BufferedBatch`s, whose records are not copied, nor stamped, again
+                key_properties = self._stream_buffer.key_properties
+                for record in self._stream_buffer.get_batch():
+                    source_key_lengths = {SINGER_SOURCE_PK_PREFIX + key_property: _utf8_length(record[key_property])
+                                          for key_property in key_properties
+                                          if isinstance(record.get(key_property), str)}
+                    _observe_string_lengths(record, (), (), lengths, source_key_lengths)
+
+            self._observed_string_lengths = lengths
+
+        return self._observed_string_lengths
+
+    def _size_column_schema(self, column_schema):
+        observed_path = column_schema.get(_OBSERVED_PATH)
+        if observed_path is None:
+            return column_schema
+
+        column_schema = {k: v for k, v in column_schema.items() if k != _OBSERVED_PATH}
+        if 'maxLength' not in column_schema:
+            column_schema['maxLength'] = _observed_varchar_length(
+                self._get_observed_string_lengths().get(observed_path, 0),
+                self.MAX_VARCHAR)
+
+        return column_schema
+
+    def _get_varchar_lengths(self, cur, table_name):
+        """
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :return: {column_name: integer}, for each `varchar` column of `table_name`
+        """
+        hit, lengths = self.schema_cache.get_varchar_lengths(table_name)
+        if hit:
+            return lengths
+
+        self._catalog_query_count += 1
+        cur.execute(sql.SQL('''
+            SELECT column_name, character_maximum_length FROM information_schema.columns
+            WHERE table_schema = {} AND table_name = {} AND data_type = 'character varying';
+        ''').format(
+            sql.Literal(self.postgres_schema),
+            sql.Literal(table_name)))
+        lengths = dict(cur.fetchall())
+        self.schema_cache.set_varchar_lengths(table_name, lengths)
+
+        return lengths
+
+    def _widen_varchar_columns(self, stream_buffer):
+        """
+        Widen any `varchar` column of the stream's existing tables too narrow for the batch about to be written.
+
+        Redshift cannot `ALTER COLUMN ... TYPE` within a transaction block, so columns are widened, and committed,
+        before the batch's transaction begins. A wider column is still valid should the batch then fail.
+        :param stream_buffer: SingerStreamBuffer
+        :return: None
+        """
+        if self.varchar_sizing != VARCHAR_SIZING_OBSERVED or not stream_buffer.count:
+            return
+
+        with self.conn.cursor() as cur:
+            self.setup_table_mapping_cache(cur)
+
+            root_path = self._get_batch_root_path(cur, stream_buffer)
+            if root_path is None:
+                return
+
+            observed_lengths = self._get_observed_string_lengths()
+
+            widenings = []
+            for table_path in sorted({table_path for table_path, _ in observed_lengths}):
+                table_name = self.table_mapping_cache.get(root_path + table_path)
+                if table_name is None:
+                    continue
+
+                lengths = self._get_varchar_lengths(cur, table_name)
+                if not lengths:
+                    continue
+
+                mappings = self._get_cached_table_metadata(cur, table_name).get('mappings', {})
+                for column_name, mapping in mappings.items():
+                    length = lengths.get(column_name)
+                    max_length = observed_lengths.get((table_path, tuple(mapping['from'])))
+                    if length is not None and max_length is not None and length < self.MAX_VARCHAR \
+                            and max_length > length:
+                        widenings.append((table_name,
+                                          column_name,
+                                          _observed_varchar_length(max_length, self.MAX_VARCHAR)))
+
+            if not widenings:
+                return
+
+            ## Ends the transaction psycopg2 began for the reads above. As with `write_batch`'s `BEGIN;` and `COMMIT;`,
+            ##  psycopg2 does not track it, so begins no other: the `ALTER`s run outside of any transaction block
+            cur.execute('COMMIT;')
+            try:
+                for table_name, column_name, length in widenings:
+                    self._widen_varchar_column(cur, table_name, column_name, length)
+            finally:
+                ## Each `ALTER` has committed, as had the reads above, so other targets may see them
+                self.schema_cache.commit()
+
+    def _get_batch_root_path(self, cur, stream_buffer):
+        """
+        The path `PostgresTarget.write_batch` will write the batch's root table to, and so the prefix by which its
+        tables are mapped: the stream, or, when loading a newer version of the stream, `<stream>__<version>`.
+        :param cur: Cursor
+        :param stream_buffer: SingerStreamBuffer
+        :return: (string,), or None if the stream has no tables yet, or the batch's version is to be dropped
+        """
+        current_table_name = self.table_mapping_cache.get((stream_buffer.stream,))
+        if current_table_name is None:
+            return None
+
+        current_table_version = (self._get_cached_table_metadata(cur, current_table_name) or {}).get('version')
+        root_table_name = stream_buffer.stream
+
+        if current_table_version is not None and stream_buffer.max_version is not None:
+            if stream_buffer.max_version < current_table_version:
+                return None
+            elif stream_buffer.max_version > current_table_version:
+                root_table_name += SEPARATOR + str(stream_buffer.max_version)
+
+        return (root_table_name,)
+
+    def _widen_varchar_column(self, cur, table_name, column_name, length):
+        self.LOGGER.info('Widening column `{}`.`{}` to varchar({})'.format(table_name, column_name, length))
+
+        cur.execute(sql.SQL('ALTER TABLE {}.{} ALTER COLUMN {} TYPE varchar({});').format(
             sql.Identifier(self.postgres_schema),
-            sql.Identifier(name),
-            # Redshift does not allow for creation of tables with no columns
-            sql.Identifier(self.CREATE_TABLE_INITIAL_COLUMN),
-            sql.SQL(self.CREATE_TABLE_INITIAL_COLUMN_TYPE))
+            sql.Identifier(table_name),
+            sql.Identifier(column_name),
+            sql.Literal(length)))
 
-        cur.execute(sql.SQL('{};').format(
-            create_table_sql))
+        self.schema_cache.invalidate_table_schema(table_name)
+
+    def add_table(self, cur, path, name, metadata):
+        """
+        Tables are not created straight away. Columns added to the table before the end of `upsert_table_helper`
+        are collected, and the table is then created with all of them, its distribution style, sort key and column
+        encodings in a single statement.
+        """
+        self._validate_identifier(name)
+
+        self._pending_tables[name] = {'path': path, 'columns': {}}
 
         self._set_table_metadata(cur, name, {'path': path,
                                              'version': metadata.get('version', None),
                                              'schema_version': metadata['schema_version']})
 
-        self.add_column_mapping(cur,
-                                name,
-                                (self.CREATE_TABLE_INITIAL_COLUMN,),
-                                self.CREATE_TABLE_INITIAL_COLUMN,
-                                json_schema.make_nullable({'type': json_schema.BOOLEAN}))
+        self.schema_cache.invalidate_table_schema(name)
+
+    def drop_placeholder_columns(self):
+        """
+        Drop the placeholder column which tables created by earlier versions of the target were created with, in a
+        single transaction.
+        :return: [string, ...], names of the tables the column was dropped from
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(sql.SQL('''
+                SELECT table_name FROM information_schema.columns
+                WHERE table_schema = {} AND column_name = {}
+                ORDER BY table_name;
+            ''').format(
+                sql.Literal(self.postgres_schema),
+                sql.Literal(self.CREATE_TABLE_INITIAL_COLUMN)))
+            table_names = [table_name for table_name, in cur.fetchall()]
+
+            cur.execute('BEGIN;')
+            try:
+                for table_name in table_names:
+                    self.LOGGER.info('Dropping `{}` from table `{}`'.format(self.CREATE_TABLE_INITIAL_COLUMN,
+                                                                            table_name))
+                    self.drop_column(cur, table_name, self.CREATE_TABLE_INITIAL_COLUMN)
+                    self.drop_column_mapping(cur, table_name, self.CREATE_TABLE_INITIAL_COLUMN)
+                cur.execute('COMMIT;')
+            except Exception:
+                cur.execute('ROLLBACK;')
+                ## Anything written through to the cache during the rolled back transaction is no longer true
+                self.schema_cache.rollback()
+                raise
+
+            self.schema_cache.commit()
+
+        return table_names
+
+    def _get_pending_table_schema(self, cur, name):
+        ## Mirrors `PostgresTarget.get_table_schema`, as if the table had been created
+        properties = {}
+        for column_name, sql_type in self._pending_tables[name]['columns'].items():
+            data_type = 'character varying' if _is_varchar_type(sql_type) else sql_type
+            properties[column_name] = self.sql_type_to_json_schema(data_type, True)
+
+        table_schema = self._get_table_metadata(cur, name)
+        table_schema['name'] = name
+        table_schema['type'] = 'TABLE_SCHEMA'
+        table_schema['schema'] = {'properties': properties}
+
+        return table_schema
+
+    def _get_table_attributes(self, name, path, metadata, columns):
+        """
+        Choose how a new table is distributed and sorted:
+        - `DISTKEY` on the table's key property, when it has exactly one. Subtables' key is their parent's key, so
+          parents and children are joined without redistribution. `varchar` keys are skipped, as a table's
+          `DISTKEY` column cannot be widened.
+        - `SORTKEY` on `_sdc_received_at` or, failing that, `_sdc_sequence`.
+
+        Either can be overridden for a stream's root table with `table_options`.
+
+        :param name: string
+        :param path: (string, ...)
+        :param metadata: table metadata, with its `key_properties` and column `mappings`
+        :param columns: {column_name: sql_type}
+        :return: {'diststyle': string or None, 'distkey': string or None, 'sortkey': [string, ...]}
+        """
+        key_columns = []
+        for key_property in metadata.get('key_properties') or []:
+            for column_name, mapping in metadata.get('mappings', {}).items():
+                if tuple(mapping['from']) == (key_property,) and column_name in columns:
+                    key_columns.append(column_name)
+                    break
+
+        distkey = None
+        if len(key_columns) == 1 and not _is_varchar_type(columns[key_columns[0]]):
+            distkey = key_columns[0]
+
+        sortkey = [column_name for column_name in _SORTKEY_COLUMNS if column_name in columns][:1]
+
+        options = {}
+        if len(path) == 1 and self._stream_buffer is not None:
+            options = self.table_options.get(self._stream_buffer.stream, {})
+
+        distkey = options.get('distkey', distkey)
+        sortkey = options.get('sortkey', sortkey) or []
+        if isinstance(sortkey, str):
+            sortkey = [sortkey]
+        diststyle = options.get('diststyle', DISTSTYLE_KEY if distkey else None)
+
+        for column_name in ([distkey] if distkey else []) + sortkey:
+            if column_name not in columns:
+                raise RedshiftError('`table_options` column `{}` does not exist in `{}`. Columns are: {}'.format(
+                    column_name,
+                    name,
+                    list(columns.keys())))
+
+        return {'diststyle': diststyle,
+                'distkey': distkey if diststyle == DISTSTYLE_KEY else None,
+                'sortkey': sortkey}
+
+    def _get_table_attributes_sql(self, attributes):
+        attributes_sql = []
+        if attributes['diststyle']:
+            attributes_sql.append(sql.SQL('DISTSTYLE {}').format(sql.SQL(attributes['diststyle'].upper())))
+        if attributes['distkey']:
+            attributes_sql.append(sql.SQL('DISTKEY ({})').format(sql.Identifier(attributes['distkey'])))
+        if attributes['sortkey']:
+            attributes_sql.append(sql.SQL('COMPOUND SORTKEY ({})').format(
+                sql.SQL(', ').join(map(sql.Identifier, attributes['sortkey']))))
+
+        return sql.SQL(' ').join(attributes_sql)
+
+    def _get_column_encoding(self, sql_type):
+        """
+        :param sql_type: string
+        :return: string, or None to leave the column's encoding to Redshift
+        """
+        if not self.compression_encodings:
+            return None
+
+        if sql_type.lower() in ('bigint', 'timestamp with time zone'):
+            return 'AZ64'
+
+        return 'ZSTD'
+
+    def _get_column_definition_sql(self, column_name, sql_type, encoding):
+        column_sql = sql.SQL('{} {}').format(sql.Identifier(column_name), sql.SQL(sql_type))
+        if encoding:
+            column_sql = sql.SQL('{} ENCODE {}').format(column_sql, sql.SQL(encoding))
+
+        return column_sql
+
+    def _create_pending_table(self, cur, name):
+        pending_table = self._pending_tables.pop(name)
+        metadata = self._get_cached_table_metadata(cur, name)
+
+        columns = pending_table['columns']
+        if not columns:
+            ## Redshift does not allow for creation of tables with no columns
+            columns = {self.CREATE_TABLE_INITIAL_COLUMN: self.CREATE_TABLE_INITIAL_COLUMN_TYPE.lower()}
+
+        self._create_table(cur, name, pending_table['path'], metadata, columns)
+
+        self._set_table_metadata(cur, name, metadata)
+
+    def _create_table(self, cur, name, path, metadata, columns):
+        """
+        :param cur: Pscyopg.Cursor
+        :param name: string
+        :param path: (string, ...)
+        :param metadata: the table's metadata, used to choose its attributes
+        :param columns: {column_name: sql_type}
+        :return: None
+        """
+        attributes = self._get_table_attributes(name, path, metadata, columns)
+
+        column_definitions = []
+        for column_name, sql_type in columns.items():
+            encoding = self._get_column_encoding(sql_type)
+            ## Leaving the leading sort key column uncompressed lets Redshift skip blocks without decompressing them
+            if encoding and attributes['sortkey'][:1] == [column_name]:
+                encoding = 'RAW'
+            column_definitions.append(self._get_column_definition_sql(column_name, sql_type, encoding))
+
+        self.LOGGER.info('Creating table `{}` with {} columns, {}'.format(name, len(columns), attributes))
+
+        cur.execute(sql.SQL('CREATE TABLE {}.{} ({}) {};').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(name),
+            sql.SQL(', ').join(column_definitions),
+            self._get_table_attributes_sql(attributes)))
+
+    def _get_columns(self, cur, table_name):
+        """
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :return: {column_name: sql_type}, in the table's column order
+        """
+        self._catalog_query_count += 1
+        cur.execute(sql.SQL('''
+            SELECT column_name, data_type, character_maximum_length FROM information_schema.columns
+            WHERE table_schema = {} AND table_name = {}
+            ORDER BY ordinal_position;
+        ''').format(
+            sql.Literal(self.postgres_schema),
+            sql.Literal(table_name)))
+
+        columns = {}
+        for column_name, data_type, max_length in cur.fetchall():
+            if _is_varchar_type(data_type):
+                data_type = 'varchar({})'.format(max_length)
+            columns[column_name] = data_type
+
+        return columns
+
+    def _add_pending_columns(self, cur, table_name):
+        """
+        Add the columns planned for an existing table: either one `ALTER TABLE` per column (Redshift only adds one
+        column per statement), or, with at least `rebuild_table_column_threshold` columns, by rebuilding the table,
+        unless views depend on it.
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :return: None
+        """
+        columns = self._pending_columns.pop(table_name)
+
+        if self.rebuild_table_column_threshold and len(columns) >= self.rebuild_table_column_threshold \
+                and self._can_rebuild_table(cur, table_name):
+            self._rebuild_table(cur, table_name, columns)
+        else:
+            for column_name, sql_type in columns.items():
+                cur.execute(sql.SQL('ALTER TABLE {}.{} ADD COLUMN {};').format(
+                    sql.Identifier(self.postgres_schema),
+                    sql.Identifier(table_name),
+                    self._get_column_definition_sql(column_name, sql_type, self._get_column_encoding(sql_type))))
+
+        self.schema_cache.invalidate_table_schema(table_name)
+
+    def _get_dependent_views(self, cur, table_name):
+        """
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :return: [string, ...], `schema.view` for each view which would be dropped along with `table_name`. Late
+                 binding views are not bound to the table, so are not included.
+        """
+        cur.execute(sql.SQL('''
+            SELECT DISTINCT view_namespace.nspname, view_class.relname
+            FROM pg_depend
+            JOIN pg_rewrite ON pg_depend.objid = pg_rewrite.oid
+            JOIN pg_class AS view_class ON pg_rewrite.ev_class = view_class.oid
+            JOIN pg_namespace AS view_namespace ON view_class.relnamespace = view_namespace.oid
+            WHERE pg_depend.refobjid = {}::regclass
+              AND view_class.oid != pg_depend.refobjid
+            ORDER BY 1, 2;
+        ''').format(
+            sql.Literal('"{}"."{}"'.format(self.postgres_schema, table_name))))
+
+        return ['{}.{}'.format(schema_name, view_name) for schema_name, view_name in cur.fetchall()]
+
+    def _can_rebuild_table(self, cur, table_name):
+        dependent_views = self._get_dependent_views(cur, table_name)
+        if dependent_views:
+            self.LOGGER.warning('Not rebuilding table `{}`, as views depend on it: {}. '
+                                'Adding its columns one at a time instead'.format(table_name,
+                                                                                  ', '.join(dependent_views)))
+            return False
+
+        return True
+
+    def _rebuild_table(self, cur, table_name, new_columns):
+        """
+        Replace `table_name` with a deep copy which includes `new_columns`, in a handful of statements however many
+        columns are added. The copy is created with the same attributes and encodings as a new table, as `CREATE
+        TABLE ... AS` would not keep them.
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :param new_columns: {column_name: sql_type}
+        :return: None
+        """
+        existing_columns = self._get_columns(cur, table_name)
+        columns = dict(existing_columns)
+        columns.update(new_columns)
+
+        self.LOGGER.warning('Rebuilding table `{}` to add {} columns. Grants on the table are not kept'.format(
+            table_name,
+            len(new_columns)))
+
+        rebuilt_table_name = 'tmp_' + str(uuid.uuid4()).replace('-', '_')
+        metadata = self._get_cached_table_metadata(cur, table_name)
+        self._create_table(cur, rebuilt_table_name, tuple(metadata.get('path') or (table_name,)), metadata, columns)
+
+        existing_columns_sql = sql.SQL(', ').join(map(sql.Identifier, existing_columns.keys()))
+        cur.execute(sql.SQL('INSERT INTO {0}.{1} ({2}) SELECT {2} FROM {0}.{3};').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(rebuilt_table_name),
+            existing_columns_sql,
+            sql.Identifier(table_name)))
+        cur.execute(sql.SQL('DROP TABLE {}.{};').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(table_name)))
+        cur.execute(sql.SQL('ALTER TABLE {}.{} RENAME TO {};').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(rebuilt_table_name),
+            sql.Identifier(table_name)))
+
+        ## The rebuilt table has no comment
+        self._unwritten_metadata.add(table_name)
 
     def sql_type_to_json_schema(self, sql_type, is_nullable):
         if sql_type == 'character varying':
@@ -136,8 +1072,420 @@ class RedshiftTarget(PostgresTarget):
         self.LOGGER.info('add_column({}, {}, {})'.format(
             table_name, column_name, column_schema
         ))
-        PostgresTarget.add_column(self, cur, table_name, column_name, column_schema)
+        sql_type = self.json_schema_to_sql_type(self._size_column_schema(column_schema))
+
+        if table_name in self._pending_tables:
+            self._pending_tables[table_name]['columns'][column_name] = sql_type
+        elif self._planning_schema:
+            self._pending_columns.setdefault(table_name, {})[column_name] = sql_type
+        else:
+            cur.execute(sql.SQL('ALTER TABLE {}.{} ADD COLUMN {};').format(
+                sql.Identifier(self.postgres_schema),
+                sql.Identifier(table_name),
+                self._get_column_definition_sql(column_name, sql_type, self._get_column_encoding(sql_type))))
+
+        self.schema_cache.invalidate_table_schema(table_name)
+
+    def migrate_column(self, cur, table_name, from_column, to_column):
+        ## A pending table has no rows to migrate
+        if table_name not in self._pending_tables:
+            if table_name in self._pending_columns:
+                self._add_pending_columns(cur, table_name)
+            PostgresTarget.migrate_column(self, cur, table_name, from_column, to_column)
+
+    def drop_column(self, cur, table_name, column_name):
+        if table_name in self._pending_tables:
+            del self._pending_tables[table_name]['columns'][column_name]
+        else:
+            if table_name in self._pending_columns:
+                self._add_pending_columns(cur, table_name)
+            PostgresTarget.drop_column(self, cur, table_name, column_name)
+        self.schema_cache.invalidate_table_schema(table_name)
+
+    def make_column_nullable(self, cur, table_name, column_name):
+        ## Columns of pending tables are all created nullable
+        if table_name not in self._pending_tables:
+            PostgresTarget.make_column_nullable(self, cur, table_name, column_name)
+        self.schema_cache.invalidate_table_schema(table_name)
+
+
+    def _get_staging_file_count(self, cur):
+        """
+        Number of files each batch is sharded into for COPY. `"auto"` resolves to the number of slices in the
+        cluster, so that every slice loads a file in parallel.
+        :param cur: Pscyopg.Cursor
+        :return: integer
+        """
+        if self.staging_file_count != STAGING_FILE_COUNT_AUTO:
+            return self.staging_file_count
+
+        if self._slice_count is None:
+            self._catalog_query_count += 1
+            cur.execute('SELECT COUNT(*) FROM stv_slices;')
+            self._slice_count = max(cur.fetchone()[0], 1)
+            self.LOGGER.info('Staging batches as {} files, one per cluster slice'.format(self._slice_count))
+
+        return self._slice_count
+
+    def _get_subkeys(self, columns):
+        pattern = re.compile(SINGER_LEVEL.format('[0-9]+'))
+        return list(filter(lambda header: re.match(pattern, header) is not None, columns))
+
+    def _table_metrics_tags(self, remote_schema):
+        tags = {'stream': remote_schema['path'][0],
+                'path': remote_schema['path'],
+                'table': remote_schema['name']}
+        tags.update(self.metrics_tags())
+
+        return tags
+
+    def _get_serialization_plan(self, remote_schema, streamed_schema):
+        """
+        Everything `_serialize_table_records` works out per column, rather than per value. Plans are cached for as
+        long as the remote table's mappings and the streamed schema are unchanged.
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param streamed_schema: TABLE_SCHEMA(local)
+        :return: {'null_default': value,
+                  'default_row': {field: null_default, ...},
+                  'columns': [(path, is_datetime, default), ...],
+                  'fields': {(path, json_schema_string_type, is_datetime): field}}, filled in as values are seen
+        """
+        properties = streamed_schema['schema']['properties']
+        key = json.dumps([remote_schema['name'],
+                          sorted(remote_schema['schema']['properties'].keys()),
+                          remote_schema.get('mappings', {}),
+                          [[list(path), properties[path]] for path in properties]],
+                         sort_keys=True,
+                         default=str)
+
+        plan = self._serialization_plans.get(key)
+        if plan is None:
+            columns = []
+            for column_path, column_schema in properties.items():
+                is_datetime = False
+                default = None
+                for sub_schema in column_schema['anyOf']:
+                    if json_schema.is_datetime(sub_schema):
+                        is_datetime = True
+                    if sub_schema.get('default') is not None:
+                        default = sub_schema.get('default')
+                columns.append((column_path, is_datetime, default))
+
+            null_default = self.serialize_table_record_null_value(remote_schema, streamed_schema, None, None)
+            plan = {'null_default': null_default,
+                    'default_row': {field: null_default for field in remote_schema['schema']['properties']},
+                    'columns': columns,
+                    'fields': {}}
+
+            if len(self._serialization_plans) >= MAX_SERIALIZATION_PLANS:
+                self._serialization_plans.clear()
+            self._serialization_plans[key] = plan
+
+        return plan
+
+    def _serialize_table_records(self, remote_schema, streamed_schema, records):
+        """
+        Mirrors `SQLInterface._serialize_table_records`, using a plan compiled once per table schema, so that per
+        value only the remote field has to be looked up, by the value's type.
+        """
+        with self.metrics.job_timer('serialize', self._table_metrics_tags(remote_schema)):
+            plan = self._get_serialization_plan(remote_schema, streamed_schema)
+            null_default = plan['null_default']
+            default_row = plan['default_row']
+            columns = plan['columns']
+            fields = plan['fields']
+
+            serialized_rows = []
+            for record in records:
+                row = dict(default_row)
+
+                for path, is_datetime, default in columns:
+                    json_schema_string_type, value = record.get(path, (None, None))
+
+                    ## Serialize fields which are not present but have default values set
+                    if default is not None and value is None:
+                        value = default
+                        json_schema_string_type = json_schema.python_type(value)
+
+                    if not json_schema_string_type:
+                        continue
+
+                    ## Serialize datetime to compatible format
+                    serialize_datetime = is_datetime \
+                                         and json_schema_string_type == json_schema.STRING \
+                                         and value is not None
+                    if serialize_datetime:
+                        value = self.serialize_table_record_datetime_value(remote_schema, streamed_schema, path,
+                                                                           value)
+
+                    field_key = (path, json_schema_string_type, serialize_datetime)
+                    field_name = fields.get(field_key)
+                    if field_name is None:
+                        if serialize_datetime:
+                            value_json_schema = {'type': json_schema.STRING,
+                                                 'format': json_schema.DATE_TIME_FORMAT}
+                        else:
+                            value_json_schema = {'type': json_schema_string_type}
+                        field_name = self._serialize_table_record_field_name(remote_schema, path, value_json_schema)
+                        fields[field_key] = field_name
 
+                    ## Serialize NULL default value
+                    if value is None:
+                        value = null_default
+
+                    ## `field_name` is unset
+                    if row[field_name] == null_default:
+                        row[field_name] = value
+
+                serialized_rows.append(row)
+
+            return serialized_rows
+
+    def serialize_table_record_null_value(self, remote_schema, streamed_schema, field, value):
+        ## Parquet has native NULLs, so does not need the CSV null sentinel
+        if self.staging_format == STAGING_FORMAT_PARQUET:
+            return value
+        return PostgresTarget.serialize_table_record_null_value(self, remote_schema, streamed_schema, field, value)
+
+    def serialize_table_record_datetime_value(self, remote_schema, streamed_schema, field, value):
+        if self.staging_format == STAGING_FORMAT_PARQUET:
+            return _parse_datetime(value).astimezone(timezone.utc)
+        return _format_datetime(_parse_datetime(value))
+
+    def _copy_csv_rows(self, cur, remote_schema, table_name, columns, csv_rows):
+        """
+        Stage `csv_rows` to S3 and COPY them into `table_name`, which is either `remote_schema`'s table, or a temp
+        table to be merged into it.
+        :param cur: Pscyopg.Cursor
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param table_name: string
+        :param columns: [string, ...]
+        :param csv_rows: TransformStream
+        :return: None
+        """
+        key_prefix = table_name + SEPARATOR
+        tags = self._table_metrics_tags(remote_schema)
+        csv_rows = MeteredReadable(csv_rows)
+
+        staging_file_count = self._get_staging_file_count(cur)
+
+        stage_start = time.monotonic()
+
+        if staging_file_count == 1 and self.staging_compression is None:
+            bucket, key = self.s3.persist(csv_rows,
+                                          key_prefix=key_prefix)
+            copy_options = sql.SQL('')
+        else:
+            bucket, key = self.s3.persist_parts(csv_rows,
+                                                key_prefix=key_prefix,
+                                                part_count=staging_file_count,
+                                                compression=self.staging_compression)
+            copy_options = sql.SQL(' MANIFEST')
+            if self.staging_compression:
+                copy_options = sql.SQL(' MANIFEST {}').format(
+                    sql.SQL(_COPY_COMPRESSION_OPTIONS[self.staging_compression]))
+
+        ## Rows are serialized to CSV as the upload reads them, so the time spent doing so is split back out
+        upload_seconds = time.monotonic() - stage_start - csv_rows.seconds
+        self.metrics.job_duration('csv_serialization', csv_rows.seconds, tags)
+        self.metrics.job_duration('s3_upload', upload_seconds, tags)
+        self.metrics.count(BYTES_STAGED, csv_rows.bytes, tags)
+        if upload_seconds > 0:
+            self.metrics.gauge(UPLOAD_THROUGHPUT, csv_rows.bytes / upload_seconds, tags)
+
+        copy_options = sql.SQL(' FORMAT AS CSV NULL AS {}{}').format(sql.Literal(RESERVED_NULL_DEFAULT),
+                                                                     copy_options)
+
+        with self.metrics.job_timer('copy', tags):
+            self._copy_from_s3(cur, table_name, columns, bucket, key, copy_options)
+
+    def _copy_parquet_rows(self, cur, remote_schema, table_name, columns, rows):
+        """
+        Stage `rows` to S3 as Parquet files and COPY them into `table_name`, which is either `remote_schema`'s
+        table, or a temp table to be merged into it.
+        :param cur: Pscyopg.Cursor
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param table_name: string
+        :param columns: [string, ...]
+        :param rows: [{...}, ...], as returned by `_serialize_table_records`
+        :return: None
+        """
+        tags = self._table_metrics_tags(remote_schema)
+        sql_types = [self.json_schema_to_sql_type(remote_schema['schema']['properties'][column])
+                     for column in columns]
+
+        staging_file_count = self._get_staging_file_count(cur)
+
+        with self.metrics.job_timer('parquet_serialization', tags):
+            parquet_files = parquet.write_parquet_files(rows, columns, sql_types, file_count=staging_file_count)
+
+        try:
+            staged_bytes = sum(parquet_file.seek(0, io.SEEK_END) for parquet_file in parquet_files)
+
+            upload_start = time.monotonic()
+            bucket, key = self.s3.persist_files(parquet_files,
+                                                key_prefix=table_name + SEPARATOR,
+                                                extension=parquet.EXTENSION)
+            upload_seconds = time.monotonic() - upload_start
+        finally:
+            for parquet_file in parquet_files:
+                parquet_file.close()
+
+        self.metrics.job_duration('s3_upload', upload_seconds, tags)
+        self.metrics.count(BYTES_STAGED, staged_bytes, tags)
+        if upload_seconds > 0:
+            self.metrics.gauge(UPLOAD_THROUGHPUT, staged_bytes / upload_seconds, tags)
+
+        with self.metrics.job_timer('copy', tags):
+            self._copy_from_s3(cur, table_name, columns, bucket, key, sql.SQL(' FORMAT AS PARQUET MANIFEST'))
+
+    def _should_insert_rows(self, rows):
+        """
+        Whether `rows` are few and small enough that a multi-row `INSERT` is cheaper than the fixed cost of staging
+        them to S3 and COPYing them.
+        :param rows: [{...}, ...]
+        :return: boolean
+        """
+        if not self.insert_batch_max_rows:
+            return False
+
+        if len(rows) > self.insert_batch_max_rows:
+            return False
+
+        ## Approximates the size of the statement, without building it
+        size = 0
+        for row in rows:
+            for value in row.values():
+                size += len(str(value)) + 2
+            if size > self.insert_batch_max_bytes:
+                return False
+
+        return True
+
+    def _insert_rows(self, cur, remote_schema, table_name, columns, rows):
+        """
+        Load `rows` into `table_name` with a single multi-row `INSERT ... VALUES`.
+        :param cur: Pscyopg.Cursor
+        :param remote_schema: TABLE_SCHEMA(remote)
+        :param table_name: string
+        :param columns: [string, ...]
+        :param rows: [{...}, ...], as returned by `_serialize_table_records`
+        :return: None
+        """
+        null_default = self.serialize_table_record_null_value(remote_schema, None, None, None)
+
+        insert_sql = sql.SQL('INSERT INTO {}.{} ({}) VALUES %s').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(map(sql.Identifier, columns)))
+
+        with self.metrics.job_timer('insert', self._table_metrics_tags(remote_schema)):
+            execute_values(cur,
+                           insert_sql.as_string(cur),
+                           [tuple(None if row[column] == null_default else row[column] for column in columns)
+                            for row in rows],
+                           page_size=max(len(rows), 1))
+
+    def _load_rows(self, cur, remote_schema, table_name, columns, rows):
+        if self._should_insert_rows(rows):
+            self._insert_rows(cur, remote_schema, table_name, columns, rows)
+        elif self.staging_format == STAGING_FORMAT_PARQUET:
+            self._copy_parquet_rows(cur, remote_schema, table_name, columns, rows)
+        else:
+            self._copy_csv_rows(cur, remote_schema, table_name, columns, _csv_rows(rows, columns))
+
+    def _get_copy_column_list(self, cur, columns):
+        """
+        Quoting thousands of column identifiers for every COPY is not free, and the columns of a table rarely
+        change, so column lists are compiled once per distinct list.
+        :param cur: Pscyopg.Cursor
+        :param columns: [string, ...]
+        :return: sql.SQL
+        """
+        key = tuple(columns)
+        column_list = self._copy_column_lists.get(key)
+
+        if column_list is None:
+            if len(self._copy_column_lists) >= MAX_COPY_COLUMN_LISTS:
+                self._copy_column_lists.clear()
+
+            column_list = sql.SQL(sql.SQL(', ').join(map(sql.Identifier, columns)).as_string(cur))
+            self._copy_column_lists[key] = column_list
+
+        return column_list
+
+    def _get_copy_authorization(self):
+        if self.s3.iam_role:
+            return sql.SQL('IAM_ROLE {}').format(sql.Literal(self.s3.iam_role))
+
+        ## Fetched for every COPY, as temporary credentials may have been refreshed since the last
+        credentials = self.s3.credentials()
+        aws_session_token = credentials.get('aws_session_token')
+
+        return sql.SQL('CREDENTIALS {}').format(
+            sql.Literal('aws_access_key_id={};aws_secret_access_key={}{}'.format(
+                credentials.get('aws_access_key_id'),
+                credentials.get('aws_secret_access_key'),
+                ";token={}".format(aws_session_token) if aws_session_token else '',
+            )))
+
+    def _copy_from_s3(self, cur, table_name, columns, bucket, key, copy_options):
+        """
+        COPY the file(s) staged at `s3://bucket/key` into `table_name`.
+        :param cur: Pscyopg.Cursor
+        :param table_name: string
+        :param columns: [string, ...]
+        :param bucket: string
+        :param key: string, either the staged file itself or, with `MANIFEST` in `copy_options`, a manifest listing
+                    the staged files
+        :param copy_options: sql.SQL, appended to the `COPY` statement. Includes the format of the staged file(s).
+        :return: None
+        """
+        copy_sql = sql.SQL('COPY {}.{} ({}) FROM {} {}{}').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(table_name),
+            self._get_copy_column_list(cur, columns),
+            sql.Literal('s3://{}/{}'.format(bucket, key)),
+            self._get_copy_authorization(),
+            copy_options)
+
+        self._copied_keys.extend(self.s3.staged_keys(key))
+        cur.execute(copy_sql)
+
+    def write_table_batch(self, cur, table_batch, metadata):
+        remote_schema = table_batch['remote_schema']
+        columns = list(remote_schema['schema']['properties'].keys())
+        key_properties = remote_schema['key_properties']
+        subkeys = self._get_subkeys(columns)
+
+        ## There is nothing to merge against when the table can only be appended to, or is empty (ie, it was just
+        ##  created, or is the first batch of a new table version). Load straight into it, skipping the temp table.
+        if self._get_merge_strategy(key_properties, subkeys) == MERGE_STRATEGY_APPEND:
+            records = table_batch['records']
+        elif self.is_table_empty(cur, remote_schema['name']):
+            records = _dedupe_records(table_batch['records'], self._get_key_columns(remote_schema) + subkeys)
+        else:
+            records = None
+
+        if records is None:
+            temp_table_name = self._create_temp_table(cur, remote_schema)
+            self._load_rows(cur, remote_schema, temp_table_name, columns, table_batch['records'])
+            self._merge_temp_table(cur, remote_schema, temp_table_name, columns)
+        else:
+            self.LOGGER.debug('Loading {} rows directly into `{}`'.format(len(records), remote_schema['name']))
+
+            self._load_rows(cur, remote_schema, remote_schema['name'], columns, records)
+
+        rows_persisted = len(table_batch['records'])
+
+        if rows_persisted:
+            self.schema_cache.set_non_empty(remote_schema['name'])
+
+        self.metrics.count(RECORD_COUNT,
+                           rows_persisted,
+                           dict(self._table_metrics_tags(remote_schema), count_type='rows_loaded'))
+
+        return rows_persisted
 
     def persist_csv_rows(self,
                          cur,
@@ -145,37 +1493,149 @@ class RedshiftTarget(PostgresTarget):
                          temp_table_name,
                          columns,
                          csv_rows):
-        key_prefix = temp_table_name + SEPARATOR
+        self._copy_csv_rows(cur, remote_schema, temp_table_name, columns, csv_rows)
+        self._merge_temp_table(cur, remote_schema, temp_table_name, columns)
 
-        bucket, key = self.s3.persist(csv_rows,
-                                      key_prefix=key_prefix)
+    def _create_temp_table(self, cur, remote_schema):
+        temp_table_name = self.canonicalize_identifier('tmp_' + str(uuid.uuid4()))
+        cur.execute(sql.SQL('CREATE TABLE {schema}.{temp_table} (LIKE {schema}.{table})').format(
+            schema=sql.Identifier(self.postgres_schema),
+            temp_table=sql.Identifier(temp_table_name),
+            table=sql.Identifier(remote_schema['name'])))
 
-        credentials = self.s3.credentials()
-        aws_access_key_id = credentials.get('aws_access_key_id')
-        aws_secret_access_key= credentials.get('aws_secret_access_key')
-        aws_session_token = credentials.get('aws_session_token')
+        return temp_table_name
 
-        copy_sql = sql.SQL('COPY {}.{} ({}) FROM {} CREDENTIALS {} FORMAT AS CSV NULL AS {}').format(
+    def _merge_temp_table(self, cur, remote_schema, temp_table_name, columns):
+        subkeys = self._get_subkeys(columns)
+        key_columns = self._get_key_columns(remote_schema)
+        merge_strategy = self._get_merge_strategy(key_columns, subkeys)
+
+        self.LOGGER.debug('Merging `{}` into `{}` using strategy `{}`'.format(
+            temp_table_name,
+            remote_schema['name'],
+            merge_strategy))
+
+        if merge_strategy == MERGE_STRATEGY_APPEND:
+            update_sql = self._get_append_sql(remote_schema['name'],
+                                              temp_table_name,
+                                              columns)
+        elif merge_strategy == MERGE_STRATEGY_MERGE:
+            update_sql = self._get_merge_sql(remote_schema['name'],
+                                             temp_table_name,
+                                             key_columns,
+                                             columns)
+        else:
+            update_sql = self._get_update_sql(remote_schema['name'],
+                                              temp_table_name,
+                                              key_columns,
+                                              columns,
+                                              subkeys)
+
+        tags = dict(self._table_metrics_tags(remote_schema), merge_strategy=merge_strategy)
+        with self.metrics.job_timer('merge', tags):
+            cur.execute(update_sql)
+
+    def _get_key_columns(self, remote_schema):
+        """
+        :param remote_schema: TABLE_SCHEMA, with its column `mappings`
+        :return: [string, ...], the columns `remote_schema`'s key properties are stored in
+        """
+        return [self.fetch_column_from_path((key_property,), remote_schema)[0]
+                for key_property in remote_schema['key_properties']]
+
+    def _get_merge_strategy(self, key_columns, subkeys):
+        """
+        Pick how a staged batch is merged into its table:
+        - `append`: tables keyed by generated uuids can only ever receive new rows.
+        - `merge`: with `native_merge`, root tables with key properties are upserted with Redshift's `MERGE`.
+        - `delete_insert`: otherwise, and for subtables of keyed streams, which replace _all_ rows for each updated
+          parent (which `MERGE` on `(key_columns + subkeys)` cannot express), the `DELETE ... USING` / `INSERT`
+          from Postgres.
+        :param key_columns: [string, ...]
+        :param subkeys: [string, ...]
+        :return: string
+        """
+        if list(key_columns) in _APPEND_ONLY_KEY_PROPERTIES:
+            return MERGE_STRATEGY_APPEND
+
+        if self.native_merge and not subkeys:
+            return MERGE_STRATEGY_MERGE
+
+        return MERGE_STRATEGY_DELETE_INSERT
+
+    def _get_append_sql(self, target_table_name, temp_table_name, columns):
+        ## NOTE: `ALTER TABLE APPEND` would avoid copying the rows, but cannot be run inside the batch's transaction
+        full_table_name = sql.SQL('{}.{}').format(
             sql.Identifier(self.postgres_schema),
-            sql.Identifier(temp_table_name),
-            sql.SQL(', ').join(map(sql.Identifier, columns)),
-            sql.Literal('s3://{}/{}'.format(bucket, key)),
-            sql.Literal('aws_access_key_id={};aws_secret_access_key={}{}'.format(
-                aws_access_key_id,
-                aws_secret_access_key,
-                ";token={}".format(aws_session_token) if aws_session_token else '',
-            )),
-            sql.Literal(RESERVED_NULL_DEFAULT))
+            sql.Identifier(target_table_name))
+        full_temp_table_name = sql.SQL('{}.{}').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(temp_table_name))
+        insert_columns = sql.SQL(', ').join(map(sql.Identifier, columns))
 
-        cur.execute(copy_sql)
+        return sql.SQL('''
+            INSERT INTO {table}({insert_columns}) (
+                SELECT {insert_columns}
+                FROM {temp_table}
+            );
+            DROP TABLE {temp_table};
+            ''').format(table=full_table_name,
+                        temp_table=full_temp_table_name,
+                        insert_columns=insert_columns)
 
-        pattern = re.compile(SINGER_LEVEL.format('[0-9]+'))
-        subkeys = list(filter(lambda header: re.match(pattern, header) is not None, columns))
+    def _get_merge_sql(self, target_table_name, temp_table_name, key_columns, columns):
+        full_table_name = sql.SQL('{}.{}').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(target_table_name))
+        full_temp_table_name = sql.SQL('{}.{}').format(
+            sql.Identifier(self.postgres_schema),
+            sql.Identifier(temp_table_name))
+        ## `MERGE` requires at most one source row per target row, and cannot conditionally update, so the batch is
+        ##  first reduced to the latest row per key which is not older than the row already in the table
+        merge_source_table_name = sql.Identifier(temp_table_name + SEPARATOR + 'merge')
+        sequence = sql.Identifier(SINGER_SEQUENCE)
+
+        pk_partition = sql.SQL(', ').join(
+            sql.SQL('{}.{}').format(full_temp_table_name, sql.Identifier(pk)) for pk in key_columns)
+        pk_where = sql.SQL(' AND ').join(
+            sql.SQL('{table}.{pk} = "dedupped".{pk}').format(table=full_table_name, pk=sql.Identifier(pk))
+            for pk in key_columns)
+        pk_null = sql.SQL(' AND ').join(
+            sql.SQL('{table}.{pk} IS NULL').format(table=full_table_name, pk=sql.Identifier(pk))
+            for pk in key_columns)
 
-        update_sql = self._get_update_sql(remote_schema['name'],
-                                          temp_table_name,
-                                          remote_schema['key_properties'],
-                                          columns,
-                                          subkeys)
+        insert_columns = sql.SQL(', ').join(map(sql.Identifier, columns))
+        dedupped_columns = sql.SQL(', ').join(
+            sql.SQL('"dedupped".{}').format(sql.Identifier(column)) for column in columns)
+        update_columns = sql.SQL(', ').join(
+            sql.SQL('{column} = "dedupped".{column}').format(column=sql.Identifier(column))
+            for column in columns if column not in key_columns)
 
-        cur.execute(update_sql)
+        return sql.SQL('''
+            CREATE TEMP TABLE {merge_source} AS (
+                SELECT {dedupped_columns}
+                FROM (
+                    SELECT *,
+                           ROW_NUMBER() OVER (PARTITION BY {pk_partition}
+                                              ORDER BY {temp_table}.{sequence} DESC) AS "pk_ranked"
+                    FROM {temp_table}) AS "dedupped"
+                LEFT JOIN {table} ON {pk_where}
+                WHERE "dedupped"."pk_ranked" = 1
+                  AND ({pk_null} OR "dedupped".{sequence} >= {table}.{sequence})
+            );
+            MERGE INTO {table}
+            USING {merge_source} AS "dedupped" ON {pk_where}
+            WHEN MATCHED THEN UPDATE SET {update_columns}
+            WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({dedupped_columns});
+            DROP TABLE {merge_source};
+            DROP TABLE {temp_table};
+            ''').format(table=full_table_name,
+                        temp_table=full_temp_table_name,
+                        merge_source=merge_source_table_name,
+                        sequence=sequence,
+                        pk_partition=pk_partition,
+                        pk_where=pk_where,
+                        pk_null=pk_null,
+                        insert_columns=insert_columns,
+                        dedupped_columns=dedupped_columns,
+                        update_columns=update_columns)
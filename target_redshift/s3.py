@@ -1,9 +1,34 @@
+from datetime import datetime, timedelta, timezone
+import gzip
+import io
+import json
+import queue
+import tempfile
+import threading
 import uuid
 
 import boto3
+import singer
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
+
+from target_redshift.credentials import assume_role_session, DEFAULT_ROLE_DURATION_SECONDS, frozen_credentials
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOGGER = singer.get_logger()
 
 SEPARATOR = '__'
 
+## `DeleteObjects` accepts at most 1000 keys per request
+MAX_DELETE_KEYS = 1000
+
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_ZSTD = 'zstd'
+COMPRESSIONS = (COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
 
 class S3:
     def __init__(
@@ -12,21 +37,66 @@ class S3:
         aws_secret_access_key,
         bucket,
         key_prefix='',
-        aws_session_token=None
+        aws_session_token=None,
+        multipart_threshold=None,
+        multipart_chunksize=None,
+        max_concurrency=None,
+        use_threads=None,
+        assume_role_arn=None,
+        assume_role_duration_seconds=DEFAULT_ROLE_DURATION_SECONDS,
+        iam_role=None
     ):
-        self._credentials = {'aws_access_key_id': aws_access_key_id,
-                             'aws_secret_access_key': aws_secret_access_key,
-                             'aws_session_token': aws_session_token}
-        self.client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            aws_session_token=aws_session_token)
+        """
+        :param aws_access_key_id: [optional] with `aws_secret_access_key` (and `aws_session_token`), the
+                                  credentials to upload with. When not set, boto3's default credential chain (eg,
+                                  environment variables or an instance profile) is used.
+        :param assume_role_arn: [optional] role to assume with the above credentials, and to upload with. The
+                                role's credentials are refreshed before they expire.
+        :param iam_role: [optional] ARN of a role associated with the Redshift cluster, which COPY uses to read
+                         staged files, instead of the credentials used to upload them.
+        """
+        session = boto3.Session(aws_access_key_id=aws_access_key_id,
+                                aws_secret_access_key=aws_secret_access_key,
+                                aws_session_token=aws_session_token)
+        if assume_role_arn:
+            session = assume_role_session(session, assume_role_arn, duration_seconds=assume_role_duration_seconds)
+
+        self.session = session
+        self.client = session.client('s3')
+        self.iam_role = iam_role
         self.bucket = bucket
+        self._staged_keys = {}
+        self._staged_keys_lock = threading.Lock()
         self.key_prefix = key_prefix
 
+        ## Only override boto3's defaults for values which have been configured
+        transfer_config = {'multipart_threshold': multipart_threshold,
+                           'multipart_chunksize': multipart_chunksize,
+                           'max_concurrency': max_concurrency,
+                           'use_threads': use_threads}
+        self.transfer_config = TransferConfig(**{k: v for k, v in transfer_config.items() if v is not None})
+
     def credentials(self):
-        return self._credentials
+        """
+        Credentials COPY can use to read staged files. Fetched on each call, so that refreshed credentials are
+        picked up during long runs.
+        :return: {'aws_access_key_id': string, 'aws_secret_access_key': string, 'aws_session_token': string or None}
+        """
+        return frozen_credentials(self.session)
+
+    def staged_keys(self, key):
+        """
+        Every key uploaded by the `persist*` call which returned `key`, such as the parts listed in a manifest
+        along with the manifest itself. Each call's keys are only returned once.
+        :param key: string
+        :return: [string, ...]
+        """
+        with self._staged_keys_lock:
+            return self._staged_keys.pop(key, [key])
+
+    def _record_staged_keys(self, key, keys):
+        with self._staged_keys_lock:
+            self._staged_keys[key] = keys
 
     def persist(self, readable, key_prefix=''):
         key = self.key_prefix + key_prefix + str(uuid.uuid4()).replace('-', '')
@@ -34,27 +104,283 @@ class S3:
         self.client.upload_fileobj(
             _EncodeBinaryReadable(readable),
             self.bucket,
-            key)
+            key,
+            Config=self.transfer_config)
+
+        self._record_staged_keys(key, [key])
 
         return [self.bucket, key]
 
+    def persist_parts(self, readable, key_prefix='', part_count=1, compression=None):
+        """
+        Shard `readable` round-robin, chunk by chunk, into `part_count` files, optionally compressing each
+        with `compression`, upload them concurrently, and write a Redshift COPY manifest listing them.
+
+        Parts are spooled to local temporary files so memory use does not grow with the size of the batch.
+
+        :param readable: object whose `read()` returns a `str` chunk, and `''` when exhausted
+        :param key_prefix: string
+        :param part_count: integer
+        :param compression: one of `COMPRESSIONS`, or None
+        :return: [bucket, manifest_key]
+        """
+        key = self.key_prefix + key_prefix + str(uuid.uuid4()).replace('-', '')
+
+        parts = [_StagingPart(compression) for _ in range(max(part_count, 1))]
+        try:
+            i = 0
+            while True:
+                chunk = readable.read()
+                if chunk == '' or chunk is None:
+                    break
+                parts[i % len(parts)].write(chunk.encode('utf-8'))
+                i += 1
+
+            ## Redshift requires at least one entry in a manifest, even when there is nothing to load
+            staged_parts = [part for part in parts if part.chunk_count > 0] or parts[:1]
+
+            return self._persist_manifest(key, [(part.finish(), part.extension) for part in staged_parts])
+        finally:
+            for part in parts:
+                part.close()
+
+    def persist_files(self, fileobjs, key_prefix='', extension=''):
+        """
+        Upload already encoded files, such as Parquet files, concurrently and write a Redshift COPY manifest
+        listing them.
+        :param fileobjs: [binary seekable file object, ...]
+        :param key_prefix: string
+        :param extension: string, appended to each file's key
+        :return: [bucket, manifest_key]
+        """
+        key = self.key_prefix + key_prefix + str(uuid.uuid4()).replace('-', '')
+
+        return self._persist_manifest(key, [(fileobj, extension) for fileobj in fileobjs])
+
+    def _persist_manifest(self, key, files):
+        entries = []
+        part_keys = []
+        with create_transfer_manager(self.client, self.transfer_config) as manager:
+            futures = []
+            for n, (fileobj, extension) in enumerate(files):
+                part_key = '{}.part{:04d}{}'.format(key, n, extension)
+
+                ## COPY requires the size of each file listed in the manifest for columnar formats
+                fileobj.seek(0, io.SEEK_END)
+                content_length = fileobj.tell()
+                fileobj.seek(0)
+
+                futures.append(manager.upload(fileobj, self.bucket, part_key))
+                part_keys.append(part_key)
+                entries.append({'url': 's3://{}/{}'.format(self.bucket, part_key),
+                                'mandatory': True,
+                                'meta': {'content_length': content_length}})
+
+            for future in futures:
+                future.result()
+
+        manifest_key = key + '.manifest'
+        self.client.put_object(Bucket=self.bucket,
+                               Key=manifest_key,
+                               Body=json.dumps({'entries': entries}).encode('utf-8'))
+
+        self._record_staged_keys(manifest_key, part_keys + [manifest_key])
+
+        return [self.bucket, manifest_key]
+
+
+class StagedObjectCleaner:
+    """
+    Deletes staged objects on a background thread, so that loading the next batch does not wait on S3.
+
+    Keys are batched into `DeleteObjects` requests of up to `MAX_DELETE_KEYS` keys. Failing to delete an object
+    is logged and otherwise ignored: it is only garbage left behind in the staging bucket.
+    """
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='staged-object-cleaner', daemon=True)
+        self._thread.start()
+
+    def delete(self, keys):
+        """
+        Schedule `keys` for deletion.
+        :param keys: [string, ...]
+        :return: None
+        """
+        if keys:
+            self._queue.put(list(keys))
+
+    def close(self):
+        """
+        Delete everything scheduled so far, then stop the background thread.
+        :return: None
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def sweep(self, older_than_seconds):
+        """
+        Delete objects under the S3 `key_prefix` last modified more than `older_than_seconds` ago, such as
+        those left behind by runs which crashed before cleaning up. `key_prefix` must be dedicated to staging for
+        this target: anything else under it is deleted too.
+        :param older_than_seconds: number
+        :return: integer, the number of objects scheduled for deletion
+        """
+        if not self.s3.key_prefix:
+            raise ValueError('Refusing to sweep staged objects without a `key_prefix`, '
+                             'which would delete every object in s3://{}'.format(self.s3.bucket))
+
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)
+
+        count = 0
+        paginator = self.s3.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.s3.bucket, Prefix=self.s3.key_prefix):
+            keys = [obj['Key'] for obj in page.get('Contents', []) if obj['LastModified'] < cutoff]
+            self.delete(keys)
+            count += len(keys)
+
+        LOGGER.info('Sweeping {} orphaned staged objects from s3://{}/{}'.format(count,
+                                                                                 self.s3.bucket,
+                                                                                 self.s3.key_prefix))
+        return count
+
+    def _run(self):
+        closed = False
+        while not closed:
+            keys = self._queue.get()
+            if keys is None:
+                closed = True
+                keys = []
+
+            ## Coalesce whatever else is already waiting into as few requests as possible
+            while len(keys) < MAX_DELETE_KEYS and not closed:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    closed = True
+                else:
+                    keys.extend(more)
+
+            for start in range(0, len(keys), MAX_DELETE_KEYS):
+                self._delete_objects(keys[start:start + MAX_DELETE_KEYS])
+
+    def _delete_objects(self, keys):
+        try:
+            response = self.s3.client.delete_objects(
+                Bucket=self.s3.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        except Exception as ex:
+            LOGGER.warning('Failed to delete {} staged objects: {}'.format(len(keys), ex))
+            return
+
+        for error in response.get('Errors', []):
+            LOGGER.warning('Failed to delete staged object `{}`: {}'.format(error.get('Key'), error.get('Message')))
+
+
+class _StagingPart:
+    """
+    A single shard of a staged batch, written (and optionally compressed) to a local temporary file.
+    """
+
+    def __init__(self, compression=None):
+        self.chunk_count = 0
+        self._file = tempfile.TemporaryFile()
+
+        if compression is None:
+            self.extension = ''
+            self._writer = self._file
+        elif compression == COMPRESSION_GZIP:
+            self.extension = '.gz'
+            self._writer = gzip.GzipFile(fileobj=self._file, mode='wb')
+        elif compression == COMPRESSION_ZSTD:
+            if zstandard is None:
+                raise ImportError('`zstandard` is required for `zstd` compression. '
+                                  'Install with `pip install target-redshift[zstd]`.')
+            self.extension = '.zst'
+            self._writer = zstandard.ZstdCompressor().stream_writer(self._file)
+        else:
+            raise ValueError('Unsupported compression `{}`. Expected one of: {}'.format(compression, COMPRESSIONS))
+
+        self._compression = compression
+
+    def write(self, data):
+        self._writer.write(data)
+        self.chunk_count += 1
+
+    def finish(self):
+        """
+        Flush any compressed output and rewind the underlying file for upload.
+        :return: binary file object
+        """
+        if self._compression == COMPRESSION_GZIP:
+            ## Closing a `GzipFile` writes its trailer without closing `fileobj`
+            self._writer.close()
+        elif self._compression == COMPRESSION_ZSTD:
+            self._writer.flush(zstandard.FLUSH_FRAME)
+
+        self._file.seek(0)
+        return self._file
+
+    def close(self):
+        self._file.close()
+
 
 class _EncodeBinaryReadable:
-    def __init__(self, readable_obj):
+    """
+    Adapts a text `readable_obj`, whose `read()` returns an arbitrarily sized `str` chunk (and `''` when
+    exhausted), into a binary file-like object which honors the requested `max_bytes`.
+
+    Reads are serialized with a lock so the object is safe to share between the threads of a multipart upload.
+
+    Encoded bytes are staged in a single `bytearray` which is drained from the front as it is read, so at most
+    `max_bytes` plus one source chunk is held in memory at any point, and the total work is linear in the size
+    of the stream.
+    """
+
+    def __init__(self, readable_obj, encoding='utf-8'):
         self.input = readable_obj
+        self.encoding = encoding
+        self._buffer = bytearray()
+        self._exhausted = False
+        self._lock = threading.Lock()
 
     def readable(self):
         return True
 
-    def read(self, *args, **kwargs):
-        if len(args) > 0:
-            max_bytes = args[0]
-        else:
+    def _fill(self, max_bytes):
+        while not self._exhausted and (max_bytes is None or len(self._buffer) < max_bytes):
+            chunk = self.input.read()
+            if chunk == '' or chunk is None:
+                self._exhausted = True
+            else:
+                self._buffer += chunk.encode(self.encoding)
+
+    def read(self, max_bytes=-1):
+        with self._lock:
+            return self._read(max_bytes)
+
+    def _read(self, max_bytes):
+        if max_bytes is None or max_bytes < 0:
             max_bytes = None
-        output = b''
-        while (max_bytes is not None and len(output) < max_bytes) or True:  ## TODO: overflow?
-            line = self.input.read()
-            if line == '':
-                return output
-            output += line.encode('utf-8')
+
+        self._fill(max_bytes)
+
+        if max_bytes is None or max_bytes >= len(self._buffer):
+            output = bytes(self._buffer)
+            self._buffer.clear()
+            return output
+
+        with memoryview(self._buffer) as view:
+            output = view[:max_bytes].tobytes()
+        ## Deleting from the front of a `bytearray` is amortized constant time
+        del self._buffer[:max_bytes]
         return output
+
+    def readinto(self, b):
+        output = self.read(len(b))
+        b[:len(output)] = output
+        return len(output)
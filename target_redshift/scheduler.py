@@ -0,0 +1,63 @@
+import time
+
+
+class FlushScheduler:
+    """
+    Chooses which streams to flush with a view of every stream's buffer, on top of each stream's own
+    `buffer_full`:
+    - while the records buffered across all streams exceed `max_total_buffer_size` bytes (measured as their JSON
+      lines, like `max_batch_size`), the streams buffering the most are flushed first
+    - streams whose oldest buffered record arrived at least `max_batch_latency_seconds` ago are flushed, oldest
+      first, so that slow streams are still loaded on time
+
+    Streams are only considered when the tracker checks for streams to flush, ie every `batch_detection_threshold`
+    lines.
+    """
+
+    def __init__(self, max_total_buffer_size=None, max_batch_latency_seconds=None, clock=time.monotonic):
+        self.max_total_buffer_size = max_total_buffer_size
+        self.max_batch_latency_seconds = max_batch_latency_seconds
+        self.clock = clock
+        self._sizes = {}
+        self._first_added_at = {}
+
+    def record_added(self, stream, size, buffered_count):
+        """
+        :param stream: string
+        :param size: integer, size of the record's line
+        :param buffered_count: integer, records buffered for `stream`, including this one
+        :return: None
+        """
+        ## The buffer has been flushed since the last record was added
+        if buffered_count <= 1:
+            self._sizes[stream] = 0
+            self._first_added_at[stream] = self.clock()
+
+        self._sizes[stream] += size
+
+    def streams_to_flush(self, streams):
+        """
+        :param streams: {stream: BufferedSingerStream}
+        :return: [stream, ...], in the order they should be flushed
+        """
+        buffered = {stream: stream_buffer for stream, stream_buffer in streams.items() if stream_buffer.count}
+
+        to_flush = [stream for stream, stream_buffer in buffered.items() if stream_buffer.buffer_full]
+
+        if self.max_batch_latency_seconds is not None:
+            now = self.clock()
+            for stream in sorted(buffered, key=lambda s: self._first_added_at.get(s, now)):
+                if stream not in to_flush \
+                        and now - self._first_added_at.get(stream, now) >= self.max_batch_latency_seconds:
+                    to_flush.append(stream)
+
+        if self.max_total_buffer_size is not None:
+            remaining = {stream: self._sizes.get(stream, 0) for stream in buffered if stream not in to_flush}
+            total_size = sum(remaining.values())
+            for stream in sorted(remaining, key=remaining.get, reverse=True):
+                if total_size <= self.max_total_buffer_size:
+                    break
+                to_flush.append(stream)
+                total_size -= remaining[stream]
+
+        return to_flush
@@ -0,0 +1,244 @@
+import threading
+
+
+class SchemaCache:
+    """
+    In-process, write-through cache of what `RedshiftTarget` knows about the remote: the table mappings, each
+    table's metadata (stored as table comments), TABLE_SCHEMA and `varchar` column lengths, and which tables are
+    known to hold rows.
+
+    Entries are only invalidated when the target itself alters a table, so the cache assumes no other process
+    changes the target schema while the target runs. It is safe to share between targets on different threads,
+    each writing through a `SchemaCacheTransaction`. Values are shared rather than copied, so must not be mutated
+    once set, nor once got: only the table mappings, which `target_postgres` adds to in place, are copied.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._table_mappings = None
+            self._metadata = {}
+            self._table_schemas = {}
+            self._varchar_lengths = {}
+            self._non_empty_tables = set()
+
+    def _get(self, entries, key):
+        with self._lock:
+            if key in entries:
+                self.hits += 1
+                return True, entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def _set(self, entries, key, value):
+        with self._lock:
+            entries[key] = value
+
+    def get_table_mappings(self):
+        """
+        :return: a copy of the `{(path, ...): table_name}` dict, or None when not yet loaded
+        """
+        with self._lock:
+            if self._table_mappings is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return dict(self._table_mappings)
+
+    def set_table_mappings(self, table_mappings):
+        with self._lock:
+            self._table_mappings = dict(table_mappings)
+
+    def add_table_mapping(self, from_path, table_name):
+        with self._lock:
+            if self._table_mappings is not None:
+                self._table_mappings[from_path] = table_name
+
+    def get_metadata(self, table_name):
+        return self._get(self._metadata, table_name)
+
+    def set_metadata(self, table_name, metadata):
+        self._set(self._metadata, table_name, metadata)
+
+    def get_table_schema(self, table_name):
+        return self._get(self._table_schemas, table_name)
+
+    def set_table_schema(self, table_name, table_schema):
+        self._set(self._table_schemas, table_name, table_schema)
+
+    def invalidate_table_schema(self, table_name):
+        with self._lock:
+            self._table_schemas.pop(table_name, None)
+            self._varchar_lengths.pop(table_name, None)
+
+    def get_varchar_lengths(self, table_name):
+        return self._get(self._varchar_lengths, table_name)
+
+    def set_varchar_lengths(self, table_name, lengths):
+        self._set(self._varchar_lengths, table_name, lengths)
+
+    def is_non_empty(self, table_name):
+        with self._lock:
+            if table_name in self._non_empty_tables:
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+    def set_non_empty(self, table_name):
+        with self._lock:
+            self._non_empty_tables.add(table_name)
+
+
+class SchemaCacheTransaction:
+    """
+    A target's view of a shared `SchemaCache` while it has a transaction open. What the target writes through is
+    only seen by the target itself until `commit`, once the transaction has committed, so that other targets
+    sharing the cache never see the state of a transaction which may yet roll back. `rollback` discards it.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._hits = 0
+        self._misses = 0
+        self._reset()
+
+    @property
+    def hits(self):
+        return self._hits + self.cache.hits
+
+    @property
+    def misses(self):
+        return self._misses + self.cache.misses
+
+    def _reset(self):
+        self._cleared = False
+        self._table_mappings = None
+        self._added_table_mappings = {}
+        self._metadata = {}
+        self._table_schemas = {}
+        self._varchar_lengths = {}
+        self._invalidated_tables = set()
+        self._non_empty_tables = set()
+
+    def commit(self):
+        """
+        Publish everything written through since the last `commit` or `rollback` to the shared cache.
+        :return: None
+        """
+        if self._cleared:
+            self.cache.clear()
+        if self._table_mappings is not None:
+            self.cache.set_table_mappings(self._table_mappings)
+        for from_path, table_name in self._added_table_mappings.items():
+            self.cache.add_table_mapping(from_path, table_name)
+        for table_name in self._invalidated_tables:
+            self.cache.invalidate_table_schema(table_name)
+        for table_name, metadata in self._metadata.items():
+            self.cache.set_metadata(table_name, metadata)
+        for table_name, table_schema in self._table_schemas.items():
+            self.cache.set_table_schema(table_name, table_schema)
+        for table_name, lengths in self._varchar_lengths.items():
+            self.cache.set_varchar_lengths(table_name, lengths)
+        for table_name in self._non_empty_tables:
+            self.cache.set_non_empty(table_name)
+
+        self._reset()
+
+    def rollback(self):
+        """
+        Discard everything written through since the last `commit` or `rollback`.
+        :return: None
+        """
+        self._reset()
+
+    def clear(self):
+        self._reset()
+        self._cleared = True
+
+    def _get(self, entries, key, get_shared, invalidated=False):
+        if key in entries:
+            self._hits += 1
+            return True, entries[key]
+
+        if self._cleared or invalidated:
+            self._misses += 1
+            return False, None
+
+        return get_shared(key)
+
+    def get_table_mappings(self):
+        if self._table_mappings is not None:
+            self._hits += 1
+            return dict(self._table_mappings)
+
+        if self._cleared:
+            self._misses += 1
+            return None
+
+        table_mappings = self.cache.get_table_mappings()
+        if table_mappings is not None:
+            table_mappings.update(self._added_table_mappings)
+
+        return table_mappings
+
+    def set_table_mappings(self, table_mappings):
+        self._table_mappings = dict(table_mappings)
+        self._added_table_mappings = {}
+
+    def add_table_mapping(self, from_path, table_name):
+        if self._table_mappings is not None:
+            self._table_mappings[from_path] = table_name
+        elif not self._cleared:
+            self._added_table_mappings[from_path] = table_name
+
+    def get_metadata(self, table_name):
+        return self._get(self._metadata, table_name, self.cache.get_metadata)
+
+    def set_metadata(self, table_name, metadata):
+        self._metadata[table_name] = metadata
+
+    def get_table_schema(self, table_name):
+        return self._get(self._table_schemas,
+                         table_name,
+                         self.cache.get_table_schema,
+                         table_name in self._invalidated_tables)
+
+    def set_table_schema(self, table_name, table_schema):
+        self._table_schemas[table_name] = table_schema
+
+    def invalidate_table_schema(self, table_name):
+        self._table_schemas.pop(table_name, None)
+        self._varchar_lengths.pop(table_name, None)
+        self._invalidated_tables.add(table_name)
+
+    def get_varchar_lengths(self, table_name):
+        return self._get(self._varchar_lengths,
+                         table_name,
+                         self.cache.get_varchar_lengths,
+                         table_name in self._invalidated_tables)
+
+    def set_varchar_lengths(self, table_name, lengths):
+        self._varchar_lengths[table_name] = lengths
+
+    def is_non_empty(self, table_name):
+        if table_name in self._non_empty_tables:
+            self._hits += 1
+            return True
+
+        if self._cleared:
+            self._misses += 1
+            return False
+
+        return self.cache.is_non_empty(table_name)
+
+    def set_non_empty(self, table_name):
+        self._non_empty_tables.add(table_name)
@@ -0,0 +1,94 @@
+from target_postgres.singer_stream import get_line_size
+from target_postgres.stream_tracker import StreamTracker
+
+from target_redshift.pipeline import BufferedBatch
+
+
+class ScheduledStreamTracker(StreamTracker):
+    """
+    `StreamTracker` which, when given a `FlushScheduler`, lets it choose which streams to flush from all of the
+    streams' buffers, rather than from each stream's `buffer_full` alone.
+    """
+
+    def __init__(self, target, emit_states, scheduler=None):
+        StreamTracker.__init__(self, target, emit_states)
+        self.scheduler = scheduler
+
+    def handle_record_message(self, stream, line_data):
+        stream_buffer = self.streams.get(stream)
+        count = stream_buffer.count if stream_buffer else None
+
+        StreamTracker.handle_record_message(self, stream, line_data)
+
+        if self.scheduler and stream_buffer.count != count:
+            self.scheduler.record_added(stream, get_line_size(line_data), stream_buffer.count)
+
+    def _streams_to_flush(self, force):
+        if force:
+            return list(self.streams.keys())
+
+        if self.scheduler:
+            return self.scheduler.streams_to_flush(self.streams)
+
+        return [stream for (stream, stream_buffer) in self.streams.items() if stream_buffer.buffer_full]
+
+    def flush_streams(self, force=False):
+        for stream in self._streams_to_flush(force):
+            self._write_batch_and_update_watermarks(stream)
+
+        self._emit_safe_queued_states(force=force)
+
+
+class PipelinedStreamTracker(ScheduledStreamTracker):
+    """
+    `StreamTracker` which hands batches off to one of `pipelines` instead of writing them inline.
+
+    Each stream is pinned to a single pipeline (assigned round-robin as streams are first flushed), so batches for
+    a stream are always written in order, while distinct streams pinned to distinct pipelines load concurrently.
+
+    A stream's flush watermark only advances once its pipeline has committed its batch, so STATE messages are
+    still only emitted after every record which preceded them has been persisted.
+    """
+
+    def __init__(self, target, emit_states, pipelines, scheduler=None):
+        ScheduledStreamTracker.__init__(self, target, emit_states, scheduler=scheduler)
+        self.pipelines = pipelines
+        self.stream_pipelines = {}
+
+    def _get_pipeline(self, stream):
+        if stream not in self.stream_pipelines:
+            self.stream_pipelines[stream] = self.pipelines[len(self.stream_pipelines) % len(self.pipelines)]
+
+        return self.stream_pipelines[stream]
+
+    def join(self):
+        for pipeline in self.pipelines:
+            pipeline.join()
+
+    def flush_stream(self, stream):
+        ## Callers (ie, `ACTIVATE_VERSION`) expect the stream to be fully persisted, and the target's connection to
+        ## be idle, on return
+        self._write_batch_and_update_watermarks(stream)
+        self.join()
+        self._emit_safe_queued_states()
+
+    def flush_streams(self, force=False):
+        for stream in self._streams_to_flush(force):
+            self._write_batch_and_update_watermarks(stream)
+
+        if force:
+            self.join()
+
+        self._emit_safe_queued_states(force=force)
+
+    def _write_batch_and_update_watermarks(self, stream):
+        stream_buffer = self.streams[stream]
+        batch = BufferedBatch(stream_buffer)
+        stream_buffer.flush_buffer()
+
+        watermark = self.stream_add_watermarks.get(stream, 0)
+
+        def on_commit():
+            self.stream_flush_watermarks[stream] = watermark
+
+        self._get_pipeline(stream).submit(batch, on_commit)
@@ -0,0 +1,307 @@
+import multiprocessing
+import sys
+
+import singer
+from target_postgres import target_tools
+from target_postgres.exceptions import TargetError
+from target_postgres.singer_stream import RAW_LINE_SIZE
+
+from target_redshift.buffer import BufferBudget, CompiledSingerStream, SpillingSingerStream
+from target_redshift.json_decoder import get_decoder, loads_json
+from target_redshift.pipeline import FlushPipeline
+from target_redshift.prepare import DEFAULT_CHUNK_SIZE, LinePreparer
+from target_redshift.scheduler import FlushScheduler
+from target_redshift.stream_tracker import PipelinedStreamTracker, ScheduledStreamTracker
+from target_redshift.validators import CompiledSchema, ValidatorCache
+
+LOGGER = singer.get_logger()
+
+## Most reads of a pipe return less, ie whatever the tap has written so far
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def main(target, config, additional_targets=None):
+    """
+    Given a target, stream stdin input as lines of UTF-8 bytes.
+    :param target: object which implements `write_batch` and `activate_version`
+    :param config: configuration for buffers etc.
+    :param additional_targets: [optional] see `stream_to_target`
+    :return: None
+    """
+    input_stream = read_lines(sys.stdin.buffer)
+    stream_to_target(input_stream, target, config=config, additional_targets=additional_targets)
+
+    return None
+
+
+def read_lines(binary_stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    Split `binary_stream` into lines, reading it in chunks of up to `chunk_size` bytes rather than a line at a time,
+    and without decoding it to text. Lines keep their line ending, as when iterating a text stream.
+    :param binary_stream: buffered binary stream, eg `sys.stdin.buffer`
+    :param chunk_size: integer
+    :return: iterator of bytes
+    """
+    ## Parts of the line spanning the chunks read so far
+    partial = []
+    while True:
+        chunk = binary_stream.read1(chunk_size)
+        if not chunk:
+            break
+
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            partial.append(chunk)
+            continue
+
+        if partial:
+            partial.append(chunk[:end])
+            lines = b''.join(partial)
+        else:
+            lines = chunk[:end]
+        partial = [chunk[end:]] if end < len(chunk) else []
+
+        ## JSON strings can not hold an unescaped `\r` or `\n`, so these only ever end lines
+        yield from lines.splitlines(keepends=True)
+
+    if partial:
+        yield b''.join(partial)
+
+
+def stream_to_target(stream, target, config={}, additional_targets=None):
+    """
+    Persist `stream` to `target` with optional `config`.
+
+    Mirrors `target_postgres.target_tools.stream_to_target`, additionally supporting writing batches through
+    background `FlushPipeline`s when `max_pending_batches` is configured, or when `additional_targets` are given,
+    spilling buffered records to disk when `max_buffer_memory` is configured, and flushing streams chosen by a
+    `FlushScheduler` when `max_total_buffer_size` or `max_batch_latency_seconds` are configured. Lines are
+    decoded and validated by a `LinePreparer` when `prepare_processes` is configured, and are decoded with the
+    `json_decoder` backend. Validators are built once per distinct schema, and repeated SCHEMA messages are
+    ignored.
+
+    :param stream: iterator which represents a Singer data stream, as strings or UTF-8 bytes
+    :param target: object which implements `write_batch` and `activate_version`
+    :param config: [optional] configuration for buffers etc.
+    :param additional_targets: [optional] targets, each with their own connection, used to write batches for
+                               distinct streams concurrently with `target`
+    :return: None
+    """
+
+    state_support = config.get('state_support', True)
+    additional_targets = additional_targets or []
+    max_pending_batches = config.get('max_pending_batches', 0)
+    if additional_targets:
+        max_pending_batches = max(max_pending_batches, 1)
+
+    scheduler = None
+    if config.get('max_total_buffer_size') or config.get('max_batch_latency_seconds') is not None:
+        scheduler = FlushScheduler(max_total_buffer_size=config.get('max_total_buffer_size'),
+                                   max_batch_latency_seconds=config.get('max_batch_latency_seconds'))
+
+    pipelines = []
+    if max_pending_batches:
+        pipelines = [FlushPipeline(pipeline_target, max_pending_batches=max_pending_batches)
+                     for pipeline_target in [target] + additional_targets]
+        state_tracker = PipelinedStreamTracker(target, state_support, pipelines, scheduler=scheduler)
+    else:
+        state_tracker = ScheduledStreamTracker(target, state_support, scheduler=scheduler)
+
+    target_tools._run_sql_hook('before_run_sql', config, target)
+
+    preparer = None
+    try:
+        if not config.get('disable_collection', False):
+            target_tools._async_send_usage_stats()
+
+        invalid_records_detect = config.get('invalid_records_detect')
+        invalid_records_threshold = config.get('invalid_records_threshold')
+        max_batch_rows = config.get('max_batch_rows', 200000)
+        max_batch_size = config.get('max_batch_size', 104857600)  # 100MB
+        batch_detection_threshold = config.get('batch_detection_threshold', max(max_batch_rows / 40, 50))
+
+        buffer_budget = None
+        if config.get('max_buffer_memory'):
+            buffer_budget = BufferBudget(config['max_buffer_memory'], directory=config.get('spill_directory'))
+
+        json_decoder = config.get('json_decoder')
+        decoder = get_decoder(json_decoder)
+        validator_cache = ValidatorCache()
+
+        ## Workers only pay for sending lines to them, and decoded lines back, when they have cores to themselves
+        prepare_processes = min(config.get('prepare_processes') or 0, multiprocessing.cpu_count() - 1)
+        if config.get('prepare_processes') and not prepare_processes:
+            LOGGER.warning('`prepare_processes` ignored: no cores to spare, so lines are decoded in-process')
+
+        if prepare_processes:
+            preparer = LinePreparer(prepare_processes,
+                                    chunk_size=config.get('prepare_chunk_size', DEFAULT_CHUNK_SIZE),
+                                    json_decoder=json_decoder)
+            prepared_lines = preparer.prepare(stream)
+        else:
+            prepared_lines = ((line, None) for line in stream)
+
+        line_count = 0
+        for line, prepared_line in prepared_lines:
+            _line_handler(state_tracker,
+                          target,
+                          invalid_records_detect,
+                          invalid_records_threshold,
+                          max_batch_rows,
+                          max_batch_size,
+                          line,
+                          buffer_budget=buffer_budget,
+                          prepared_line=prepared_line,
+                          decoder=decoder,
+                          validator_cache=validator_cache
+                          )
+            if line_count > 0 and line_count % batch_detection_threshold == 0:
+                state_tracker.flush_streams()
+            line_count += 1
+
+        state_tracker.flush_streams(force=True)
+        target_tools._run_sql_hook('after_run_sql', config, target)
+
+        return None
+
+    except Exception as e:
+        LOGGER.critical(e)
+        raise e
+    finally:
+        if preparer:
+            preparer.close()
+        for pipeline in pipelines:
+            pipeline.close()
+        target_tools._report_invalid_records(state_tracker.streams)
+
+
+class _PreparedValidator:
+    """
+    Stands in for a stream's validator while adding a record which a `LinePreparer` has already validated.
+    """
+
+    def __init__(self, validation_error):
+        self.validation_error = validation_error
+
+    def validate(self, record):
+        if self.validation_error is not None:
+            raise self.validation_error
+
+
+def _handle_prepared_record_message(state_tracker, stream, line_data, validation_error):
+    stream_buffer = state_tracker.streams[stream]
+    validator = stream_buffer.validator
+    stream_buffer.validator = _PreparedValidator(validation_error)
+    try:
+        state_tracker.handle_record_message(stream, line_data)
+    finally:
+        stream_buffer.validator = validator
+
+
+def _line_text(line):
+    if isinstance(line, bytes):
+        return line.decode('utf-8', errors='replace')
+
+    return line
+
+
+def _line_handler(state_tracker, target, invalid_records_detect, invalid_records_threshold, max_batch_rows,
+                  max_batch_size, line, buffer_budget=None, prepared_line=None, decoder=loads_json,
+                  validator_cache=None):
+    """
+    Mirrors `target_postgres.target_tools._line_handler`, buffering streams' records in `SpillingSingerStream`s
+    sharing `buffer_budget` when given, using the decoded (and validated) `prepared_line` when given, and otherwise
+    decoding `line`, a string or UTF-8 bytes, with `decoder`. When given a `validator_cache`, streams share the
+    validators and simplified schemas built for their schemas, and SCHEMA messages repeating a stream's current
+    schema are ignored.
+    """
+    if prepared_line is not None and prepared_line.line_data is not None:
+        line_data = prepared_line.line_data
+    else:
+        try:
+            line_data = decoder(line)
+        ## Including `UnicodeDecodeError`s, and errors from decoders other than `json`'s
+        except ValueError:
+            LOGGER.error("Unable to parse JSON: {}".format(_line_text(line)))
+            raise
+
+    if 'type' not in line_data:
+        raise TargetError('`type` is a required key: {}'.format(_line_text(line)))
+
+    if line_data['type'] == 'SCHEMA':
+        if 'stream' not in line_data:
+            raise TargetError('`stream` is a required key: {}'.format(_line_text(line)))
+
+        stream = line_data['stream']
+
+        if 'schema' not in line_data:
+            raise TargetError('`schema` is a required key: {}'.format(_line_text(line)))
+
+        schema = line_data['schema']
+        key_properties = line_data.get('key_properties')
+
+        if validator_cache is None:
+            compiled = CompiledSchema(schema)
+        else:
+            compiled = validator_cache.get(schema)
+            if stream in state_tracker.streams and validator_cache.is_current(stream, compiled, key_properties):
+                return
+
+        schema_validation_errors = compiled.validation_errors
+        if schema_validation_errors:
+            raise TargetError('`schema` is an invalid JSON Schema instance: {}'.format(_line_text(line)),
+                              *schema_validation_errors)
+
+        ## Stream buffers share the validator and simplified schema built for the schema
+        if stream not in state_tracker.streams:
+            buffered_stream_args = (stream, compiled, key_properties)
+            buffered_stream_kwargs = {'invalid_records_detect': invalid_records_detect,
+                                      'invalid_records_threshold': invalid_records_threshold}
+            if buffer_budget:
+                buffered_stream = SpillingSingerStream(*buffered_stream_args,
+                                                       budget=buffer_budget,
+                                                       **buffered_stream_kwargs)
+            else:
+                buffered_stream = CompiledSingerStream(*buffered_stream_args, **buffered_stream_kwargs)
+
+            if max_batch_rows:
+                buffered_stream.max_rows = max_batch_rows
+            if max_batch_size:
+                buffered_stream.max_buffer_size = max_batch_size
+
+            state_tracker.register_stream(stream, buffered_stream)
+        else:
+            state_tracker.streams[stream].update_schema(compiled, key_properties)
+
+        if validator_cache is not None:
+            validator_cache.set_current(stream, compiled, key_properties)
+    elif line_data['type'] == 'RECORD':
+        if 'stream' not in line_data:
+            raise TargetError('`stream` is a required key: {}'.format(_line_text(line)))
+
+        line_data[RAW_LINE_SIZE] = len(line)
+        if prepared_line is not None and prepared_line.validated and line_data['stream'] in state_tracker.streams:
+            _handle_prepared_record_message(state_tracker,
+                                            line_data['stream'],
+                                            line_data,
+                                            prepared_line.validation_error)
+        else:
+            state_tracker.handle_record_message(line_data['stream'], line_data)
+    elif line_data['type'] == 'ACTIVATE_VERSION':
+        if 'stream' not in line_data:
+            raise TargetError('`stream` is a required key: {}'.format(_line_text(line)))
+        if 'version' not in line_data:
+            raise TargetError('`version` is a required key: {}'.format(_line_text(line)))
+        if line_data['stream'] not in state_tracker.streams:
+            raise TargetError('A ACTIVATE_VERSION for stream {} was encountered before a corresponding schema'
+                              .format(line_data['stream']))
+
+        stream_buffer = state_tracker.streams[line_data['stream']]
+        state_tracker.flush_stream(line_data['stream'])
+        target.activate_version(stream_buffer, line_data['version'])
+    elif line_data['type'] == 'STATE':
+        state_tracker.handle_state_message(line_data)
+    else:
+        raise TargetError('Unknown message type {} in message {}'.format(
+            line_data['type'],
+            _line_text(line)))
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from copy import deepcopy
+
+from jsonschema import Draft4Validator, FormatChecker
+from target_postgres import json_schema, singer
+
+DEFAULT_MAX_VALIDATORS = 100
+
+
+def schema_fingerprint(schema):
+    """
+    :param schema: dict, JSON Schema, as decoded from a SCHEMA message
+    :return: hashable value, equal only for identical schemas (ie, telling apart `1`, `1.0`, `true` and `"1"`)
+    """
+    if isinstance(schema, dict):
+        return 'object', tuple(sorted((key, schema_fingerprint(value)) for key, value in schema.items()))
+
+    if isinstance(schema, list):
+        return 'array', tuple(schema_fingerprint(value) for value in schema)
+
+    return type(schema).__name__, schema
+
+
+class CompiledSchema:
+    """
+    A JSON Schema's validator, simplified stream schema, and whether it is a valid JSON Schema at all, each worked
+    out when first needed.
+    """
+
+    def __init__(self, schema, fingerprint=None):
+        self.schema = schema
+        self.fingerprint = fingerprint
+        self._validator = None
+        self._stream_schemas = {}
+        self._validation_errors = None
+
+    @property
+    def validator(self):
+        if self._validator is None:
+            self._validator = Draft4Validator(self.schema, format_checker=FormatChecker())
+
+        return self._validator
+
+    def get_stream_schema(self, use_uuid_pk):
+        """
+        The schema as `BufferedSingerStream.update_schema` sets it: simplified, and with Singer's metadata
+        properties. Shared by every stream buffer given this `CompiledSchema`, so not to be mutated.
+        :param use_uuid_pk: boolean, whether the stream has no key properties, so is keyed by `_sdc_primary_key`
+        :return: JSONSchema
+        """
+        stream_schema = self._stream_schemas.get(use_uuid_pk)
+        if stream_schema is None:
+            stream_schema = json_schema.simplify(self.schema)
+            properties = stream_schema['properties']
+            for property_name, property_schema in ((singer.RECEIVED_AT, {'type': ['null', 'string'],
+                                                                          'format': 'date-time'}),
+                                                   (singer.SEQUENCE, {'type': ['null', 'integer']}),
+                                                   (singer.TABLE_VERSION, {'type': ['null', 'integer']}),
+                                                   (singer.BATCHED_AT, {'type': ['null', 'string'],
+                                                                        'format': 'date-time'})):
+                if property_name not in properties:
+                    properties[property_name] = property_schema
+
+            if use_uuid_pk:
+                properties[singer.PK] = {'type': ['string']}
+
+            self._stream_schemas[use_uuid_pk] = stream_schema
+
+        return stream_schema
+
+    @property
+    def validation_errors(self):
+        if self._validation_errors is None:
+            self._validation_errors = json_schema.validation_errors(self.schema)
+
+        return self._validation_errors
+
+
+class ValidatorCache:
+    """
+    Least recently used cache of `CompiledSchema`s by `schema_fingerprint`, so that a schema is only checked, and
+    its validator and stream schema only built, once however many streams use it, and however many times it is
+    sent.
+
+    Also remembers the schema each stream was last updated with, so that SCHEMA messages repeating it (which many
+    taps send ahead of each batch) can be ignored.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_VALIDATORS):
+        self.max_size = max_size
+        self._compiled = OrderedDict()
+        self._stream_schemas = {}
+
+    def get(self, schema):
+        """
+        :param schema: dict, JSON Schema
+        :return: CompiledSchema
+        """
+        fingerprint = schema_fingerprint(schema)
+
+        compiled = self._compiled.get(fingerprint)
+        if compiled is None:
+            compiled = CompiledSchema(schema, fingerprint=fingerprint)
+            self._compiled[fingerprint] = compiled
+            if len(self._compiled) > self.max_size:
+                self._compiled.popitem(last=False)
+        else:
+            self._compiled.move_to_end(fingerprint)
+
+        return compiled
+
+    def is_current(self, stream, compiled, key_properties):
+        """
+        :param stream: string
+        :param compiled: CompiledSchema, from `get`
+        :param key_properties: [string, ...] or None
+        :return: boolean, whether `stream` was last updated with `compiled`'s schema and `key_properties`
+        """
+        return self._stream_schemas.get(stream) == (compiled.fingerprint, key_properties)
+
+    def set_current(self, stream, compiled, key_properties):
+        self._stream_schemas[stream] = (compiled.fingerprint, deepcopy(key_properties))
@@ -0,0 +1,95 @@
+from decimal import Decimal
+
+from target_postgres.singer_stream import BufferedSingerStream
+
+from target_redshift.buffer import BufferBudget, CompiledSingerStream, SpillingSingerStream
+from target_redshift.validators import CompiledSchema
+
+SCHEMA = {'type': 'object',
+          'properties': {'id': {'type': 'integer'},
+                         'price': {'type': 'number'}}}
+
+
+def _record_message(id, size=100):
+    return {'type': 'RECORD',
+            'stream': 'cats',
+            'record': {'id': id, 'price': Decimal('1.10')},
+            'sequence': id,
+            '__raw_line_size': size}
+
+
+def _stream(stream, budget):
+    return SpillingSingerStream(stream, SCHEMA, ['id'], budget=budget)
+
+
+def test_spilling_singer_stream__under_budget():
+    budget = BufferBudget(1000)
+    stream_buffer = _stream('cats', budget)
+
+    for i in range(5):
+        stream_buffer.add_record_message(_record_message(i))
+
+    assert stream_buffer.spilled_count == 0
+    assert budget.size == 500
+    assert [m['record']['id'] for m in stream_buffer.peek_buffer()] == list(range(5))
+
+
+def test_spilling_singer_stream__spills_largest_stream():
+    budget = BufferBudget(1000)
+    cats = _stream('cats', budget)
+    dogs = _stream('dogs', budget)
+
+    for i in range(6):
+        cats.add_record_message(_record_message(i))
+    for i in range(5):
+        dogs.add_record_message(_record_message(i))
+
+    assert cats.spilled_count == 6
+    assert dogs.spilled_count == 0
+    assert budget.size == 500
+
+    cats.add_record_message(_record_message(6))
+
+    ## Spilled records are read back in order, and batch limits still count them
+    assert cats.count == 7
+    assert [m['record']['id'] for m in cats.peek_buffer()] == list(range(7))
+    assert cats.get_batch()[0]['price'] == Decimal('1.10')
+
+
+def test_spilling_singer_stream__flush_buffer():
+    budget = BufferBudget(250)
+    stream_buffer = _stream('cats', budget)
+
+    for i in range(3):
+        stream_buffer.add_record_message(_record_message(i))
+
+    assert stream_buffer.spilled_count == 3
+    assert len(stream_buffer.flush_buffer()) == 3
+
+    assert stream_buffer.count == 0
+    assert stream_buffer.spilled_count == 0
+    assert stream_buffer.peek_buffer() == []
+    assert budget.size == 0
+
+    stream_buffer.add_record_message(_record_message(3))
+    assert [m['record']['id'] for m in stream_buffer.peek_buffer()] == [3]
+
+
+def test_compiled_singer_stream():
+    compiled = CompiledSchema(SCHEMA)
+    cats = CompiledSingerStream('cats', compiled, ['id'])
+    dogs = CompiledSingerStream('dogs', compiled, ['id'])
+
+    ## Built once, and set as `BufferedSingerStream` would
+    assert cats.validator is dogs.validator is compiled.validator
+    assert cats.schema is dogs.schema
+    assert cats.schema == BufferedSingerStream('cats', SCHEMA, ['id']).schema
+
+    dogs.update_schema(compiled, [])
+    assert dogs.key_properties == ['_sdc_primary_key']
+    assert dogs.use_uuid_pk
+    assert dogs.schema == BufferedSingerStream('dogs', SCHEMA, []).schema
+
+    cats.update_schema(SCHEMA, ['id'])
+    assert cats.schema == CompiledSingerStream('cats', compiled, ['id']).schema
+    assert cats.validator is not compiled.validator
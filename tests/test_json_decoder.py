@@ -0,0 +1,52 @@
+import decimal
+
+import pytest
+
+from target_redshift.json_decoder import DECODERS, get_decoder, loads_json
+
+LINES = [
+    '{"type": "RECORD", "stream": "cats", "record": {"id": 1, "weight": 4.5, "name": "Fluffy"}}\n',
+    '{"nested": [1.0, -0.0, 1e-7, 1.5E+300, {"deeper": [0.1, 2]}], "big": 123456789012345678901234567890}',
+    '{"not_a_number": NaN, "infinite": 1e400}',
+    '{"unicode": "caf\\u00e9   🐱", "empty": {}, "nothing": null, "flag": true}',
+    '3.25',
+    '[]',
+]
+
+
+def _installed():
+    for name in DECODERS:
+        try:
+            get_decoder(name)
+        except ImportError:
+            continue
+        yield name
+
+
+@pytest.mark.parametrize('name', list(_installed()))
+def test_get_decoder__matches_loads_json(name):
+    decode = get_decoder(name)
+
+    for line in LINES:
+        expected = loads_json(line)
+        assert repr(decode(line)) == repr(expected)
+        assert repr(decode(line.encode('utf-8'))) == repr(expected)
+
+    assert isinstance(decode('{"weight": 4.5}')['weight'], decimal.Decimal)
+
+
+@pytest.mark.parametrize('name', list(_installed()))
+def test_get_decoder__invalid_json(name):
+    decode = get_decoder(name)
+
+    for line in ['{"not json', '\n', b'{"invalid": "\xff"}']:
+        with pytest.raises(ValueError) as expected:
+            loads_json(line)
+        with pytest.raises(type(expected.value)) as actual:
+            decode(line)
+        assert str(actual.value) == str(expected.value)
+
+
+def test_get_decoder__unsupported():
+    with pytest.raises(ValueError):
+        get_decoder('yaml')
@@ -0,0 +1,76 @@
+import pytest
+from singer.metrics import Point
+
+from target_redshift.metrics import (
+    Metrics,
+    MeteredReadable,
+    PrometheusTextfileMetricsSink,
+    StatsdMetricsSink
+)
+
+
+class RecordingSink:
+    def __init__(self):
+        self.points = []
+
+    def emit(self, point):
+        self.points.append(point)
+
+
+def test_statsd__format():
+    sink = StatsdMetricsSink('localhost', prefix='tr')
+
+    assert sink.format(Point('timer', 'job_duration', 1.5, {'job_type': 'copy', 'path': ('cats', 'adoption')})) \
+           == 'tr.job_duration:1500.0|ms|#job_type:copy,path:cats.adoption'
+    assert sink.format(Point('counter', 'bytes_staged', 10, {})) == 'tr.bytes_staged:10|c'
+
+
+def test_prometheus_textfile__aggregates(tmpdir):
+    path = str(tmpdir.join('target_redshift.prom'))
+    sink = PrometheusTextfileMetricsSink(path, prefix='tr')
+
+    sink.emit(Point('timer', 'job_duration', 1.0, {'job_type': 'copy'}))
+    sink.emit(Point('timer', 'job_duration', 2.0, {'job_type': 'copy'}))
+    sink.emit(Point('counter', 'bytes_staged', 10, {'table': 'cats'}))
+    sink.emit(Point('counter', 'bytes_staged', 5, {'table': 'cats'}))
+    sink.emit(Point('gauge', 'upload_bytes_per_second', 100, {'table': 'say "cats"'}))
+    sink.emit(Point('gauge', 'upload_bytes_per_second', 50, {'table': 'say "cats"'}))
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    assert lines == ['tr_bytes_staged_total{table="cats"} 15',
+                     'tr_job_duration_seconds_count{job_type="copy"} 2',
+                     'tr_job_duration_seconds_sum{job_type="copy"} 3.0',
+                     'tr_upload_bytes_per_second{table="say \\"cats\\""} 50']
+
+
+def test_job_timer__status():
+    sink = RecordingSink()
+    metrics = Metrics([sink])
+
+    with metrics.job_timer('merge', {'table': 'cats'}):
+        pass
+
+    with pytest.raises(ValueError):
+        with metrics.job_timer('merge', {'table': 'cats'}):
+            raise ValueError()
+
+    assert [(p.metric_type, p.metric, p.tags['job_type'], p.tags['status']) for p in sink.points] \
+           == [('timer', 'job_duration', 'merge', 'succeeded'),
+               ('timer', 'job_duration', 'merge', 'failed')]
+
+
+def test_metered_readable__counts_utf8_bytes():
+    chunks = iter(['abc\n', 'ü\n', ''])
+
+    class Readable:
+        def read(self):
+            return next(chunks)
+
+    readable = MeteredReadable(Readable())
+    while readable.read():
+        pass
+
+    assert readable.bytes == 4 + 3
+    assert readable.seconds >= 0
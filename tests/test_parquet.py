@@ -0,0 +1,48 @@
+from decimal import Decimal
+import datetime
+
+import pytest
+
+pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+
+from target_redshift.parquet import write_parquet_files
+
+COLUMNS = ['id', 'weight', 'name', 'adopted_at', 'vaccinated']
+SQL_TYPES = ['bigint', 'double precision', 'varchar(1000)', 'timestamp with time zone', 'boolean']
+ADOPTED_AT = datetime.datetime(2019, 1, 1, 12, tzinfo=datetime.timezone.utc)
+
+
+def rows(count):
+    return [{'id': i,
+             'weight': Decimal('4.5') if i % 2 else None,
+             'name': 'NULL' if i % 3 else '',
+             'adopted_at': ADOPTED_AT if i % 2 else None,
+             'vaccinated': bool(i % 2)}
+            for i in range(count)]
+
+
+def test_write_parquet_files():
+    files = write_parquet_files(rows(10), COLUMNS, SQL_TYPES, file_count=3, row_group_size=2)
+
+    tables = [pyarrow_parquet.read_table(f) for f in files]
+    assert [table.num_rows for table in tables] == [4, 4, 2]
+    assert pyarrow_parquet.ParquetFile(files[0]).metadata.num_row_groups == 2
+
+    loaded = sum((table.to_pylist() for table in tables), [])
+    assert [row['id'] for row in loaded] == list(range(10))
+    assert loaded[1]['weight'] == 4.5
+    assert loaded[1]['adopted_at'] == ADOPTED_AT
+    ## Values which would collide with the CSV NULL sentinel, or be indistinguishable from NULL, survive
+    assert loaded[0]['weight'] is None
+    assert loaded[0]['name'] == ''
+    assert loaded[1]['name'] == 'NULL'
+
+    assert str(tables[0].schema.field('id').type) == 'int64'
+    assert str(tables[0].schema.field('adopted_at').type) == 'timestamp[us, tz=UTC]'
+
+
+def test_write_parquet_files__empty():
+    files = write_parquet_files([], COLUMNS, SQL_TYPES, file_count=4)
+
+    assert len(files) == 1
+    assert pyarrow_parquet.read_table(files[0]).num_rows == 0
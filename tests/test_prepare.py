@@ -0,0 +1,78 @@
+import json
+
+from target_redshift.prepare import LinePreparer, _prepare_chunk
+
+SCHEMA = {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+
+
+def _lines(messages):
+    return [json.dumps(message) for message in messages]
+
+
+def test_prepare_chunk():
+    lines = _lines([{'type': 'RECORD', 'stream': 'cats', 'record': {'id': 1}},
+                    {'type': 'SCHEMA', 'stream': 'cats', 'schema': SCHEMA, 'key_properties': ['id']},
+                    {'type': 'RECORD', 'stream': 'cats', 'record': {'id': 1}},
+                    {'type': 'RECORD', 'stream': 'cats', 'record': {'id': 'one'}},
+                    {'type': 'STATE', 'value': {}}]) + ['{"not json']
+
+    prepared = _prepare_chunk({}, lines)
+
+    ## Records for streams without a known schema are left to be validated in-process
+    assert [line.validated for line in prepared] == [False, False, True, True, False, False]
+    assert prepared[2].validation_error is None
+    assert prepared[3].validation_error.validator == 'type'
+    assert prepared[5].line_data is None
+
+
+def test_prepare_chunk__decimal_schema():
+    schema = {'type': 'object', 'properties': {'weight': {'type': 'number', 'multipleOf': 0.01}}}
+    lines = _lines([{'type': 'SCHEMA', 'stream': 'cats', 'schema': schema, 'key_properties': []}]) \
+        + ['{"type": "RECORD", "stream": "cats", "record": {"weight": 0.07}}']
+
+    prepared = _prepare_chunk({}, lines)
+
+    assert prepared[1].validated
+    assert prepared[1].validation_error is None
+
+
+def test_line_preparer():
+    messages = [{'type': 'SCHEMA', 'stream': 'cats', 'schema': SCHEMA, 'key_properties': ['id']}]
+    messages += [{'type': 'RECORD', 'stream': 'cats', 'record': {'id': i}, 'sequence': i} for i in range(50)]
+    messages += [{'type': 'RECORD', 'stream': 'cats', 'record': {'id': 'fifty'}, 'sequence': 50}]
+    lines = _lines(messages)
+
+    preparer = LinePreparer(2, chunk_size=7)
+    try:
+        prepared = list(preparer.prepare(iter(lines)))
+    finally:
+        preparer.close()
+
+    assert [line for line, _ in prepared] == lines
+    assert [prepared_line.line_data for _, prepared_line in prepared] == messages
+
+    ## Chunks sent before the SCHEMA message was read back (ie, the first four) are validated in-process, other
+    ## than those following the SCHEMA message in its own chunk
+    validated = [prepared_line.validated for _, prepared_line in prepared]
+    assert validated[:7] == [False] + [True] * 6
+    assert validated[7:28] == [False] * 21
+    assert validated[28:] == [True] * 24
+    assert prepared[-1][1].validation_error.validator == 'type'
+
+
+def test_line_preparer__repeated_schema():
+    schema_message = {'type': 'SCHEMA', 'stream': 'cats', 'schema': SCHEMA, 'key_properties': ['id']}
+    messages = [schema_message]
+    for i in range(4):
+        messages += [{'type': 'RECORD', 'stream': 'cats', 'record': {'id': i}} for i in range(9)] + [schema_message]
+
+    preparer = LinePreparer(2, chunk_size=5)
+    try:
+        prepared = list(preparer.prepare(iter(_lines(messages))))
+    finally:
+        preparer.close()
+
+    ## Only chunks sent before the stream's schema was first known are validated in-process
+    validated = [prepared_line.validated for _, prepared_line in prepared
+                 if prepared_line.line_data['type'] == 'RECORD']
+    assert validated == [True] * 4 + [False] * 14 + [True] * 18
@@ -0,0 +1,397 @@
+from copy import deepcopy
+import csv
+import io
+from types import SimpleNamespace
+
+import arrow
+import pytest
+from target_postgres import denest
+from target_postgres.postgres import PostgresTarget, RESERVED_NULL_DEFAULT
+
+from target_redshift.metrics import Metrics
+from target_redshift.redshift import (
+    RedshiftTarget,
+    _csv_rows,
+    _dedupe_records,
+    _format_datetime,
+    _make_schema_nullable,
+    _observe_string_lengths,
+    _observed_varchar_length,
+    _parse_datetime
+)
+from target_redshift.schema_cache import SchemaCache, SchemaCacheTransaction
+
+SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'id': {'type': ['integer']},
+        'name': {'type': ['null', 'string']},
+        'multi': {'anyOf': [{'type': ['integer']}, {'type': ['null', 'string']}]}
+    }
+}
+
+
+def test_make_schema_nullable():
+    nullable_schema = _make_schema_nullable(SCHEMA)
+
+    assert nullable_schema['properties']['id'] == {'type': ['integer', 'null']}
+    assert nullable_schema['properties']['name'] == {'type': ['null', 'string']}
+    assert nullable_schema['properties']['multi']['anyOf'] == [{'type': ['integer', 'null']},
+                                                               {'type': ['null', 'string']}]
+
+
+def test_make_schema_nullable__does_not_mutate():
+    schema = deepcopy(SCHEMA)
+
+    _make_schema_nullable(schema)
+
+    assert schema == SCHEMA
+
+
+def test_make_schema_nullable__idempotent():
+    nullable_schema = _make_schema_nullable(SCHEMA)
+    renullable_schema = _make_schema_nullable(nullable_schema)
+
+    assert renullable_schema == nullable_schema
+    for field, field_schema in nullable_schema['properties'].items():
+        assert renullable_schema['properties'][field] is field_schema
+
+
+def test_should_insert_rows():
+    target = SimpleNamespace(insert_batch_max_rows=2, insert_batch_max_bytes=20)
+
+    assert RedshiftTarget._should_insert_rows(target, [])
+    assert RedshiftTarget._should_insert_rows(target, [{'id': 1, 'name': 'Tom'}, {'id': 2, 'name': 'Jerry'}])
+    assert not RedshiftTarget._should_insert_rows(target, [{'id': 1}, {'id': 2}, {'id': 3}])
+    assert not RedshiftTarget._should_insert_rows(target, [{'id': 1, 'name': 'Tom' * 10}])
+
+
+def test_should_insert_rows__disabled():
+    target = SimpleNamespace(insert_batch_max_rows=0, insert_batch_max_bytes=20)
+
+    assert not RedshiftTarget._should_insert_rows(target, [{'id': 1}])
+    assert not RedshiftTarget._should_insert_rows(target, [])
+
+
+def test_dedupe_records__mixed_case_key():
+    remote_schema = {'key_properties': ['Id'],
+                     'mappings': {'id': {'type': ['integer'], 'from': ['Id']},
+                                  'name': {'type': ['string', 'null'], 'from': ['Name']}}}
+    target = SimpleNamespace(fetch_column_from_path=lambda path, table_schema:
+                             PostgresTarget.fetch_column_from_path(None, path, table_schema))
+    records = [{'id': 1, 'name': 'Tom', '_sdc_sequence': 1},
+               {'id': 2, 'name': 'Jerry', '_sdc_sequence': 2},
+               {'id': 1, 'name': 'Thomas', '_sdc_sequence': 3}]
+
+    key_columns = RedshiftTarget._get_key_columns(target, remote_schema)
+
+    assert key_columns == ['id']
+    assert sorted(_dedupe_records(records, key_columns), key=lambda record: record['id']) \
+        == [{'id': 1, 'name': 'Thomas', '_sdc_sequence': 3}, {'id': 2, 'name': 'Jerry', '_sdc_sequence': 2}]
+
+    ## Keys which are not columns are not mistaken for null keys shared by every record
+    with pytest.raises(KeyError):
+        _dedupe_records(records, ['Id'])
+
+
+def test_observe_string_lengths():
+    lengths = {}
+    for record in [{'id': 1, 'name': 'Tom', 'adoption': {'vet': 'Dr. Müller'}, 'tags': ['a', 'bcd']},
+                   {'id': 2, 'name': 'Jerry', 'immunizations': [{'type': 'FIV'}]}]:
+        _observe_string_lengths(record, (), (), lengths)
+
+    assert lengths == {((), ('name',)): 5,
+                       ((), ('adoption', 'vet')): 11,
+                       (('tags',), ('_sdc_value',)): 3,
+                       (('immunizations',), ('type',)): 3}
+
+
+class _Cursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+def _widening_target(root_path, table_mapping_cache, versions=None):
+    statements = []
+    widened = []
+    target = SimpleNamespace(
+        varchar_sizing='observed',
+        MAX_VARCHAR=65535,
+        conn=SimpleNamespace(cursor=lambda: _Cursor(statements)),
+        table_mapping_cache=table_mapping_cache,
+        setup_table_mapping_cache=lambda cur: None,
+        _get_observed_string_lengths=lambda: {((), ('name',)): 40,
+                                              ((), ('adoption', 'vet')): 10,
+                                              (('tags',), ('_sdc_value',)): 3,
+                                              (('toys',), ('_sdc_value',)): 100},
+        _get_varchar_lengths=lambda cur, table_name: {'name': 32, 'adoption__vet': 32}
+        if table_name in (root_path, 'cats') else {'_sdc_value': 32},
+        _get_cached_table_metadata=lambda cur, table_name: dict(
+            {'mappings': {'name': {'type': ['string', 'null'], 'from': ['name']},
+                          'adoption__vet': {'type': ['string', 'null'], 'from': ['adoption', 'vet']}}}
+            if table_name in (root_path, 'cats') else
+            {'mappings': {'_sdc_value': {'type': ['string'], 'from': ['_sdc_value']}}},
+            version=(versions or {}).get(table_name)),
+        _widen_varchar_column=lambda cur, *args: widened.append((list(statements), args)),
+        schema_cache=SchemaCacheTransaction(SchemaCache()))
+    target._get_batch_root_path = lambda cur, stream_buffer: RedshiftTarget._get_batch_root_path(target,
+                                                                                                 cur,
+                                                                                                 stream_buffer)
+
+    return target, widened
+
+
+def test_widen_varchar_columns():
+    target, widened = _widening_target('cats', {('cats',): 'cats', ('cats', 'tags'): 'cats__tags'})
+
+    RedshiftTarget._widen_varchar_columns(target, SimpleNamespace(stream='cats', count=2, max_version=None))
+
+    ## Only once the reads' transaction has ended, ie outside of the batch's transaction
+    assert widened == [(['COMMIT;'], ('cats', 'name', 64))]
+
+
+def test_widen_varchar_columns__stream_named_unlike_table():
+    ## Tables are mapped by the stream's name, not by the (canonicalized) table name
+    target, widened = _widening_target('cats', {('Cats',): 'cats', ('Cats', 'tags'): 'cats__tags'})
+
+    RedshiftTarget._widen_varchar_columns(target, SimpleNamespace(stream='Cats', count=2, max_version=None))
+
+    assert widened == [(['COMMIT;'], ('cats', 'name', 64))]
+
+
+def test_widen_varchar_columns__new_version():
+    table_mapping_cache = {('cats',): 'cats',
+                           ('cats', 'tags'): 'cats__tags',
+                           ('cats__2',): 'cats__2',
+                           ('cats__2', 'tags'): 'cats__2__tags'}
+    versions = {'cats': 1, 'cats__2': 2}
+
+    ## A batch of a newer version is written to the version's own tables
+    target, widened = _widening_target('cats__2', table_mapping_cache, versions)
+    RedshiftTarget._widen_varchar_columns(target, SimpleNamespace(stream='cats', count=2, max_version=2))
+    assert widened == [(['COMMIT;'], ('cats__2', 'name', 64))]
+
+    ## A batch of the current version to the stream's tables
+    target, widened = _widening_target('cats', table_mapping_cache, versions)
+    RedshiftTarget._widen_varchar_columns(target, SimpleNamespace(stream='cats', count=2, max_version=1))
+    assert widened == [(['COMMIT;'], ('cats', 'name', 64))]
+
+    ## And a batch of an older version is dropped, so nothing is widened for it
+    target, widened = _widening_target('cats', table_mapping_cache, versions)
+    RedshiftTarget._widen_varchar_columns(target, SimpleNamespace(stream='cats', count=2, max_version=0))
+    assert widened == []
+
+
+def test_observe_string_lengths__source_keys():
+    schema = {'type': 'object',
+              'properties': {'id': {'type': ['string']},
+                             'kids': {'type': ['array'],
+                                      'items': {'type': ['object'],
+                                                'properties': {'name': {'type': ['string']},
+                                                               'toys': {'type': ['array'],
+                                                                        'items': {'type': ['string']}}}}}}}
+    records = [{'id': 'c7b3f3d2-6d0e-4c58-9d55-3a8f0a1d7b11', 'kids': [{'name': 'Tom', 'toys': ['ball']}]},
+               {'id': 'short', 'kids': []}]
+
+    lengths = {}
+    for record in records:
+        _observe_string_lengths(record, (), (), lengths, {'_sdc_source_key_id': len(record['id'])})
+
+    ## Every string loaded into a (sub)table's column, including the keys `denest` copies into subtables, is seen
+    for table_batch in denest.to_table_batches(schema, ['id'], deepcopy(records)):
+        table_path = table_batch['streamed_schema']['path']
+        for record in table_batch['records']:
+            for column_path, (_, value) in record.items():
+                if isinstance(value, str):
+                    assert lengths[(table_path, column_path)] >= len(value)
+
+    assert lengths[(('kids',), ('_sdc_source_key_id',))] == 36
+    assert lengths[(('kids', 'toys'), ('_sdc_source_key_id',))] == 36
+
+
+def test_observed_varchar_length():
+    assert _observed_varchar_length(0, 65535) == 32
+    assert _observed_varchar_length(32, 65535) == 32
+    assert _observed_varchar_length(33, 65535) == 64
+    assert _observed_varchar_length(70000, 65535) == 65535
+
+
+def _attributes_target(table_options=None):
+    return SimpleNamespace(table_options=table_options or {}, _stream_buffer=SimpleNamespace(stream='cats'))
+
+
+COLUMNS = {'id': 'bigint',
+           'name': 'varchar(32)',
+           '_sdc_received_at': 'timestamp with time zone',
+           '_sdc_sequence': 'bigint'}
+
+METADATA = {'key_properties': ['id'],
+            'mappings': {'id': {'type': ['integer'], 'from': ['id']},
+                         'name': {'type': ['string', 'null'], 'from': ['name']}}}
+
+
+def test_get_table_attributes():
+    assert RedshiftTarget._get_table_attributes(_attributes_target(), 'cats', ('cats',), METADATA, COLUMNS) \
+           == {'diststyle': 'key', 'distkey': 'id', 'sortkey': ['_sdc_received_at']}
+
+
+def test_get_table_attributes__varchar_key():
+    metadata = dict(METADATA, key_properties=['name'])
+
+    assert RedshiftTarget._get_table_attributes(_attributes_target(), 'cats', ('cats',), metadata, COLUMNS) \
+           == {'diststyle': None, 'distkey': None, 'sortkey': ['_sdc_received_at']}
+
+
+def test_get_table_attributes__table_options():
+    target = _attributes_target({'cats': {'diststyle': 'all', 'sortkey': ['name', 'id']}})
+
+    assert RedshiftTarget._get_table_attributes(target, 'cats', ('cats',), METADATA, COLUMNS) \
+           == {'diststyle': 'all', 'distkey': None, 'sortkey': ['name', 'id']}
+    ## Only apply to the stream's root table
+    assert RedshiftTarget._get_table_attributes(target, 'cats__adoption', ('cats', 'adoption'), METADATA, COLUMNS) \
+           == {'diststyle': 'key', 'distkey': 'id', 'sortkey': ['_sdc_received_at']}
+
+
+def _serialize_target():
+    target = RedshiftTarget.__new__(RedshiftTarget)
+    target.conn = SimpleNamespace(get_dsn_parameters=lambda: {'dbname': 'test'})
+    target.postgres_schema = 'public'
+    target.staging_format = 'csv'
+    target.metrics = Metrics()
+    target._serialization_plans = {}
+    return target
+
+
+SERIALIZE_REMOTE_SCHEMA = {
+    'name': 'cats',
+    'path': ('cats',),
+    'schema': {'properties': {'id': {'type': ['integer']},
+                              'age': {'type': ['integer', 'null']},
+                              'multi__i': {'type': ['integer', 'null']},
+                              'multi__s': {'type': ['string', 'null']},
+                              'adopted_on': {'type': ['string', 'null'], 'format': 'date-time'}}},
+    'mappings': {'id': {'type': ['integer'], 'from': ['id']},
+                 'age': {'type': ['integer', 'null'], 'from': ['age']},
+                 'multi__i': {'type': ['integer', 'null'], 'from': ['multi']},
+                 'multi__s': {'type': ['string', 'null'], 'from': ['multi']},
+                 'adopted_on': {'type': ['string', 'null'], 'format': 'date-time', 'from': ['adopted_on']}}}
+
+SERIALIZE_STREAMED_SCHEMA = {
+    'schema': {'properties': {('id',): {'anyOf': [{'type': ['integer']}]},
+                              ('age',): {'anyOf': [{'type': ['integer', 'null'], 'default': 3}]},
+                              ('multi',): {'anyOf': [{'type': ['integer', 'null']}, {'type': ['string', 'null']}]},
+                              ('adopted_on',): {'anyOf': [{'type': ['string', 'null'], 'format': 'date-time'}]}}}}
+
+
+def test_serialize_table_records__matches_target_postgres():
+    records = [{('id',): ('integer', 1), ('age',): ('integer', 7), ('multi',): ('integer', 5),
+                ('adopted_on',): ('string', '2019-01-02T03:04:05Z')},
+               {('id',): ('integer', 2), ('multi',): ('string', 'five')},
+               {('id',): ('integer', 3)}]
+
+    target = _serialize_target()
+    expected = PostgresTarget._serialize_table_records(target,
+                                                        SERIALIZE_REMOTE_SCHEMA,
+                                                        SERIALIZE_STREAMED_SCHEMA,
+                                                        deepcopy(records))
+
+    assert target._serialize_table_records(SERIALIZE_REMOTE_SCHEMA,
+                                           SERIALIZE_STREAMED_SCHEMA,
+                                           deepcopy(records)) == expected
+    assert expected[1]['multi__s'] == 'five'
+    assert expected[2]['age'] == 3
+    assert expected[2]['multi__i'] == RESERVED_NULL_DEFAULT
+
+    ## The plan is compiled once for the table's schema
+    target._serialize_table_records(SERIALIZE_REMOTE_SCHEMA, SERIALIZE_STREAMED_SCHEMA, deepcopy(records))
+    assert len(target._serialization_plans) == 1
+
+
+def test_csv_rows():
+    rows = [{'id': i, 'name': 'Tom, "the cat"' if i % 2 else None} for i in range(600)]
+
+    csv_rows = _csv_rows(rows, ['name', 'id'])
+    chunks = []
+    chunk = csv_rows.read()
+    while chunk:
+        chunks.append(chunk)
+        chunk = csv_rows.read()
+
+    assert len(chunks) == 3
+    with io.StringIO() as out:
+        csv.DictWriter(out, ['name', 'id']).writerows(rows)
+        assert ''.join(chunks) == out.getvalue()
+
+    assert _csv_rows([{'id': 1}], ['id']).read() == '1\r\n'
+
+
+def test_parse_datetime__matches_arrow():
+    for value in ['2019-01-02T03:04:05Z',
+                  '2019-01-02T03:04:05.1Z',
+                  '2019-01-02 03:04:05.99999',
+                  '2019-01-02T03:04:05.123456+05:30',
+                  '2019-01-02T03:04:05-0130',
+                  '2019-01-02T03:04:05-00:30',
+                  ## Not RFC 3339, or out of range for it, so parsed by `arrow`
+                  '2019-01-02',
+                  '2019-01-02T23:59:59.9999999Z']:
+        assert _format_datetime(_parse_datetime(value)) == arrow.get(value).format('YYYY-MM-DD HH:mm:ss.SSSSZZ')
+        assert _parse_datetime(value) == arrow.get(value).datetime
+
+
+class _RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(statement)
+
+
+@pytest.mark.parametrize('native_merge', [True, False])
+def test_merge_temp_table__mixed_case_key(native_merge):
+    target = _serialize_target()
+    target.native_merge = native_merge
+    remote_schema = {'name': 'cats',
+                     'path': ('cats',),
+                     'key_properties': ['Id'],
+                     'mappings': {'id': {'type': ['integer'], 'from': ['Id']},
+                                  'name': {'type': ['string', 'null'], 'from': ['Name']}}}
+    cur = _RecordingCursor()
+
+    RedshiftTarget._merge_temp_table(target, cur, remote_schema, 'tmp_cats', ['id', 'name', '_sdc_sequence'])
+
+    ## Rows are matched, and left alone, by the key's column, not by the stream's name for the key
+    [statement] = cur.statements
+    assert "Identifier('id')" in repr(statement)
+    assert "Identifier('Id')" not in repr(statement)
+    if native_merge:
+        assert 'Composed([Identifier(\'name\'), SQL(\' = "dedupped".\'), Identifier(\'name\')])' in repr(statement)
+        assert 'Composed([Identifier(\'id\'), SQL(\' = "dedupped".\')' not in repr(statement)
+
+
+@pytest.mark.parametrize('dependent_views, rebuilt', [([], True), ([('public', 'cats_view')], False)])
+def test_add_pending_columns__dependent_views(dependent_views, rebuilt):
+    target = _serialize_target()
+    target.rebuild_table_column_threshold = 2
+    target.compression_encodings = True
+    target.schema_cache = SchemaCacheTransaction(SchemaCache())
+    target._pending_columns = {'cats': {'name': 'varchar(32)', 'age': 'bigint'}}
+    rebuilds = []
+    target._rebuild_table = lambda cur, table_name, columns: rebuilds.append(table_name)
+    cur = _RecordingCursor()
+    cur.fetchall = lambda: dependent_views
+
+    RedshiftTarget._add_pending_columns(target, cur, 'cats')
+
+    ## Dropping the table would drop the views too, so its columns are added in place
+    assert rebuilds == (['cats'] if rebuilt else [])
+    assert len(cur.statements) == (1 if rebuilt else 3)
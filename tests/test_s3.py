@@ -1,10 +1,13 @@
+import gzip
 import json
 import os
+import tempfile
+import threading
 
 import pytest
 
 from fixtures import CONFIG
-from target_redshift.s3 import S3
+from target_redshift.s3 import S3, StagedObjectCleaner, _EncodeBinaryReadable
 
 
 class Readable:
@@ -30,6 +33,19 @@ class DownloadableS3(S3):
         os.remove(key)
         return original
 
+    def download_manifest(self, key):
+        manifest = json.loads(self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read())
+
+        parts = []
+        for entry in manifest['entries']:
+            part_key = entry['url'][len('s3://{}/'.format(self.bucket)):]
+            body = self.client.get_object(Bucket=self.bucket, Key=part_key)['Body'].read()
+            if part_key.endswith('.gz'):
+                body = gzip.decompress(body)
+            parts.append([json.loads(line) for line in body.decode('utf-8').splitlines()])
+
+        return parts
+
 
 def downloadableS3():
     return DownloadableS3(CONFIG['target_s3']['aws_access_key_id'],
@@ -56,3 +72,203 @@ def test_persist__empty():
     result = s3.download(key)
 
     assert [] == result
+
+
+def test_encode_binary_readable__honors_max_bytes():
+    to_persist = []
+    for i in range(100):
+        to_persist.append({'a': 123, 'b': 'cdéf', 'g': i})
+
+    expected = ''.join(json.dumps(x) + '\n' for x in to_persist).encode('utf-8')
+
+    readable = _EncodeBinaryReadable(Readable(to_persist))
+    chunks = []
+    while True:
+        chunk = readable.read(7)
+        if not chunk:
+            break
+        assert len(chunk) <= 7
+        chunks.append(chunk)
+
+    assert b''.join(chunks) == expected
+    assert all(len(chunk) == 7 for chunk in chunks[:-1])
+
+
+def test_encode_binary_readable__read_all():
+    to_persist = [{'a': i} for i in range(10)]
+
+    expected = ''.join(json.dumps(x) + '\n' for x in to_persist).encode('utf-8')
+
+    assert _EncodeBinaryReadable(Readable(to_persist)).read() == expected
+    assert _EncodeBinaryReadable(Readable([])).read() == b''
+
+
+def test_encode_binary_readable__threaded_reads():
+    to_persist = [{'a': i} for i in range(1000)]
+
+    expected = ''.join(json.dumps(x) + '\n' for x in to_persist).encode('utf-8')
+
+    readable = _EncodeBinaryReadable(Readable(to_persist))
+    chunks = []
+
+    def read_all():
+        while True:
+            chunk = readable.read(13)
+            if not chunk:
+                return
+            chunks.append(chunk)
+
+    threads = [threading.Thread(target=read_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(len(chunk) for chunk in chunks) == len(expected)
+
+
+def test_persist__transfer_config():
+    s3 = DownloadableS3(CONFIG['target_s3']['aws_access_key_id'],
+                        CONFIG['target_s3']['aws_secret_access_key'],
+                        CONFIG['target_s3']['bucket'],
+                        CONFIG['target_s3']['key_prefix'],
+                        multipart_threshold=5 * 1024 * 1024,
+                        multipart_chunksize=5 * 1024 * 1024,
+                        max_concurrency=4)
+
+    to_persist = []
+    for i in range(200000):
+        to_persist.append({'a': 123, 'b': 'cdef', 'g': i})
+
+    bucket, key = s3.persist(Readable(to_persist))
+    result = s3.download(key)
+
+    assert to_persist == result
+
+
+def test_persist_parts():
+    to_persist = []
+    for i in range(100):
+        to_persist.append({'a': 123, 'b': 'cdef', 'g': i})
+
+    s3 = downloadableS3()
+    bucket, key = s3.persist_parts(Readable(to_persist), part_count=4)
+    parts = s3.download_manifest(key)
+
+    assert len(parts) == 4
+    assert [len(part) for part in parts] == [25, 25, 25, 25]
+    assert sorted(sum(parts, []), key=lambda x: x['g']) == to_persist
+
+
+def test_persist_parts__gzip():
+    to_persist = []
+    for i in range(10):
+        to_persist.append({'a': 123, 'b': 'cdef', 'g': i})
+
+    s3 = downloadableS3()
+    bucket, key = s3.persist_parts(Readable(to_persist), part_count=16, compression='gzip')
+    parts = s3.download_manifest(key)
+
+    assert len(parts) == 10
+    assert sorted(sum(parts, []), key=lambda x: x['g']) == to_persist
+
+
+def test_persist_parts__empty():
+    s3 = downloadableS3()
+    bucket, key = s3.persist_parts(Readable([]), part_count=4, compression='gzip')
+
+    assert [[]] == s3.download_manifest(key)
+
+
+def test_persist_files():
+    s3 = downloadableS3()
+
+    files = []
+    for i in range(3):
+        f = tempfile.TemporaryFile()
+        f.write((json.dumps({'g': i}) + '\n').encode('utf-8'))
+        files.append(f)
+
+    bucket, key = s3.persist_files(files, extension='.json')
+    manifest = json.loads(s3.client.get_object(Bucket=bucket, Key=key)['Body'].read())
+
+    assert [entry['url'].endswith('.json') for entry in manifest['entries']] == [True, True, True]
+    assert [entry['meta']['content_length'] for entry in manifest['entries']] == [9, 9, 9]
+    assert s3.download_manifest(key) == [[{'g': 0}], [{'g': 1}], [{'g': 2}]]
+
+
+def _exists(s3, key):
+    return s3.client.list_objects_v2(Bucket=s3.bucket, Prefix=key).get('KeyCount', 0) > 0
+
+
+def test_staged_keys():
+    s3 = downloadableS3()
+    bucket, key = s3.persist_parts(Readable([{'g': i} for i in range(10)]), part_count=2)
+
+    keys = s3.staged_keys(key)
+    assert len(keys) == 3
+    assert keys[-1] == key
+    assert s3.staged_keys(key) == [key]
+
+
+def test_staged_object_cleaner():
+    s3 = downloadableS3()
+    bucket, key = s3.persist_parts(Readable([{'g': i} for i in range(10)]), part_count=2)
+    keys = s3.staged_keys(key)
+
+    cleaner = StagedObjectCleaner(s3)
+    cleaner.delete(keys)
+    cleaner.close()
+
+    assert [_exists(s3, k) for k in keys] == [False, False, False]
+
+
+def test_staged_object_cleaner__sweep():
+    s3 = downloadableS3()
+    ## Sweeping requires a `key_prefix`, and only touches objects under it
+    s3.key_prefix += 'sweep-'
+    bucket, key = s3.persist(Readable([{'g': 1}]))
+
+    cleaner = StagedObjectCleaner(s3)
+    cleaner.sweep(3600)
+    cleaner.close()
+    assert _exists(s3, key)
+
+    cleaner = StagedObjectCleaner(s3)
+    cleaner.sweep(-60)
+    cleaner.close()
+    assert not _exists(s3, key)
+
+
+def test_staged_object_cleaner__sweep_without_key_prefix():
+    s3 = downloadableS3()
+    bucket, key = s3.persist(Readable([{'g': 1}]))
+    s3.key_prefix = ''
+
+    cleaner = StagedObjectCleaner(s3)
+    with pytest.raises(ValueError, match='key_prefix'):
+        cleaner.sweep(-60)
+    cleaner.close()
+    assert _exists(s3, key)
+
+
+class RecordingClient:
+    def __init__(self):
+        self.requests = []
+
+    def delete_objects(self, Bucket, Delete):
+        self.requests.append([obj['Key'] for obj in Delete['Objects']])
+        return {}
+
+
+def test_staged_object_cleaner__batches_deletes():
+    s3 = downloadableS3()
+    s3.client = RecordingClient()
+
+    cleaner = StagedObjectCleaner(s3)
+    for i in range(25):
+        cleaner.delete(['{}-{}'.format(i, j) for j in range(100)])
+    cleaner.close()
+
+    assert all(len(request) <= 1000 for request in s3.client.requests)
+    assert sorted(sum(s3.client.requests, [])) == sorted('{}-{}'.format(i, j) for i in range(25) for j in range(100))
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from target_redshift.scheduler import FlushScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _add(scheduler, streams, stream, size):
+    stream_buffer = streams.setdefault(stream, SimpleNamespace(count=0, buffer_full=False))
+    stream_buffer.count += 1
+    scheduler.record_added(stream, size, stream_buffer.count)
+
+
+def test_flush_scheduler__buffer_full():
+    scheduler = FlushScheduler()
+    streams = {'cats': SimpleNamespace(count=1, buffer_full=True),
+               'dogs': SimpleNamespace(count=1, buffer_full=False)}
+
+    assert scheduler.streams_to_flush(streams) == ['cats']
+
+
+def test_flush_scheduler__max_total_buffer_size():
+    scheduler = FlushScheduler(max_total_buffer_size=1000)
+    streams = {}
+    for _ in range(3):
+        _add(scheduler, streams, 'cats', 100)
+    for _ in range(6):
+        _add(scheduler, streams, 'dogs', 100)
+
+    assert scheduler.streams_to_flush(streams) == []
+
+    for _ in range(3):
+        _add(scheduler, streams, 'birds', 100)
+
+    ## Largest first, until back under budget
+    assert scheduler.streams_to_flush(streams) == ['dogs']
+
+    ## Flushed buffers start counting again
+    streams['dogs'].count = 0
+    _add(scheduler, streams, 'dogs', 100)
+    assert scheduler.streams_to_flush(streams) == []
+
+
+def test_flush_scheduler__max_batch_latency_seconds():
+    clock = Clock()
+    scheduler = FlushScheduler(max_batch_latency_seconds=60, clock=clock)
+    streams = {}
+
+    _add(scheduler, streams, 'cats', 100)
+    clock.now = 30
+    _add(scheduler, streams, 'dogs', 100)
+    _add(scheduler, streams, 'cats', 100)
+
+    assert scheduler.streams_to_flush(streams) == []
+
+    clock.now = 100
+    assert scheduler.streams_to_flush(streams) == ['cats', 'dogs']
+
+    streams['dogs'].count = 0
+    assert scheduler.streams_to_flush(streams) == ['cats']
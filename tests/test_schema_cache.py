@@ -0,0 +1,127 @@
+from target_redshift.schema_cache import SchemaCache, SchemaCacheTransaction
+
+
+def test_schema_cache__miss_then_hit():
+    cache = SchemaCache()
+
+    assert cache.get_table_schema('cats') == (False, None)
+
+    cache.set_table_schema('cats', {'name': 'cats', 'schema': {'properties': {}}})
+
+    assert cache.get_table_schema('cats') == (True, {'name': 'cats', 'schema': {'properties': {}}})
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_schema_cache__caches_missing_tables():
+    cache = SchemaCache()
+    cache.set_metadata('cats', None)
+
+    assert cache.get_metadata('cats') == (True, None)
+
+
+def test_schema_cache__values_are_shared():
+    cache = SchemaCache()
+    table_schema = {'name': 'cats', 'schema': {'properties': {}}}
+    cache.set_table_schema('cats', table_schema)
+
+    assert cache.get_table_schema('cats')[1] is table_schema
+
+
+def test_schema_cache__invalidate_table_schema():
+    cache = SchemaCache()
+    cache.set_table_schema('cats', {'name': 'cats'})
+    cache.set_metadata('cats', {'version': 1})
+
+    cache.invalidate_table_schema('cats')
+
+    assert cache.get_table_schema('cats') == (False, None)
+    assert cache.get_metadata('cats') == (True, {'version': 1})
+
+
+def test_schema_cache__clear():
+    cache = SchemaCache()
+    cache.set_table_mappings({('cats',): 'cats'})
+    cache.set_table_schema('cats', {'name': 'cats'})
+    cache.set_non_empty('cats')
+
+    assert cache.get_table_mappings() == {('cats',): 'cats'}
+    assert cache.is_non_empty('cats')
+
+    cache.clear()
+
+    assert cache.get_table_mappings() is None
+    assert cache.get_table_schema('cats') == (False, None)
+    assert not cache.is_non_empty('cats')
+
+
+def test_schema_cache__invalidate_table_schema__varchar_lengths():
+    cache = SchemaCache()
+    cache.set_varchar_lengths('cats', {'name': 32})
+
+    assert cache.get_varchar_lengths('cats') == (True, {'name': 32})
+
+    cache.invalidate_table_schema('cats')
+
+    assert cache.get_varchar_lengths('cats') == (False, None)
+
+
+def test_schema_cache__table_mappings_are_copied():
+    cache = SchemaCache()
+    table_mappings = {('cats',): 'cats'}
+    cache.set_table_mappings(table_mappings)
+    table_mappings[('dogs',)] = 'dogs'
+
+    first = cache.get_table_mappings()
+    first[('birds',)] = 'birds'
+    assert cache.get_table_mappings() == {('cats',): 'cats'}
+
+    cache.add_table_mapping(('cats', 'kittens'), 'cats__kittens')
+    assert first == {('cats',): 'cats', ('birds',): 'birds'}
+    assert cache.get_table_mappings() == {('cats',): 'cats', ('cats', 'kittens'): 'cats__kittens'}
+
+
+def test_schema_cache_transaction__published_on_commit():
+    cache = SchemaCache()
+    cache.set_table_mappings({('cats',): 'cats'})
+    cache.set_table_schema('cats', {'name': 'cats'})
+    transaction = SchemaCacheTransaction(cache)
+
+    transaction.add_table_mapping(('dogs',), 'dogs')
+    transaction.set_table_schema('dogs', {'name': 'dogs'})
+    transaction.set_non_empty('dogs')
+    transaction.invalidate_table_schema('cats')
+
+    ## The transaction sees its own writes, while others sharing the cache do not
+    assert transaction.get_table_mappings() == {('cats',): 'cats', ('dogs',): 'dogs'}
+    assert transaction.get_table_schema('dogs') == (True, {'name': 'dogs'})
+    assert transaction.get_table_schema('cats') == (False, None)
+    assert transaction.is_non_empty('dogs')
+    assert cache.get_table_mappings() == {('cats',): 'cats'}
+    assert cache.get_table_schema('dogs') == (False, None)
+    assert cache.get_table_schema('cats') == (True, {'name': 'cats'})
+    assert not cache.is_non_empty('dogs')
+
+    transaction.commit()
+
+    assert cache.get_table_mappings() == {('cats',): 'cats', ('dogs',): 'dogs'}
+    assert cache.get_table_schema('dogs') == (True, {'name': 'dogs'})
+    assert cache.get_table_schema('cats') == (False, None)
+    assert cache.is_non_empty('dogs')
+
+
+def test_schema_cache_transaction__discarded_on_rollback():
+    cache = SchemaCache()
+    cache.set_table_schema('cats', {'name': 'cats'})
+    transaction = SchemaCacheTransaction(cache)
+
+    transaction.set_metadata('dogs', {'version': 1})
+    transaction.invalidate_table_schema('cats')
+    transaction.clear()
+    assert transaction.get_table_schema('cats') == (False, None)
+
+    transaction.rollback()
+
+    assert transaction.get_metadata('dogs') == (False, None)
+    assert transaction.get_table_schema('cats') == (True, {'name': 'cats'})
+    assert cache.get_metadata('dogs') == (False, None)
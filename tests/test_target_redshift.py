@@ -1,5 +1,7 @@
 from copy import deepcopy
 from datetime import datetime
+from itertools import chain, zip_longest
+import json
 
 import psycopg2
 from psycopg2 import sql
@@ -10,7 +12,7 @@ from fixtures import CatStream, CONFIG, db_prep, MultiTypeStream, NestedStream,
 from target_postgres import singer_stream
 from target_postgres.target_tools import TargetError
 
-from target_redshift import main
+from target_redshift import drop_placeholder_columns, main
 
 
 def assert_columns_equal(cursor, table_name, expected_column_tuples):
@@ -22,10 +24,6 @@ def assert_columns_equal(cursor, table_name, expected_column_tuples):
         sql.Literal(table_name)))
     columns = cursor.fetchall()
 
-    expected_column_tuples.add(
-        ('_sdc_target_redshift_create_table_placeholder', 'boolean', 'YES')
-    )
-
     assert set(columns) == expected_column_tuples
 
 
@@ -711,3 +709,410 @@ def test_deduplication_existing_new_rows(db_prep):
 
     assert len(sequences) == 1
     assert sequences[0][0] == original_sequence
+
+
+def test_loading__staging_files__gzip(db_prep):
+    config = deepcopy(CONFIG)
+    config['staging_file_count'] = 4
+    config['staging_compression'] = 'gzip'
+
+    stream = CatStream(100, nested_count=3)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 300
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__staging_files__auto(db_prep):
+    config = deepcopy(CONFIG)
+    config['staging_file_count'] = 'auto'
+
+    stream = CatStream(100)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__staging_files__invalid_configuration(db_prep):
+    config = deepcopy(CONFIG)
+    config['staging_compression'] = 'bzip2'
+
+    with pytest.raises(Exception, match=r'.*staging_compression.*'):
+        main(config, input_stream=CatStream(1))
+
+
+def test_loading__pipelined_batches(db_prep):
+    config = deepcopy(CONFIG)
+    config['max_pending_batches'] = 2
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(100, nested_count=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__pipelined_batches__full_table_replication(db_prep):
+    config = deepcopy(CONFIG)
+    config['max_pending_batches'] = 2
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(110, version=0, nested_count=3)
+    main(config, input_stream=stream)
+
+    stream = CatStream(100, version=1, nested_count=3)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 300
+        assert_records(conn, stream.records, 'cats', 'id', match_pks=True)
+
+
+def test_loading__pipelined_batches__state_emitted_after_commit(db_prep, capsys):
+    config = deepcopy(CONFIG)
+    config['max_pending_batches'] = 2
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(50)
+    lines = list(stream)
+    lines.append(json.dumps({'type': 'STATE', 'value': {'bookmark': 50}}))
+
+    main(config, input_stream=iter(lines))
+
+    assert json.loads(capsys.readouterr().out.strip().splitlines()[-1]) == {'bookmark': 50}
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 50
+
+
+def test_loading__parallel_streams(db_prep):
+    config = deepcopy(CONFIG)
+    config['max_parallel_streams'] = 2
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    cat_stream = CatStream(100, nested_count=2)
+    nested_stream = NestedStream(10)
+    lines = [line for line in chain.from_iterable(zip_longest(cat_stream, nested_stream)) if line is not None]
+
+    main(config, input_stream=iter(lines))
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('root'))
+            assert cur.fetchone()[0] == 10
+            cur.execute(get_count_sql('root__array_scalar'))
+            assert cur.fetchone()[0] == 50
+        assert_records(conn, cat_stream.records, 'cats', 'id')
+
+
+def test_upsert__native_merge(db_prep):
+    config = deepcopy(CONFIG)
+    config['native_merge'] = True
+
+    stream = CatStream(100, nested_count=2)
+    main(config, input_stream=stream)
+
+    stream = CatStream(200, nested_count=1)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 200
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__no_key_properties__append(db_prep):
+    stream = CatStream(100, nested_count=2)
+    stream.schema = deepcopy(stream.schema)
+    stream.schema['key_properties'] = []
+    main(CONFIG, input_stream=stream)
+
+    stream = CatStream(50, nested_count=2)
+    stream.schema = deepcopy(stream.schema)
+    stream.schema['key_properties'] = []
+    main(CONFIG, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 150
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 300
+
+
+def test_full_table_replication__multiple_batches(db_prep):
+    config = deepcopy(CONFIG)
+    config['max_batch_rows'] = 20
+    config['batch_detection_threshold'] = 5
+
+    stream = CatStream(110, version=0, nested_count=3, duplicates=5)
+    main(config, input_stream=stream)
+
+    stream = CatStream(100, version=1, nested_count=2, duplicates=5)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 200
+
+
+def test_loading__staging_format__parquet(db_prep):
+    pytest.importorskip('pyarrow')
+
+    config = deepcopy(CONFIG)
+    config['staging_format'] = 'parquet'
+    config['staging_file_count'] = 2
+
+    stream = CatStream(100, nested_count=3)
+    main(config, input_stream=stream)
+
+    stream = CatStream(150, nested_count=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 150
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 300
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__staging_format__parquet_invalid_configuration(db_prep):
+    config = deepcopy(CONFIG)
+    config['staging_format'] = 'parquet'
+    config['staging_compression'] = 'gzip'
+
+    with pytest.raises(Exception, match=r'.*staging_compression.*'):
+        main(config, input_stream=CatStream(1))
+
+
+def test_loading__insert_small_batches(db_prep):
+    config = deepcopy(CONFIG)
+    config['insert_batch_max_rows'] = 1000
+
+    stream = CatStream(100, nested_count=3)
+    main(config, input_stream=stream)
+
+    stream = CatStream(150, nested_count=2)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 150
+            cur.execute(get_count_sql('cats__adoption__immunizations'))
+            assert cur.fetchone()[0] == 300
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def get_varchar_length(cur, table_name, column_name):
+    cur.execute(sql.SQL(
+        "SELECT character_maximum_length FROM information_schema.columns " + \
+        "WHERE table_schema = {} and table_name = {} and column_name = {};"
+    ).format(
+        sql.Literal(CONFIG['redshift_schema']),
+        sql.Literal(table_name),
+        sql.Literal(column_name)))
+    return cur.fetchone()[0]
+
+
+class LongNameCatStream(CatStream):
+    def generate_record(self):
+        record = CatStream.generate_record(self)
+        record['name'] = record['name'] * 200
+        return record
+
+
+def test_loading__varchar_sizing__observed(db_prep):
+    stream = CatStream(100)
+    main(CONFIG, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert get_varchar_length(cur, 'cats', 'name') in (32, 64)
+
+    stream = LongNameCatStream(100)
+    main(CONFIG, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert get_varchar_length(cur, 'cats', 'name') >= max(len(r['name']) for r in stream.records)
+            cur.execute(get_count_sql('cats'))
+            assert cur.fetchone()[0] == 100
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__varchar_sizing__fixed(db_prep):
+    config = deepcopy(CONFIG)
+    config['varchar_sizing'] = 'fixed'
+
+    stream = CatStream(100)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert get_varchar_length(cur, 'cats', 'name') == 1000
+
+
+def get_table_info(cur, table_name):
+    cur.execute(sql.SQL(
+        'SELECT diststyle, sortkey1 FROM svv_table_info WHERE "schema" = {} and "table" = {};'
+    ).format(
+        sql.Literal(CONFIG['redshift_schema']),
+        sql.Literal(table_name)))
+    return cur.fetchone()
+
+
+def test_loading__table_attributes(db_prep):
+    stream = CatStream(100, nested_count=2)
+    main(CONFIG, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert get_table_info(cur, 'cats') == ('KEY(id)', '_sdc_received_at')
+            assert get_table_info(cur, 'cats__adoption__immunizations') \
+                   == ('KEY(_sdc_source_key_id)', '_sdc_sequence')
+
+
+def test_loading__table_attributes__table_options(db_prep):
+    config = deepcopy(CONFIG)
+    config['table_options'] = {'cats': {'diststyle': 'even', 'sortkey': ['age', 'id']}}
+
+    stream = CatStream(100)
+    main(config, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert get_table_info(cur, 'cats') == ('EVEN', 'age')
+        assert_records(conn, stream.records, 'cats', 'id')
+
+
+def test_loading__table_attributes__invalid_configuration(db_prep):
+    config = deepcopy(CONFIG)
+    config['table_options'] = {'cats': {'diststyle': 'sideways'}}
+
+    with pytest.raises(Exception, match=r'.*diststyle.*'):
+        main(config, input_stream=CatStream(1))
+
+
+def test_loading__new_columns__rebuild_table(db_prep):
+    config = deepcopy(CONFIG)
+    config['rebuild_table_column_threshold'] = 2
+
+    cat_count = 50
+    main(config, input_stream=CatStream(cat_count))
+
+    class NewColumnsStream(CatStream):
+        def generate_record(self):
+            record = CatStream.generate_record(self)
+            record['id'] = record['id'] + cat_count
+            record['paw_toe_count'] = 5
+            record['whisker_count'] = 24
+            return record
+
+    new_columns_stream = NewColumnsStream(cat_count)
+    new_columns_stream.schema = deepcopy(new_columns_stream.schema)
+    new_columns_stream.schema['schema']['properties']['paw_toe_count'] = {'type': 'integer'}
+    new_columns_stream.schema['schema']['properties']['whisker_count'] = {'type': 'integer'}
+
+    main(config, input_stream=new_columns_stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            ## The rebuilt table keeps its attributes and metadata
+            assert get_table_info(cur, 'cats') == ('KEY(id)', '_sdc_received_at')
+
+            cur.execute(sql.SQL('SELECT {}, {}, {} FROM {}.{}').format(
+                sql.Identifier('id'),
+                sql.Identifier('paw_toe_count'),
+                sql.Identifier('whisker_count'),
+                sql.Identifier(CONFIG['redshift_schema']),
+                sql.Identifier('cats')
+            ))
+
+            persisted_records = cur.fetchall()
+
+            assert 2 * cat_count == len(persisted_records)
+            assert cat_count == len([x for x in persisted_records if x[1] is None and x[2] is None])
+            assert cat_count == len([x for x in persisted_records if x[1] == 5 and x[2] == 24])
+
+    ## Loading again finds the rebuilt table's mappings
+    reloaded_stream = NewColumnsStream(cat_count)
+    reloaded_stream.schema = new_columns_stream.schema
+    main(config, input_stream=reloaded_stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        assert_records(conn, reloaded_stream.records, 'cats', 'id')
+
+
+def test_drop_placeholder_columns(db_prep):
+    stream = CatStream(100)
+    main(CONFIG, input_stream=stream)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            ## As created by earlier versions of the target
+            cur.execute(sql.SQL('ALTER TABLE {}.{} ADD COLUMN {} BOOLEAN;').format(
+                sql.Identifier(CONFIG['redshift_schema']),
+                sql.Identifier('cats'),
+                sql.Identifier('_sdc_target_redshift_create_table_placeholder')))
+
+    drop_placeholder_columns(CONFIG)
+
+    with psycopg2.connect(**TEST_DB) as conn:
+        with conn.cursor() as cur:
+            assert_columns_equal(cur,
+                                 'cats',
+                                 {
+                                     ('_sdc_batched_at', 'timestamp with time zone', 'YES'),
+                                     ('_sdc_received_at', 'timestamp with time zone', 'YES'),
+                                     ('_sdc_sequence', 'bigint', 'YES'),
+                                     ('_sdc_table_version', 'bigint', 'YES'),
+                                     ('adoption__adopted_on', 'timestamp with time zone', 'YES'),
+                                     ('adoption__was_foster', 'boolean', 'YES'),
+                                     ('age', 'bigint', 'YES'),
+                                     ('id', 'bigint', 'YES'),
+                                     ('name', 'character varying', 'YES'),
+                                     ('paw_size', 'bigint', 'YES'),
+                                     ('paw_colour', 'character varying', 'YES'),
+                                     ('flea_check_complete', 'boolean', 'YES'),
+                                     ('pattern', 'character varying', 'YES')
+                                 })
+
+        assert_records(conn, stream.records, 'cats', 'id')
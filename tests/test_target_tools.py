@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+
+from target_redshift.stream_tracker import ScheduledStreamTracker
+from target_redshift.target_tools import _line_handler, read_lines
+from target_redshift.validators import ValidatorCache
+
+
+def test_read_lines():
+    lines = [b'{"type": "STATE", "value": {}}\n',
+             b'{"long": "' + b'x' * 50 + b'"}\r\n',
+             b'\n',
+             b'{"multibyte": "\xf0\x9f\x90\xb1"}\n',
+             b'{"last": "without a line ending"}']
+
+    for chunk_size in [1, 3, 16, 1024]:
+        assert list(read_lines(io.BufferedReader(io.BytesIO(b''.join(lines))), chunk_size=chunk_size)) == lines
+
+    assert list(read_lines(io.BufferedReader(io.BytesIO(b'')))) == []
+
+
+def test_line_handler__repeated_schema():
+    state_tracker = ScheduledStreamTracker(None, False)
+    validator_cache = ValidatorCache()
+
+    def handle(message):
+        _line_handler(state_tracker, None, True, 0, 100, 1000, json.dumps(message), validator_cache=validator_cache)
+
+    schema = {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+    handle({'type': 'SCHEMA', 'stream': 'cats', 'schema': schema, 'key_properties': ['id']})
+    handle({'type': 'RECORD', 'stream': 'cats', 'record': {'id': 1}})
+
+    stream_buffer = state_tracker.streams['cats']
+    stream_schema = stream_buffer.schema
+    validator = stream_buffer.validator
+
+    handle({'type': 'SCHEMA', 'stream': 'cats', 'schema': schema, 'key_properties': ['id']})
+    assert stream_buffer.schema is stream_schema
+    assert stream_buffer.validator is validator
+    assert stream_buffer.count == 1
+
+    ## Streams with the same schema share its validator
+    handle({'type': 'SCHEMA', 'stream': 'dogs', 'schema': schema, 'key_properties': ['id']})
+    assert state_tracker.streams['dogs'].validator is validator
+
+    handle({'type': 'SCHEMA', 'stream': 'cats', 'schema': schema, 'key_properties': []})
+    assert stream_buffer.key_properties == ['_sdc_primary_key']
+
+    schema = {'type': 'object', 'properties': {'id': {'type': 'integer'}, 'name': {'type': 'string'}}}
+    handle({'type': 'SCHEMA', 'stream': 'cats', 'schema': schema, 'key_properties': []})
+    assert 'name' in stream_buffer.schema['properties']
+    assert stream_buffer.validator is not validator
+
+
+def test_line_handler__unparseable_line(caplog):
+    state_tracker = ScheduledStreamTracker(None, False)
+
+    ## Not UTF-8, so not even JSON
+    with pytest.raises(UnicodeDecodeError):
+        _line_handler(state_tracker, None, True, 0, 100, 1000, b'{"type": "STATE", "value": "\xff"}\n')
+
+    assert 'Unable to parse JSON' in caplog.text
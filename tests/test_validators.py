@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from target_redshift.validators import schema_fingerprint, ValidatorCache
+
+SCHEMA = {'type': 'object', 'properties': {'id': {'type': 'integer'}}}
+
+
+def test_schema_fingerprint():
+    assert schema_fingerprint(SCHEMA) == schema_fingerprint({'properties': {'id': {'type': 'integer'}},
+                                                             'type': 'object'})
+
+    fingerprints = {schema_fingerprint({'type': 'number', 'multipleOf': value})
+                    for value in [1, Decimal('1.0'), True, '1', [1]]}
+    assert len(fingerprints) == 5
+
+
+def test_validator_cache():
+    cache = ValidatorCache(max_size=2)
+
+    compiled = cache.get(SCHEMA)
+    assert cache.get({'type': 'object', 'properties': {'id': {'type': 'integer'}}}) is compiled
+    assert compiled.validator is compiled.validator
+    assert compiled.validation_errors == []
+
+    invalid = cache.get({'type': 'object', 'properties': {'id': {'type': 'no-such-type'}}})
+    assert invalid.validation_errors
+
+    ## Least recently used first
+    cache.get(SCHEMA)
+    cache.get({'type': 'string'})
+    assert cache.get(SCHEMA) is compiled
+    assert cache.get({'type': 'object', 'properties': {'id': {'type': 'no-such-type'}}}) is not invalid
+
+
+def test_validator_cache__is_current():
+    cache = ValidatorCache()
+    compiled = cache.get(SCHEMA)
+
+    assert not cache.is_current('cats', compiled, ['id'])
+
+    key_properties = ['id']
+    cache.set_current('cats', compiled, key_properties)
+    key_properties.append('name')
+
+    assert cache.is_current('cats', cache.get(dict(SCHEMA)), ['id'])
+    assert not cache.is_current('cats', compiled, ['id', 'name'])
+    assert not cache.is_current('cats', cache.get({'type': 'object', 'properties': {}}), ['id'])
+    assert not cache.is_current('dogs', compiled, ['id'])